@@ -0,0 +1,215 @@
+import os
+import json
+import math
+import random
+import argparse
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DISEASES_PATH = os.path.join(REPO_DIR, "data", "reference", "diseases.json")
+
+ROUTES = ["ORAL", "TOPICAL", "INTRAVENOUS", "SUBCUTANEOUS", "INTRAMUSCULAR", "OPHTHALMIC", "NASAL", "TRANSDERMAL"]
+DOSAGE_FORMS = ["TABLET", "CAPSULE", "TABLET, FILM COATED", "INJECTION, SOLUTION", "CREAM", "SOLUTION", "SPRAY",
+                "SUSPENSION", "OINTMENT", "PATCH"]
+PRODUCT_TYPES = ["HUMAN PRESCRIPTION DRUG", "HUMAN OTC DRUG"]
+PHARM_CLASSES = ["Angiotensin Converting Enzyme Inhibitor [EPC]", "HMG-CoA Reductase Inhibitor [EPC]",
+                 "Corticosteroid [EPC]", "Beta Adrenergic Blocker [EPC]", "Proton Pump Inhibitor [EPC]",
+                 "Nonsteroidal Anti-inflammatory Drug [EPC]", "Biguanide [EPC]", "Antihistamine [EPC]"]
+SYLLABLES = ["al", "bra", "cor", "dex", "er", "fen", "gli", "hy", "ix", "lo", "max", "nor", "ol", "pra", "quin",
+             "ro", "sta", "tri", "vas", "xa", "zol", "mab", "pril", "sar", "tan", "vir", "cin", "dine"]
+
+FILLER_SENTENCES = [
+    "Treatment should be initiated and supervised by a physician experienced in the management of this condition.",
+    "The safety and effectiveness in pediatric patients have been established for the approved age groups.",
+    "It may be used alone or in combination with other agents.",
+    "Use should be guided by clinical response and tolerability.",
+    "Therapy should be individualized according to patient response.",
+    "It is indicated as an adjunct to diet and exercise.",
+    "Efficacy was demonstrated in randomized, double-blind, placebo-controlled trials.",
+]
+CAUTION_SENTENCES = [
+    "Limitations of Use: not recommended for the treatment of {disease}.",
+    "Safety and effectiveness have not been established in patients with {disease}; use is not recommended.",
+    "Contraindicated in patients with a history of {disease}.",
+]
+MENTION_KEY_ORDER = ["spl_id", "product_ndc", "brand_name", "generic_name", "disease_mentions", "route", "dosage_form",
+                     "labeler_name", "product_type"]
+
+
+def _uppercase(obj):
+    if isinstance(obj, str):
+        return obj.upper()
+    if isinstance(obj, list):
+        return [_uppercase(v) for v in obj]
+    if isinstance(obj, dict):
+        return {k: _uppercase(v) for k, v in obj.items()}
+    return obj
+
+
+def load_disease_names(path=DISEASES_PATH):
+    with open(path, "r") as f:
+        disease_dict = json.load(f)
+    return [(category, name) for category, diseases in disease_dict.items() for name in diseases]
+
+
+def zipf_weights(n, exponent):
+    return [1.0 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def make_name(rng, min_syllables=2, max_syllables=4):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(min_syllables, max_syllables))).capitalize()
+
+
+def indication_text(rng, brand, indications, cautions):
+    """
+    Indication text of realistic length: lognormal, median around 600 characters with a long
+    tail into the thousands, as in openFDA `indications_and_usage` sections.
+    """
+    target_length = min(8000, max(80, int(rng.lognormvariate(math.log(600), 0.8))))
+    parts = [f"{brand} is indicated for the treatment of " + ", ".join(indications[:-1])
+             + (" and " if len(indications) > 1 else "") + indications[-1] + " in adults."]
+    for disease in indications[1:]:
+        parts.append(f"{brand} is also indicated to reduce the risk of complications associated with {disease}.")
+    length = sum(len(p) for p in parts)
+    while length < target_length:
+        sentence = rng.choice(FILLER_SENTENCES)
+        parts.append(sentence)
+        length += len(sentence) + 1
+    for disease in cautions:
+        parts.append(rng.choice(CAUTION_SENTENCES).format(disease=disease.lower()))
+    return " ".join(parts)
+
+
+def generate_dataset(out_dir, n_products, seed=0, disease_skew=1.1, brand_skew=1.2, diseases_path=DISEASES_PATH):
+    """
+    Write a deterministic synthetic dataset shaped like the pipeline's intermediate files.
+
+    Files written to `out_dir`:
+        ndc_extracted.jsonl: one NDC record per product (as extract_drug_info.NDCExtractor writes).
+        label_extracted.jsonl: one label per product (as extract_drug_info.LabelExtractor writes).
+        label_extracted_with_diseases.jsonl: products with disease mentions (as
+            extract_diseases_from_labels writes), the input of build_drug_graph.
+
+    Args:
+        out_dir (str): Output directory.
+        n_products (int): Number of products (NDCs); openFDA scale is 10k to 1M.
+        seed (int): Random seed; the same seed and size always produce identical files.
+        disease_skew (float): Zipf exponent of disease popularity (a few diseases dominate).
+        brand_skew (float): Zipf exponent of products per brand.
+
+    Returns:
+        dict: {name: path} of the written files.
+    """
+    rng = random.Random(seed)
+    diseases = load_disease_names(diseases_path)
+    rng.shuffle(diseases)
+    disease_weights = zipf_weights(len(diseases), disease_skew)
+    disease_cum = list(_cumulative(disease_weights))
+
+    n_brands = max(1, n_products // 4)
+    brand_cum = list(_cumulative(zipf_weights(n_brands, brand_skew)))
+    brands = [make_name(rng) for _ in range(n_brands)]
+    generics = [make_name(rng, 3, 5).lower() for _ in range(max(1, n_brands // 3))]
+    labelers = [make_name(rng, 2, 3) + " Pharmaceuticals" for _ in range(max(1, n_products // 50))]
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {
+        "ndc": os.path.join(out_dir, "ndc_extracted.jsonl"),
+        "labels": os.path.join(out_dir, "label_extracted.jsonl"),
+        "mentions": os.path.join(out_dir, "label_extracted_with_diseases.jsonl"),
+    }
+    with open(paths["ndc"], "w", encoding="utf-8") as ndc_f, \
+            open(paths["labels"], "w", encoding="utf-8") as label_f, \
+            open(paths["mentions"], "w", encoding="utf-8") as mention_f:
+        for i in range(n_products):
+            brand_index = _weighted_index(rng, brand_cum)
+            brand = brands[brand_index]
+            generic = generics[brand_index % len(generics)]
+            spl_id = f"{seed:04x}{i:08x}-0000-4000-8000-{rng.getrandbits(48):012x}"
+            product_ndc = f"{10000 + i // 1000:05d}-{i % 1000:03d}"
+            route = [rng.choice(ROUTES)]
+            dosage_form = rng.choice(DOSAGE_FORMS)
+            labeler = rng.choice(labelers)
+            product_type = PRODUCT_TYPES[0] if rng.random() < 0.7 else PRODUCT_TYPES[1]
+
+            ndc_record = {
+                "product_ndc": product_ndc,
+                "generic_name": generic,
+                "brand_name": brand,
+                "substance_name": [generic.upper()],
+                "route": route,
+                "dosage_form": dosage_form,
+                "labeler_name": labeler,
+                "manufacturer_name": None,
+                "product_class": None,
+                "product_type": product_type,
+                "spl_id": spl_id,
+                "application_number": f"NDA{rng.randint(10000, 220000):06d}",
+                "openfda.manufacturer_name": [labeler],
+                "openfda.rxcui": [str(rng.randint(100000, 2000000))],
+                "openfda.spl_set_id": [f"{i:08x}-set"],
+                "openfda.is_original_packager": [True],
+                "openfda.nui": [f"N{rng.randint(1000000000, 9999999999)}"],
+                "openfda.pharm_class_moa": [],
+                "openfda.pharm_class_cs": [],
+                "openfda.pharm_class_epc": [rng.choice(PHARM_CLASSES)],
+                "openfda.unii": [f"{rng.getrandbits(40):010X}"],
+            }
+            ndc_f.write(json.dumps(ndc_record) + "\n")
+
+            n_indications = min(len(diseases), 1 + int(rng.expovariate(0.8)))
+            picked = []
+            while len(picked) < n_indications:
+                disease = diseases[_weighted_index(rng, disease_cum)]
+                if disease not in picked:
+                    picked.append(disease)
+            cautions = [diseases[_weighted_index(rng, disease_cum)][1]] if rng.random() < 0.15 else []
+            text = indication_text(rng, brand.upper(), [name.lower() for _, name in picked], cautions)
+            label_f.write(json.dumps({"product_ndc": product_ndc, "spl_id": spl_id,
+                                      "label_data": {"indications_and_usage": [text]}}) + "\n")
+
+            mentions = []
+            for category, name in picked:
+                mentions.append({"disease": name, "method": "regex", "confidence": 1.0, "category": category})
+                if rng.random() < 0.4:
+                    mentions.append({"disease": name, "method": "fuzzy", "confidence": round(rng.uniform(0.9, 1.0), 2),
+                                     "category": category})
+            if rng.random() < 0.1:
+                mentions.append({"disease": f"{make_name(rng)} disease", "method": "ner", "confidence": 1.0,
+                                 "category": None})
+            # Same shape as extract_diseases_from_labels output: uppercased values, NDC fields merged in
+            record = {"spl_id": spl_id, "product_ndc": product_ndc, "disease_mentions": mentions}
+            record.update({k: v for k, v in ndc_record.items() if k != "product_ndc"})
+            ordered = {k: record[k] for k in MENTION_KEY_ORDER}
+            ordered.update(record)
+            mention_f.write(json.dumps(_uppercase(ordered)) + "\n")
+    return paths
+
+
+def _cumulative(weights):
+    total = 0.0
+    for w in weights:
+        total += w
+        yield total
+
+
+def _weighted_index(rng, cumulative):
+    # Binary search over cumulative weights, O(log n) per draw
+    x = rng.random() * cumulative[-1]
+    lo, hi = 0, len(cumulative) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if cumulative[mid] < x:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic openFDA-shaped dataset.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for name, path in generate_dataset(args.out_dir, args.products, args.seed).items():
+        print(f"{name}: {path}")
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from urllib.parse import urlsplit, urlencode
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SNAPSHOT = os.path.join(REPO_DIR, "data", "graph_index")
+
+
+def make_requests(tables, n, seed):
+    """A deterministic mix of endpoint queries over names taken from the index snapshot."""
+    rng = random.Random(seed)
+    drugs, indications = tables["drugs"], tables["indications"]
+    n_clusters = max(1, len(tables.get("clusters", [])))
+    mix = [
+        (0.4, lambda: ("search", {"q": rng.choice(drugs + indications)[:rng.randint(2, 8)].lower(), "limit": 10})),
+        (0.25, lambda: ("neighbors", {"node": rng.choice(drugs), "type": "Medication"})),
+        (0.15, lambda: ("neighbors", {"node": rng.choice(indications), "type": "Indication", "limit": 100})),
+        (0.1, lambda: ("khop", {"node": rng.choice(indications), "type": "Indication", "hops": 2})),
+        (0.1, lambda: (f"clusters/{rng.randrange(n_clusters)}", {"limit": 100})),
+    ]
+    weights = [w for w, _ in mix]
+    return [rng.choices(mix, weights)[0][1]() for _ in range(n)]
+
+
+async def _worker(host, port, base_path, queue, results, deadline):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                endpoint, params = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            target = f"{base_path}{endpoint}?{urlencode(params)}"
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            results.append((endpoint.split("/")[0], status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+async def run_load(url, requests, concurrency, duration):
+    parts = urlsplit(url)
+    base_path = parts.path if parts.path.endswith("/") else parts.path + "/"
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    results = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(_worker(parts.hostname, parts.port or 80, base_path, queue, results, deadline)
+                           for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def print_summary(results, elapsed):
+    errors = sum(1 for _, status, _ in results if status >= 400)
+    print(f"{len(results)} requests in {elapsed:.2f}s: {len(results) / elapsed:.0f} req/s, {errors} errors")
+    print(f"{'endpoint':<12} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    by_endpoint = {}
+    for endpoint, _, seconds in results:
+        by_endpoint.setdefault(endpoint, []).append(seconds * 1000)
+    for endpoint, times in sorted(by_endpoint.items()):
+        print(f"{endpoint:<12} {len(times):>7} {statistics.median(times):>8.2f} {percentile(times, 0.95):>8.2f} "
+              f"{percentile(times, 0.99):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running graph_api.py service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765/")
+    parser.add_argument("--snapshot", default=DEFAULT_SNAPSHOT, help="Graph index snapshot to draw query names from")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent keep-alive connections")
+    parser.add_argument("--duration", type=float, default=60.0, help="Stop after this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.snapshot, "tables.json"), encoding="utf-8") as f:
+        tables = json.load(f)["tables"]
+    requests = make_requests(tables, args.requests, args.seed)
+    results, elapsed = asyncio.run(run_load(args.url, requests, args.concurrency, args.duration))
+    print_summary(results, elapsed)
+
+
+if __name__ == "__main__":
+    main()
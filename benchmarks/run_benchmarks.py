@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(REPO_DIR, "src")
+RESULTS_FILE = os.path.join(BENCH_DIR, "results", "results.jsonl")
+DATA_CACHE = os.path.join(BENCH_DIR, ".data")
+
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from generate_data import generate_dataset  # noqa: E402
+
+
+# Each benchmark is (setup, timed): setup(paths, options) returns the argument of timed(arg).
+# Only timed() is measured; both run in a fresh process so peak RSS belongs to that stage alone.
+
+def setup_extract_diseases(paths, options):
+    import json as _json
+    from utils import load_yaml_config, flatten_disease_dict
+    config = load_yaml_config(os.path.join(REPO_DIR, "params.yaml"))
+    with open(os.path.join(REPO_DIR, "data", "reference", "diseases.json")) as f:
+        flat_diseases = flatten_disease_dict(_json.load(f))
+    texts = []
+    with open(paths["labels"], encoding="utf-8") as f:
+        for line in f:
+            texts.append(" ".join(_json.loads(line)["label_data"]["indications_and_usage"]))
+            if len(texts) >= options["text_sample"]:
+                break
+    return texts, flat_diseases, config.get("fuzzy_threshold", 90)
+
+
+def bench_extract_diseases(arg):
+    from extract_diseases_from_labels import extract_diseases_from_text
+    texts, flat_diseases, fuzzy_threshold = arg
+    for text in texts:
+        extract_diseases_from_text(text, flat_diseases, fuzzy_threshold)
+
+
+def bench_segment_labels(arg):
+    from label_segments import SegmentCache, matched_text
+    texts = arg[0]
+    cache = SegmentCache()
+    for text in texts:
+        matched_text(cache.segments(text))
+
+
+def setup_path(paths, options):
+    return paths["mentions"]
+
+
+def bench_build_graph(mentions_path):
+    from build_drug_graph import build_graph_from_extracted, EXTRA_FIELDS
+    build_graph_from_extracted(mentions_path, EXTRA_FIELDS)
+
+
+def setup_labels_path(paths, options):
+    return paths["labels"]
+
+
+def setup_chunked_labels(paths, options):
+    # The labels again as chunked JSONL, written once next to the dataset
+    from codec import JsonlWriter, iter_jsonl_lines, read_chunk_index, resolve_compression
+    path = os.path.join(os.path.dirname(paths["labels"]), "label_extracted.chunked.jsonl")
+    if read_chunk_index(path)[0] is None:
+        with JsonlWriter(path, mode="wb", compression=resolve_compression("zstd")) as writer:
+            for line in iter_jsonl_lines(paths["labels"]):
+                writer.write_line(line)
+    return path
+
+
+def bench_read_jsonl(path):
+    from codec import iter_jsonl
+    for _ in iter_jsonl(path):
+        pass
+
+
+def setup_graph(paths, options):
+    from build_drug_graph import build_graph_from_extracted, EXTRA_FIELDS
+    return build_graph_from_extracted(paths["mentions"], EXTRA_FIELDS)
+
+
+def bench_louvain(graph):
+    from graph_utils import assign_clusters_louvain
+    assign_clusters_louvain(graph, node_type="Medication", resolution=0.8, random_state=42)
+
+
+def setup_clustered_graph(paths, options):
+    from graph_utils import assign_clusters_louvain
+    graph = setup_graph(paths, options)
+    return graph, assign_clusters_louvain(graph, node_type="Medication", resolution=0.8, random_state=42)
+
+
+def bench_layout(arg):
+    from graph_layout import forceatlas2_layout
+    graph, cluster_map = arg
+    forceatlas2_layout(graph, cluster_map, iterations=300, seed=42)
+
+
+def setup_site(paths, options):
+    # Reused between runs; the asset bundler prunes what the previous run left behind
+    return setup_graph(paths, options), os.path.join(DATA_CACHE, "site")
+
+
+def bench_site(arg):
+    from build_drug_graph import build_site
+    graph, site_dir = arg
+    build_site(graph, {"graph_lod_mode": False}, site_dir)
+
+
+BENCHMARKS = {
+    "extract_diseases": (setup_extract_diseases, bench_extract_diseases),
+    "segment_labels": (setup_extract_diseases, bench_segment_labels),
+    "read_jsonl": (setup_labels_path, bench_read_jsonl),
+    "read_jsonl_chunked": (setup_chunked_labels, bench_read_jsonl),
+    "build_graph": (setup_path, bench_build_graph),
+    "louvain": (setup_graph, bench_louvain),
+    "layout": (setup_clustered_graph, bench_layout),
+    "site": (setup_site, bench_site),
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _run_in_child(name, paths, options, queue):
+    # The pipeline scripts resolve their data paths relative to src/
+    os.chdir(SRC_DIR)
+    try:
+        setup, timed = BENCHMARKS[name]
+        arg = setup(paths, options)
+        setup_rss = peak_rss_mb()
+        start = time.perf_counter()
+        timed(arg)
+        seconds = time.perf_counter() - start
+        queue.put({"seconds": seconds, "setup_rss_mb": setup_rss, "peak_rss_mb": peak_rss_mb()})
+    except ImportError as e:
+        queue.put({"skipped": f"missing dependency: {e}"})
+    except Exception as e:
+        queue.put({"error": repr(e)})
+
+
+def run_benchmark(name, paths, options, repeat):
+    """Run one benchmark `repeat` times, each in a fresh spawned process."""
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_in_child, args=(name, paths, options, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if "seconds" not in result:
+            return result
+        runs.append(result)
+    times = [r["seconds"] for r in runs]
+    return {
+        "min_s": round(min(times), 4),
+        "median_s": round(statistics.median(times), 4),
+        "peak_rss_mb": round(max(r["peak_rss_mb"] for r in runs), 1),
+        "setup_rss_mb": round(max(r["setup_rss_mb"] for r in runs), 1),
+    }
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    return commit + ("-dirty" if git("status", "--porcelain", "--untracked-files=no") else "")
+
+
+def dataset_paths(n_products, seed):
+    out_dir = os.path.join(DATA_CACHE, f"products_{n_products}_seed_{seed}")
+    paths = {name: os.path.join(out_dir, f) for name, f in
+             [("ndc", "ndc_extracted.jsonl"), ("labels", "label_extracted.jsonl"),
+              ("mentions", "label_extracted_with_diseases.jsonl")]}
+    if not all(os.path.exists(p) for p in paths.values()):
+        print(f"Generating synthetic dataset with {n_products} products in {out_dir}")
+        paths = generate_dataset(out_dir, n_products, seed)
+    return paths
+
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def print_comparison(current, baseline):
+    print(f"{'benchmark':<18} {'median s':>10} {'vs base':>9} {'peak MB':>9} {'vs base':>9}")
+    for name, result in current["benchmarks"].items():
+        if "median_s" not in result:
+            print(f"{name:<18} {result.get('skipped') or result.get('error')}")
+            continue
+        base = (baseline or {}).get("benchmarks", {}).get(name, {})
+        time_change = f"{result['median_s'] / base['median_s'] - 1:+.0%}" if base.get("median_s") else ""
+        rss_change = f"{result['peak_rss_mb'] / base['peak_rss_mb'] - 1:+.0%}" if base.get("peak_rss_mb") else ""
+        print(f"{name:<18} {result['median_s']:>10.3f} {time_change:>9} {result['peak_rss_mb']:>9.1f} {rss_change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on synthetic data.")
+    parser.add_argument("--products", type=int, default=10000, help="Synthetic dataset size (10k to 1M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--text-sample", type=int, default=200,
+                        help="Label texts fed to extract_diseases_from_text (NER makes it the slowest stage)")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="Run only this benchmark")
+    parser.add_argument("--compare", help="Commit to compare against (default: the previous recorded run)")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the results file")
+    args = parser.parse_args()
+
+    paths = dataset_paths(args.products, args.seed)
+    options = {"text_sample": args.text_sample}
+    revision = git_revision()
+
+    record = {"commit": revision, "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "products": args.products,
+              "seed": args.seed, "python": sys.version.split()[0], "benchmarks": {}}
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name}...")
+        record["benchmarks"][name] = run_benchmark(name, paths, options, args.repeat)
+
+    # Compare against the same dataset size only
+    history = [r for r in load_results() if r["products"] == args.products and r["seed"] == args.seed]
+    if args.compare:
+        history = [r for r in history if r["commit"].startswith(args.compare)]
+    print_comparison(record, history[-1] if history else None)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Results for {revision} appended to {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,243 @@
 import os
-import re
-import json
+import math
+import itertools
+import numpy as np
 import networkx as nx
-from pyvis.network import Network
-from utils import load_extracted_mentions, safe_attr, scale_size, truncate_string, group_diseases_by_category
-from html_components import (html_search_bar, html_info_panel, html_cluster_legend, html_hop_explorer,
-                             html_node_size_panel)
-from graph_utils import assign_clusters_greedy, assign_clusters_louvain, generate_cluster_labels
+from utils import (group_extracted_mentions, product_table, safe_attr, truncate_string,
+                   group_diseases_by_category, load_yaml_config, ProductTable)
+from codec import dumps_text, loads
+from html_components import (html_graph_state, html_search_bar, html_info_panel, html_cluster_legend,
+                             html_hop_explorer, html_node_size_panel, html_lod_panel, graph_worker_script,
+                             node_color, CLUSTER_COLORS, NODE_TYPE_COLORS, DEFAULT_NODE_COLOR)
+from graph_utils import (assign_clusters_louvain, generate_cluster_labels, assign_lod_clusters,
+                         aggregate_cluster_edges)
+from graph_layout import forceatlas2_layout, scale_layout
+from similarity import DrugSimilarity, similarity_graph
+from graph_analytics import compute_graph_analytics, metric_sizes, centrality_payload, SIZE_METRICS
+from graph_export import assign_node_ids, build_graph_payload, build_search_index, export_graph_data
+from html_renderer import render_graph_page, RENDERER_TEMPLATES
+from site_assets import AssetBundler
+import metrics
 
 from collections import defaultdict
 
 
-from jinja2 import Environment, FileSystemLoader
-import pyvis
-
+VIS_OPTIONS = {
+    "nodes": {
+        "font": {"size": 100, "face": "arial"},
+        "scaling": {"min": 30, "max": 60},
+    },
+    "physics": {"enabled": False},
+    "edges": {"smooth": False},
+}
+
+# WebGL renderer options (src/static/webgl_graph.js) (graph_renderer: webgl); node colors are applied in the page as node_color() does
+WEBGL_OPTIONS = {
+    "background": "#1a1a1a",
+    "edgeColor": "#79db60",
+    "edgeOpacity": 0.2,
+    "labelColor": "#ffffff",
+    "maxLabels": 300,
+    "clusterColors": CLUSTER_COLORS,
+    "typeColors": NODE_TYPE_COLORS,
+    "defaultColor": DEFAULT_NODE_COLOR,
+}
+
+EXTRA_FIELDS = ['product_ndc', 'brand_name', 'generic_name', 'route', 'dosage_form', 'labeler_name']
+GRAPHML_PATH = "meds_indications2.graphml"
+SITE_DIR = "../docs"
 
 
 def build_graph_from_extracted(file_path, extra_fields):
-    pairs = load_extracted_mentions(file_path, extra_fields)
-    G = nx.Graph()
-
-    for drug, disease, attr_dict in pairs:
-        G.add_node(drug, type="Medication")
-        G.add_node(disease, type="Indication")
-        clean_attrs = {k: safe_attr(v) for k, v in attr_dict.items()}
-        G.add_edge(drug, disease, **clean_attrs)
-
+    """
+    One edge per (brand, disease) with aggregated evidence: `evidence` (number of products whose
+    label mentions the disease), `confidence_<method>` (best confidence per extraction method) and
+    `ndc_ids` (the supporting products). Product attributes (`extra_fields`) live once per product
+    in the graph's "products" ProductTable, indexed by those IDs.
+    """
+    products, edges = group_extracted_mentions(file_path, extra_fields)
+    G = nx.Graph(products=products)
+
+    # Nodes are added in first-seen order, which fixes their page IDs
+    node_types = {}
+    for drug, disease in edges:
+        node_types.setdefault(drug, "Medication")
+        node_types.setdefault(disease, "Indication")
+    G.add_nodes_from((node, {"type": node_type}) for node, node_type in node_types.items())
+
+    G.add_edges_from(
+        (drug, disease, {"evidence": edge["evidence"], "ndc_ids": tuple(edge["ndc_ids"]),
+                         **{f"confidence_{method}": c for method, c in edge["confidence"].items()}})
+        for (drug, disease), edge in edges.items()
+    )
     return G
 
 
-def aggregate_drug_attributes(graph, fields_to_aggregate):
-    drug_attributes = defaultdict(lambda: {field: set() for field in fields_to_aggregate})
+def build_panel_html(graph, node, node_type, products, similar=None, centrality=None):
+    lines = [f"<strong>Type:</strong> {node_type}", f"<strong>Label:</strong> {truncate_string(node, 50)}"]
+
+    if centrality:
+        # (rank among its type, nodes of its type, rank in its cluster, cluster size), by PageRank
+        type_rank, type_count, cluster_rank, cluster_size = centrality
+        lines.append(f"<strong>Centrality:</strong> #{type_rank} of {type_count} by PageRank, "
+                     f"#{cluster_rank} of {cluster_size} in its cluster")
+
+    if node in products:
+        for field, values in products.brand_attributes(node).items():
+            truncated_vals = [truncate_string(v, 50) for v in sorted(values, key=str) if v]
+            field_display = field.replace('_', ' ').title().replace('product_ndc', 'NDC')
+            lines.append(f"<strong>{field_display}:</strong> {', '.join(truncated_vals)}")
+
+    disease_neighbors = [
+        n for n in graph.neighbors(node)
+        if graph.nodes[n].get("type") == "Indication"
+    ]
+    if disease_neighbors:
+        grouped = group_diseases_by_category(disease_neighbors)
+        category_html_lines = []
+        # Sorted: neighbour order depends on how the graph was built (load_graph or read_graph)
+        for category, diseases in sorted(grouped.items()):
+            diseases = sorted(diseases)
+            disease_list_html = "<ul>" + "".join(f"<li>{d}</li>" for d in diseases) + "</ul>"
+            category_html_lines.append(f"<strong>{category}:</strong>{disease_list_html}")
+        lines.append("<br><strong>Associated Diseases:</strong><br>" + "<br>".join(category_html_lines))
+
+    if similar:
+        similar_html = "".join(f"<li>{truncate_string(d, 50)} ({score:.2f})</li>" for d, score in similar)
+        lines.append(f"<strong>Similar Drugs (shared indications):</strong><ul>{similar_html}</ul>")
+
+    return "<br>".join(lines)
+
+
+def cluster_super_nodes(graph, lod_map, positions, cluster_labels):
+    """
+    Build one collapsed super-node per cluster, at the centroid of its members, plus one aggregated
+    edge per pair of clusters that share indications.
+
+    Returns:
+        tuple: (list of vis node dicts, list of vis edge dicts)
+    """
+    members = defaultdict(list)
+    for node, cid in lod_map.items():
+        members[cid].append(node)
+
+    super_nodes = []
+    for cid, nodes in sorted(members.items()):
+        cx = sum(positions[n][0] for n in nodes) / len(nodes)
+        cy = sum(positions[n][1] for n in nodes) / len(nodes)
+        n_drugs = sum(1 for n in nodes if graph.nodes[n].get("type") == "Medication")
+        label = cluster_labels.get(cid, f"Cluster {cid}")
+        super_nodes.append({
+            "id": f"cluster-{cid}",
+            "label": f"{label} ({n_drugs})",
+            "shape": "dot",
+            "color": CLUSTER_COLORS[cid % len(CLUSTER_COLORS)],
+            "size": min(20 + 4 * math.sqrt(len(nodes)), 120),
+            "font": {"color": "white", "size": 32},
+            "type": "Cluster",
+            "lod_cluster": cid,
+            "x": round(cx, 2),
+            "y": round(cy, 2),
+            "physics": False,
+        })
+
+    super_edges = []
+    for (a, b), weight in sorted(aggregate_cluster_edges(graph, lod_map).items()):
+        super_edges.append({
+            "id": f"lod-edge-{a}-{b}",
+            "from": f"cluster-{a}",
+            "to": f"cluster-{b}",
+            "color": "#bbbbbb",
+            "width": 1 + math.log(weight),
+            "title": f"{weight} links",
+        })
+    return super_nodes, super_edges
+
+
+def iter_vis_nodes(graph, node_ids, positions, node_sizes, lod_map, lod_mode):
+    for node, data in graph.nodes(data=True):
+        node_type = data.get("type", "unknown")
+        color = node_color(node_type, data.get("cluster_id", -1))
+        x, y = positions[node]
+
+        yield {
+            "id": node_ids[node],
+            "label": str(node),
+            "shape": "dot",
+            "color": color,
+            "size": node_sizes[node],
+            "font": {"color": "white"},
+            "type": node_type,
+            # In level-of-detail mode members start collapsed behind their cluster super-node
+            "hidden": lod_mode and node in lod_map,
+            "x": x,
+            "y": y,
+            "physics": False,
+        }
+
 
-    for source, target, attrs in graph.edges(data=True):
-        if graph.nodes[source].get("type") == "Medication":
-            drug = source
-        elif graph.nodes[target].get("type") == "Medication":
-            drug = target
-        else:
-            continue
+def iter_vis_edges(graph, node_ids, edge_color="#79db60"):
+    for i, (source, target) in enumerate(graph.edges()):
+        yield {
+            "id": f"edge-{i}",
+            "from": node_ids[source],
+            "to": node_ids[target],
+            "color": edge_color,
+            "alpha": 0.01,
+        }
 
-        for field in fields_to_aggregate:
-            value = safe_attr(attrs.get(field))
-            drug_attributes[drug][field].add(value)
 
-    return drug_attributes
 
+def extracted_mentions_path(config):
+    return os.path.join(config["label_output_dir"], "label_extracted_with_diseases.jsonl")
 
-if __name__ == '__main__':
-    extracted_jsonl = "../data/extracted_disease_terms/label_disease_terms/label_extracted_with_diseases.jsonl"
-    extra_fields = ['product_ndc', 'brand_name', 'generic_name', 'route', 'dosage_form', 'labeler_name']
 
+def load_graph(config):
+    extracted_jsonl = extracted_mentions_path(config)
     print(f"Processing extracted mentions file: {os.path.basename(extracted_jsonl)}")
-    graph = build_graph_from_extracted(extracted_jsonl, extra_fields)
-    degree_dict = dict(graph.degree())
-
+    with metrics.timer("graph_build"):
+        graph = build_graph_from_extracted(extracted_jsonl, EXTRA_FIELDS)
+    metrics.set_gauge("graph_nodes", graph.number_of_nodes())
+    metrics.set_gauge("graph_edges", graph.number_of_edges())
     print(f"Graph built with {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges.")
-
+    return graph
+
+
+def graphml_graph(graph, fields=EXTRA_FIELDS):
+    """
+    Copy of the graph with only scalar attributes, as GraphML requires: the products behind each
+    edge are expanded back into per-edge fields (one value, or a JSON list when they differ) and
+    `ndc_ids` becomes a JSON list.
+    """
+    products = graph.graph.get("products")
+    out = nx.Graph()
+    out.add_nodes_from(graph.nodes(data=True))
+    for u, v, attrs in graph.edges(data=True):
+        data = {k: val for k, val in attrs.items() if k != "ndc_ids"}
+        if products is not None and "ndc_ids" in attrs:
+            data["ndc_ids"] = safe_attr(list(attrs["ndc_ids"]))
+            for field in fields:
+                values = sorted({products.value(i, field) for i in attrs["ndc_ids"]}, key=str)
+                data[field] = values[0] if len(values) == 1 else safe_attr(values)
+        out.add_edge(u, v, **data)
+    return out
+
+
+def graph_products_path(graphml_path=GRAPHML_PATH):
+    return f"{os.path.splitext(graphml_path)[0]}.products.jsonl"
+
+
+def write_graphml(graph, graphml_path=GRAPHML_PATH):
+    """
+    Write the graph as GraphML, plus its product table next to it (graph_products_path), so
+    read_graph gets back the graph exactly as built. Clusters assigned by cluster_drugs are kept:
+    cluster_id on the drug nodes and the labels as the graph attribute cluster_labels.
+    """
+    products = graph.graph.get("products")
+    cluster_labels = graph.graph.get("cluster_labels")
+    graph = graphml_graph(graph)
+    if cluster_labels is not None:
+        graph.graph["cluster_labels"] = dumps_text({str(cid): label for cid, label in cluster_labels.items()})
     # Debugging: print problematic attributes
     for u, v, d in graph.edges(data=True):
         for k, v_ in d.items():
@@ -64,138 +245,187 @@ if __name__ == '__main__':
                 print(f"⚠️ Problematic edge attribute: ({u}, {v}) -> {k}: {type(v_)}")
 
     # Safe to write after converting attributes
-    nx.write_graphml(graph, "meds_indications2.graphml")
-
-    edges_df = nx.to_pandas_edgelist(graph)
-
-    net = Network(
-        height="750px",
-        width="100%",
-        bgcolor="#1a1a1a",
-        font_color="white",
-        notebook=False,
-        cdn_resources="in_line"
-    )
-
-    net.set_options("""
-    {
-    "nodes": {
-        "font": {
-                "size": 100,
-                "face": "arial"
-                    },
-            "scaling": 
-                {
-                "min": 30,
-                "max": 60
-                    }
-            },
-      "physics": {
-        "stabilization": {
-          "enabled": true,
-          "iterations": 500,
-          "updateInterval": 25,
-          "onlyDynamicEdges": false,
-          "fit": true
-        },
-        "solver": "barnesHut",
-        "barnesHut": {
-          "gravitationalConstant": -25000,
-          "centrality": 0.01,
-          "springLength": 100,
-          "springConstant": 0.001,
-          "damping": 0.08,
-          "avoidOverlap": 1
-        }
-      }
-    }
-    """)
-
-    drug_attributes = aggregate_drug_attributes(graph, extra_fields)
+    with metrics.timer("graphml_write"):
+        nx.write_graphml(graph, graphml_path)
+        if products is not None:
+            products.save(graph_products_path(graphml_path))
+    return graphml_path
+
+
+def read_graph(graphml_path=GRAPHML_PATH, fields=EXTRA_FIELDS):
+    """
+    The graph written by write_graphml, in the form load_graph returns: edges carry `ndc_ids`
+    into the "products" table again instead of the expanded product fields.
+    """
+    with metrics.timer("graphml_read"):
+        graph = nx.read_graphml(graphml_path)
+    products_path = graph_products_path(graphml_path)
+    if os.path.exists(products_path):
+        graph.graph["products"] = ProductTable.load(products_path)
+        for _, _, attrs in graph.edges(data=True):
+            for field in fields:
+                attrs.pop(field, None)
+            if "ndc_ids" in attrs:
+                attrs["ndc_ids"] = tuple(loads(attrs["ndc_ids"]))
+    if "cluster_labels" in graph.graph:
+        graph.graph["cluster_labels"] = {int(cid): label for cid, label in loads(graph.graph["cluster_labels"]).items()}
+    metrics.set_gauge("graph_nodes", graph.number_of_nodes())
+    metrics.set_gauge("graph_edges", graph.number_of_edges())
+    print(f"Graph read from {graphml_path} with {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges.")
+    return graph
+
+
+def similar_drugs(graph, k):
+    """Approximate top-k neighbours of every drug by indication-set Jaccard (MinHash + LSH)."""
+    with metrics.timer("graph_similarity"):
+        return DrugSimilarity.from_graph(graph).all_top_k(k=k, min_jaccard=0.1)
+
+
+def cluster_drugs(graph, config, similar=None):
+    """
+    Louvain clusters of the drugs, and their labels. With `cluster_projection: similarity` the
+    clustering runs on the top-k similarity graph instead of the all-pairs bipartite projection.
+    The clusters are stored on the graph (cluster_id, cluster_labels) for write_graphml.
+
+    Returns:
+        tuple: ({drug: cluster ID}, {cluster ID: label})
+    """
+    with metrics.timer("graph_cluster"):
+        projection = None
+        if config.get("cluster_projection", "bipartite") == "similarity":
+            k = config.get("similarity_cluster_k", 10)
+            if similar is None:
+                similar = similar_drugs(graph, k)
+            projection = similarity_graph({drug: s[:k] for drug, s in similar.items()})
+        cluster_map = assign_clusters_louvain(graph, node_type="Medication", resolution=0.8, random_state=42,
+                                              projection=projection, weight="evidence")
+        cluster_labels = generate_cluster_labels(graph, cluster_map)
+    graph.graph["cluster_labels"] = cluster_labels
+    metrics.set_gauge("graph_clusters", len(set(cluster_map.values())))
+    return cluster_map, cluster_labels
+
+
+def graph_clusters(graph, config, similar=None):
+    """The clusters stored on a graph by cluster_drugs (e.g. read back by read_graph), else cluster_drugs."""
+    cluster_labels = graph.graph.get("cluster_labels")
+    if cluster_labels is None:
+        return cluster_drugs(graph, config, similar)
+    cluster_map = {node: data["cluster_id"] for node, data in graph.nodes(data=True)
+                   if data.get("type") == "Medication" and "cluster_id" in data}
+    metrics.set_gauge("graph_clusters", len(set(cluster_map.values())))
+    return cluster_map, cluster_labels
+
+
+def build_site(graph, config, site_dir=SITE_DIR):
+    """
+    Cluster and lay out the graph, then write the interactive page and its assets to `site_dir`.
+
+    Returns:
+        str: Path of the written page.
+    """
+    lod_mode = config.get("graph_lod_mode", False)
+    renderer = config.get("graph_renderer", "vis")
+    if renderer not in RENDERER_TEMPLATES:
+        raise ValueError(f"graph_renderer must be one of {sorted(RENDERER_TEMPLATES)}, got {renderer!r}")
+    size_metric = config.get("node_size_metric", "pagerank")
+    if size_metric not in SIZE_METRICS:
+        raise ValueError(f"node_size_metric must be one of {SIZE_METRICS}, got {size_metric!r}")
+
+    products = product_table(graph, EXTRA_FIELDS)
     #assign_clusters(graph, node_type="Medication")  # or "Indication" if you prefer
 
-    cluster_map = assign_clusters_louvain(graph, node_type="Medication", resolution=0.8)
-    cluster_labels = generate_cluster_labels(graph, cluster_map)
-    cluster_labels_json = json.dumps(cluster_labels)
-
+    # Similar drugs are shown in the info panel, and reused by similarity clustering when enabled
+    similar_k = config.get("similar_drugs_top_k", 5)
+    cluster_k = 0
+    if "cluster_labels" not in graph.graph and config.get("cluster_projection") == "similarity":
+        cluster_k = config.get("similarity_cluster_k", 10)
+    similar = similar_drugs(graph, max(similar_k, cluster_k)) if max(similar_k, cluster_k) else None
+    cluster_map, cluster_labels = graph_clusters(graph, config, similar)
+
+    # Layout is computed here rather than by vis physics in the browser
+    with metrics.timer("graph_layout"):
+        positions = forceatlas2_layout(graph, cluster_map, iterations=300, seed=42, weight="evidence")
+        positions = scale_layout(positions, extent=60 * math.sqrt(graph.number_of_nodes()))
+    lod_map = assign_lod_clusters(graph, cluster_map)
+
+    node_ids = assign_node_ids(graph)
+    # Centrality drives node sizes and panel ranks; the page gets the scores to resize by any metric
+    with metrics.timer("graph_analytics"):
+        analytics = compute_graph_analytics(graph, node_ids, weight="evidence",
+                                            betweenness_samples=config.get("betweenness_samples", 256))
+    sizes = metric_sizes(analytics, size_metric).tolist()
+    node_sizes = {node: round(sizes[i], 2) for node, i in node_ids.items()}
+    type_counts = np.bincount(analytics["type"][analytics["type"] >= 0])
+    cluster_sizes = defaultdict(int)
+    for cid in analytics["cluster"][analytics["cluster"] >= 0].tolist():
+        cluster_sizes[cid] += 1
+
+    # Panel HTML is shipped in lazily fetched detail shards instead of on every node
+    panel_details = {}
     for node, data in graph.nodes(data=True):
-        node_type = data.get("type", "unknown")
-        label = str(node)
-        color = "#4dd0e1" if node_type == "Medication" else "#79db60" if node_type == "Indication" else "#e0e0e0"
-
-        tooltip_lines = [f"<strong>Type:</strong> {node_type}", f"<strong>Label:</strong> {truncate_string(label, 50)}"]
-
-        if node_type == "Medication":
-            if node in drug_attributes:
-                drug_data = drug_attributes[node]
-                for field, values in drug_data.items():
-                    truncated_vals = [truncate_string(v, 50) for v in values if v]
-                    field_display = field.replace('_', ' ').title().replace('product_ndc', 'NDC')
-                    tooltip_lines.append(f"<strong>{field_display}:</strong> {', '.join(truncated_vals)}")
-
-            disease_neighbors = [
-                n for n in graph.neighbors(node)
-                if graph.nodes[n].get("type") == "Indication"
-            ]
-            if disease_neighbors:
-                grouped = group_diseases_by_category(disease_neighbors)
-                category_html_lines = []
-                for category, diseases in grouped.items():
-                    diseases = sorted(diseases)
-                    disease_list_html = "<ul>" + "".join(f"<li>{d}</li>" for d in diseases) + "</ul>"
-                    category_html_lines.append(f"<strong>{category}:</strong>{disease_list_html}")
-                tooltip_lines.append("<br><strong>Associated Diseases:</strong><br>" + "<br>".join(category_html_lines))
-
-        tooltip = "\n".join(tooltip_lines)
-        panel_info_html = "<br>".join(tooltip_lines)
-        size = scale_size(degree_dict.get(node, 1))
-        font_size = 24 if node_type == "Indication" else 16
-
-        net.add_node(
-            node,
-            label=label,
-            color=color,
-            size=size,
-            font={'size': font_size},
-            type=node_type,
-            panel_info=panel_info_html,
-            cluster_id = data.get("cluster_id", -1)
-        )
-
-    edge_color = "#79db60"
-    for i, (source, target, attrs) in enumerate(graph.edges(data=True)):
-        net.add_edge(
-            source,
-            target,
-            color=edge_color,
-            alpha=0.01,
-            id=f"edge-{i}"
-        )
-
-    template_path = os.path.join(pyvis.__path__[0], 'templates')
-    Network.template_env = Environment(loader=FileSystemLoader(template_path))
-
-    output_html = "../docs/meds_indications.html"
-    with open(output_html, 'w', encoding='utf-8') as f:
-        f.write(net.generate_html())
-
-    print(f"Interactive graph saved to {output_html}")
-
-    with open(output_html, "r", encoding="utf-8") as f:
-        html = f.read()
-
-    search_bar_script = html_search_bar()
-    info_panel_script = html_info_panel()
-
-    node_size_slider = html_node_size_panel()
-    cluster_panel_script = html_cluster_legend()
-    cluster_names = f'<script>const clusterLabels = {cluster_labels_json};</script>\n'
-
-    hop_explorer_script = html_hop_explorer()
-
-
-    html = html.replace('<body>', '<body>\n' + search_bar_script + info_panel_script + node_size_slider +
-                        cluster_panel_script + hop_explorer_script + cluster_names)
-
-    with open(output_html, "w", encoding="utf-8") as f:
-        f.write(html)
+        if data.get("type") != "Medication":
+            continue
+        i = node_ids[node]
+        cid = int(analytics["cluster"][i])
+        centrality = (int(analytics["type_rank"][i]), int(type_counts[analytics["type"][i]]),
+                      int(analytics["cluster_rank"][i]), cluster_sizes[cid]) if cid >= 0 else None
+        panel_details[i] = build_panel_html(graph, node, data.get("type"), products,
+                                            (similar or {}).get(str(node), [])[:similar_k], centrality)
+
+    with metrics.timer("site_export"):
+        payload = build_graph_payload(graph, node_ids, positions, node_sizes, cluster_labels, lod_map, lod_mode,
+                                      centrality_payload(analytics), size_metric)
+        search_index = build_search_index(graph, node_ids, products)
+        # Everything the page loads is written as a content-hashed asset with .gz/.br siblings
+        bundler = AssetBundler(site_dir)
+        graph_data_paths = export_graph_data(bundler, payload, panel_details, search_index)
+
+    if renderer == "webgl":
+        # The WebGL page draws the graph from the payload; only super-nodes are shipped as objects
+        vis_nodes, vis_edges, page_options = [], [], WEBGL_OPTIONS
+    else:
+        vis_nodes = iter_vis_nodes(graph, node_ids, positions, node_sizes, lod_map, lod_mode)
+        vis_edges = iter_vis_edges(graph, node_ids)
+        page_options = VIS_OPTIONS
+    if lod_mode:
+        super_nodes, super_edges = cluster_super_nodes(graph, lod_map, positions, cluster_labels)
+        vis_nodes = itertools.chain(vis_nodes, super_nodes)
+        vis_edges = itertools.chain(vis_edges, super_edges)
+
+    # Shared state every panel reads from comes first, ahead of the panels
+    components = [html_graph_state()]
+    if lod_mode:
+        components.append(html_lod_panel())
+    components += [html_search_bar(), html_info_panel(), html_node_size_panel(size_metric), html_cluster_legend(),
+                   html_hop_explorer()]
+
+    # Search, hop and filter queries are answered off the main thread by this worker
+    graph_data_paths["worker"] = bundler.add_text("assets/graph_worker.js", graph_worker_script())
+    if config.get("graph_api_url"):
+        # Search and hop queries then go to graph_api.py; the local data stays as the fallback
+        graph_data_paths["api"] = config["graph_api_url"]
+
+    output_html = os.path.join(site_dir, "meds_indications.html")
+    with metrics.timer("site_render"):
+        render_graph_page(output_html, vis_nodes, vis_edges, page_options, components, cluster_labels,
+                          graph_data_paths, bundler, renderer=renderer)
+        removed = bundler.prune()
+        manifest_path = bundler.write_manifest()
+    metrics.set_gauge("site_assets", len(bundler.manifest))
+    print(f"Interactive graph saved to {output_html} ({len(bundler.manifest)} assets, {removed} stale removed, "
+          f"manifest {manifest_path})")
+    return output_html
+
+
+def main(config_path="../params.yaml"):
+    config = load_yaml_config(config_path)
+    with metrics.profiled(config, "graph"):
+        graph = load_graph(config)
+        cluster_drugs(graph, config)
+        write_graphml(graph)
+        build_site(graph, config)
+    metrics.emit(config, "graph")
+
+
+if __name__ == '__main__':
+    main()
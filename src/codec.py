@@ -0,0 +1,475 @@
+import os
+import json
+import zlib
+import bisect
+from typing import Any, List, Optional, TypedDict
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional: typed records are then decoded whole, as plain dicts
+    msgspec = None
+
+try:
+    import zstandard
+except ImportError:  # optional: chunked files are gzip-compressed without it
+    zstandard = None
+
+# Fallback output matches orjson's: compact separators, UTF-8 rather than \u escapes
+_ENCODER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def dumps(obj):
+    """Compact JSON as UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _ENCODER.encode(obj).encode("utf-8")
+
+
+def dumps_text(obj):
+    """Compact JSON as str."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return _ENCODER.encode(obj)
+
+
+def loads(data):
+    """Parse JSON from str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class DiseaseMention(TypedDict, total=False):
+    disease: str
+    method: str
+    confidence: Optional[float]
+    category: Optional[str]
+
+
+@lru_cache(maxsize=None)
+def mention_record_type(fields=()):
+    """
+    TypedDict of a disease stage record, as read by the graph build: spl_id, product_ndc,
+    brand_name and the disease mentions, plus the product attributes `fields` (any JSON value).
+    """
+    keys = {"spl_id": Optional[str], "product_ndc": Optional[str], "brand_name": Optional[str],
+            "disease_mentions": List[DiseaseMention]}
+    keys.update((field, Any) for field in fields if field not in keys)
+    return TypedDict("MentionRecord", keys, total=False)
+
+
+@lru_cache(maxsize=None)
+def record_decoder(record_type=None):
+    """
+    Decoder of one JSONL line into a record. With msgspec installed and a `record_type` (a
+    TypedDict such as mention_record_type()), lines are decoded straight into that type: values
+    are type-checked (a mismatch raises ValueError) and undeclared keys are skipped rather than
+    built. Otherwise every line is decoded whole.
+    """
+    if msgspec is not None and record_type is not None:
+        return msgspec.json.Decoder(record_type).decode
+    return loads
+
+
+def _upper(value):
+    if isinstance(value, str):
+        return value.upper()
+    if isinstance(value, list):
+        return [_upper(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _upper(v) for k, v in value.items()}
+    return value
+
+
+def prepare_record(entry, key_order=(), uppercase=False):
+    """
+    The record as written: keys in `key_order` first (those present), then the rest in their
+    original order, with every string value uppercased if `uppercase`. Built as one new dict;
+    values that need no change (numbers, None, already-ordered keys) are not copied.
+    """
+    if not key_order and not uppercase:
+        return entry
+    record = {}
+    for key in key_order:
+        if key in entry:
+            value = entry[key]
+            record[key] = _upper(value) if uppercase else value
+    for key, value in entry.items():
+        if key not in record:
+            record[key] = _upper(value) if uppercase else value
+    return record
+
+
+# Chunked JSONL: the records of `<name>.jsonl` stored as independently compressed chunks in
+# `<name>.jsonl.zst` (or `.gz`), plus `<name>.jsonl.idx`, a JSONL index whose first line is a header
+# and every further line one chunk: {"offset", "length", "first", "records"}. Chunks are whole
+# zstd frames / gzip members, so the data file is still one valid stream for zstdcat / zcat.
+CHUNK_INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+COMPRESSION_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+DEFAULT_LEVELS = {"zstd": 3, "gzip": 6}
+DEFAULT_READ_WORKERS = min(4, os.cpu_count() or 1)
+
+
+@lru_cache(maxsize=None)
+def resolve_compression(name):
+    """
+    Chunk compression for a `jsonl_compression` setting: None for plain JSONL ("none" or unset),
+    else "zstd" or "gzip". zstd falls back to gzip when zstandard is not installed.
+    """
+    if not name or str(name).lower() == "none":
+        return None
+    name = str(name).lower()
+    if name not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown jsonl_compression {name!r}; expected one of none, zstd, gzip")
+    if name == "zstd" and zstandard is None:
+        print("zstandard is not installed; writing gzip-compressed chunks instead")
+        return "gzip"
+    return name
+
+
+def _compress(data, compression, level=None):
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    # wbits=31: a gzip member (zero mtime, so the output is reproducible)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data, compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstandard is required to read zstd-compressed JSONL chunks")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data, 31)
+
+
+def _data_path(path, compression):
+    return path + COMPRESSION_SUFFIXES[compression]
+
+
+def read_chunk_index(path):
+    """
+    The (header, chunks) of the chunked JSONL stored for `path`, or (None, None) when `path` is
+    plain JSONL. A torn last line (a writer killed while appending it) is ignored.
+    """
+    index_path = path + INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        return None, None
+    header, chunks = None, []
+    with open(index_path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except ValueError:
+                break
+            if header is None:
+                header = record
+            else:
+                chunks.append(record)
+    if header is None:
+        return None, None
+    if header.get("version") != CHUNK_INDEX_VERSION:
+        raise ValueError(f"Unsupported chunk index version {header.get('version')} in {index_path}")
+    return header, chunks
+
+
+def _write_chunk_index(path, header, chunks):
+    tmp_path = f"{path}{INDEX_SUFFIX}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(dumps(record) + b"\n" for record in [header] + chunks))
+    os.replace(tmp_path, path + INDEX_SUFFIX)
+
+
+def jsonl_files(path):
+    """The files holding `path` on disk: the data file and index if chunked, else `path` itself."""
+    header, _ = read_chunk_index(path)
+    if header is not None:
+        return [_data_path(path, header["compression"]), path + INDEX_SUFFIX]
+    return [path] if os.path.exists(path) else []
+
+
+def remove_jsonl(path):
+    """Remove `path` in whichever form it is stored (plain, chunked, or a leftover of either)."""
+    for file in [path, path + INDEX_SUFFIX] + [_data_path(path, c) for c in COMPRESSION_SUFFIXES]:
+        if os.path.exists(file):
+            os.remove(file)
+
+
+def replace_jsonl(src, dst):
+    """os.replace for JSONL that may be chunked; the index moves last, so `dst` switches at once."""
+    header, _ = read_chunk_index(src)
+    if header is None:
+        remove_jsonl(dst)
+        os.replace(src, dst)
+        return
+    for file in [dst] + [_data_path(dst, c) for c in COMPRESSION_SUFFIXES if c != header["compression"]]:
+        if os.path.exists(file):
+            os.remove(file)
+    os.replace(_data_path(src, header["compression"]), _data_path(dst, header["compression"]))
+    os.replace(src + INDEX_SUFFIX, dst + INDEX_SUFFIX)
+
+
+def truncate_jsonl(path, size):
+    """
+    Cut `path` back to `size` bytes, as reported by JsonlWriter.tell() after a flush. Chunked files
+    keep the chunks ending at or before `size`; a checkpoint always falls on a chunk boundary.
+    """
+    header, chunks = read_chunk_index(path)
+    if header is None:
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+        return
+    kept = [c for c in chunks if c["offset"] + c["length"] <= size]
+    if len(kept) < len(chunks):
+        _write_chunk_index(path, header, kept)
+    data_path = _data_path(path, header["compression"])
+    if os.path.exists(data_path) and os.path.getsize(data_path) > size:
+        with open(data_path, "r+b") as f:
+            f.truncate(size)
+
+
+def count_jsonl(path):
+    """Number of records, read from the index for chunked files."""
+    header, chunks = read_chunk_index(path)
+    if header is not None:
+        return sum(c["records"] for c in chunks)
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _read_chunk(data_path, compression, chunk):
+    with open(data_path, "rb") as f:
+        f.seek(chunk["offset"])
+        payload = f.read(chunk["length"])
+    if len(payload) != chunk["length"]:
+        raise ValueError(f"{data_path} ends inside the chunk at offset {chunk['offset']}")
+    lines = [line for line in _decompress(payload, compression).split(b"\n") if line.strip()]
+    if len(lines) != chunk["records"]:
+        raise ValueError(f"Chunk at offset {chunk['offset']} of {data_path} holds {len(lines)} records, "
+                         f"its index says {chunk['records']}")
+    return lines
+
+
+def _ordered_map(pool, func, items, window):
+    # Like pool.map, but with at most `window` chunks in flight, so memory stays bounded
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_jsonl_lines(path, start=0, workers=None):
+    """
+    Yield the raw lines (bytes, newline stripped) of a plain or chunked JSONL file from record
+    number `start` on, skipping blank lines.
+
+    Chunked files seek straight to the chunk holding `start` through the index, and decompress
+    up to `workers` chunks ahead in threads (zstd and zlib release the GIL). Plain files are
+    scanned from the beginning.
+    """
+    header, chunks = read_chunk_index(path)
+    if header is None:
+        with open(path, "rb") as f:
+            skipped = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                if skipped < start:
+                    skipped += 1
+                    continue
+                yield line.rstrip(b"\r\n")
+        return
+
+    first = bisect.bisect_right([c["first"] for c in chunks], start) - 1
+    chunks = chunks[max(first, 0):]
+    skip = start - chunks[0]["first"] if chunks and start > 0 else 0
+    data_path = _data_path(path, header["compression"])
+
+    def read(chunk):
+        return _read_chunk(data_path, header["compression"], chunk)
+
+    workers = DEFAULT_READ_WORKERS if workers is None else workers
+    if workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            for lines in _ordered_map(pool, read, chunks, 2 * workers):
+                yield from lines[skip:]
+                skip = 0
+    else:
+        for chunk in chunks:
+            yield from read(chunk)[skip:]
+            skip = 0
+
+
+def iter_jsonl(path, start=0, workers=None, record_type=None):
+    """
+    Yield the records of a plain or chunked JSONL file from record number `start` on, decoded
+    as `record_type` when given (see record_decoder).
+    """
+    decode = record_decoder(record_type)
+    for line in iter_jsonl_lines(path, start, workers):
+        yield decode(line)
+
+
+def read_jsonl(path, start=0, workers=None):
+    return list(iter_jsonl(path, start, workers))
+
+
+def _existing_compression(path):
+    """Compression of the non-empty JSONL stored for `path` (None when plain), False when there is none."""
+    header, chunks = read_chunk_index(path)
+    if header is not None:
+        return header["compression"] if chunks else False
+    return None if os.path.exists(path) and os.path.getsize(path) else False
+
+
+class _ChunkFile:
+    """Append side of a chunked JSONL file: each write is one compressed chunk plus its index line."""
+
+    def __init__(self, path, mode, compression, level=None):
+        if "w" in mode:
+            remove_jsonl(path)
+        elif os.path.exists(path) and os.path.getsize(path):
+            raise ValueError(f"{path} holds plain JSONL; remove it or set jsonl_compression to none to append")
+        header, chunks = read_chunk_index(path)
+        if header is None:
+            header, chunks = {"version": CHUNK_INDEX_VERSION, "compression": compression}, []
+        # Appending keeps the file's own compression
+        self.compression = header["compression"]
+        self.level = level if compression == self.compression else None
+        self.records = sum(c["records"] for c in chunks)
+        end = chunks[-1]["offset"] + chunks[-1]["length"] if chunks else 0
+        # Rewritten once on open: drops a torn last index line, and a chunk written without one
+        _write_chunk_index(path, header, chunks)
+        self._data = open(_data_path(path, self.compression), "ab")
+        if self._data.tell() > end:
+            self._data.truncate(end)
+            self._data.seek(end)
+        self._index = open(path + INDEX_SUFFIX, "ab")
+
+    @property
+    def closed(self):
+        return self._data.closed
+
+    def write(self, data, records):
+        payload = _compress(data, self.compression, self.level)
+        offset = self._data.tell()
+        self._data.write(payload)
+        # The chunk is in the data file before the index line that makes it visible to readers
+        self._data.flush()
+        self._index.write(dumps({"offset": offset, "length": len(payload), "first": self.records,
+                                 "records": records}) + b"\n")
+        self._index.flush()
+        self.records += records
+
+    def flush(self):
+        self._data.flush()
+        self._index.flush()
+
+    def tell(self):
+        return self._data.tell()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class JsonlWriter:
+    """
+    Appends records to a JSONL file through one open handle. Records are encoded as they are
+    written and buffered in memory; `flush` writes the buffer in a single call, so a stage
+    flushes once per batch, right before saving its checkpoint.
+
+    With `compression` ("zstd" or "gzip", see resolve_compression) the file is chunked JSONL:
+    every buffer written becomes one compressed chunk, so each batch flushed is its own chunk.
+
+        with JsonlWriter(path, key_order=["spl_id", ...], uppercase=True) as writer:
+            writer.write(record)
+            writer.flush()
+    """
+
+    def __init__(self, path, mode="ab", key_order=(), uppercase=False, buffer_bytes=1 << 20, compression=None,
+                 level=None):
+        self.path = path
+        self.key_order = tuple(key_order)
+        self.uppercase = uppercase
+        self.buffer_bytes = buffer_bytes
+        self._buffer = []
+        self._buffered = 0
+        if "w" not in mode:
+            # Appending continues a file in the format it was started in, whatever jsonl_compression
+            # says now, so checkpoints (byte offsets) taken before a settings change stay valid
+            existing = _existing_compression(path)
+            if existing is not False and existing != compression:
+                print(f"Appending to {path} as {existing or 'plain'} JSONL, the format it was started in")
+                compression = existing
+        if compression:
+            self._file = _ChunkFile(path, mode, compression, level)
+        else:
+            if read_chunk_index(path)[0] is not None:
+                remove_jsonl(path)
+            self._file = open(path, mode)
+
+    def write(self, record):
+        self.write_line(dumps(prepare_record(record, self.key_order, self.uppercase)))
+
+    def write_line(self, line):
+        """Append an already encoded record (bytes, without the newline)."""
+        line += b"\n"
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= self.buffer_bytes:
+            self._write_buffer()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def _write_buffer(self):
+        if self._buffer:
+            if isinstance(self._file, _ChunkFile):
+                self._file.write(b"".join(self._buffer), len(self._buffer))
+            else:
+                self._file.write(b"".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def flush(self):
+        """Write buffered records and hand them to the OS, e.g. before a checkpoint is saved."""
+        self._write_buffer()
+        self._file.flush()
+
+    def tell(self):
+        """
+        Size of the file with everything written so far, buffered records included. For chunked
+        files, the size of the compressed data once flushed; call it after `flush`.
+        """
+        if isinstance(self._file, _ChunkFile):
+            return self._file.tell()
+        return self._file.tell() + self._buffered
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
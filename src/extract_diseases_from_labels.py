@@ -2,6 +2,7 @@ import json
 import re
 import os
 import time
+from itertools import islice
 from fuzzywuzzy import fuzz
 import medspacy
 import spacy
@@ -13,64 +14,58 @@ from utils import (
     save_checkpoint,
     ensure_output_dir,
 )
+from codec import JsonlWriter, iter_jsonl, count_jsonl, truncate_jsonl, resolve_compression
+from label_segments import SegmentCache, matched_text, DEFAULT_MATCHED_TYPES
+import metrics
 
 nlp = medspacy.load(enable=["ner"])
 
 
-def uppercase_all_text_values(obj):
-    if isinstance(obj, str):
-        return obj.upper()
-    elif isinstance(obj, list):
-        return [uppercase_all_text_values(v) for v in obj]
-    elif isinstance(obj, dict):
-        return {k: uppercase_all_text_values(v) for k, v in obj.items()}
-    else:
-        return obj
-
-
-def reorder_fields(entry, desired_order):
-    reordered = {k: entry.get(k) for k in desired_order if k in entry}
-    # Add the remaining keys that weren't in the desired order
-    remaining = {k: v for k, v in entry.items() if k not in reordered}
-    reordered.update(remaining)
-    return reordered
+# Output records: these keys first, every string value uppercased
+MENTION_KEY_ORDER = ["spl_id", "product_ndc", "brand_name", "generic_name", "disease_mentions",
+                     "route", "dosage_form", "labeler_name", "product_type"]
 
 
 def extract_diseases_from_text(text, flat_diseases, fuzzy_threshold):
     mentions = []
 
     # Regex matching
-    for d in flat_diseases:
-        if re.search(d['pattern'], text, flags=re.IGNORECASE):
-            mentions.append({
-                "disease": d['name'],
-                "method": "regex",
-                "confidence": 1.0,
-                "category": d.get('category')
-            })
+    with metrics.timer("extract_regex"):
+        for d in flat_diseases:
+            if re.search(d['pattern'], text, flags=re.IGNORECASE):
+                mentions.append({
+                    "disease": d['name'],
+                    "method": "regex",
+                    "confidence": 1.0,
+                    "category": d.get('category')
+                })
 
     # Fuzzy matching
-    for d in flat_diseases:
-        score = fuzz.partial_ratio(d['name'].lower(), text.lower())
-        if score >= fuzzy_threshold:
-            mentions.append({
-                "disease": d['name'],
-                "method": "fuzzy",
-                "confidence": score / 100,
-                "category": d.get('category')
-            })
+    with metrics.timer("extract_fuzzy"):
+        for d in flat_diseases:
+            score = fuzz.partial_ratio(d['name'].lower(), text.lower())
+            if score >= fuzzy_threshold:
+                mentions.append({
+                    "disease": d['name'],
+                    "method": "fuzzy",
+                    "confidence": score / 100,
+                    "category": d.get('category')
+                })
 
     # NER matching
-    doc = nlp(text)
-    for ent in doc.ents:
-        if "disease" in ent.text.lower() or ent.label_.lower() in ("problem", "disorder", "diagnosis"):
-            # Adjust if your model differs
-            mentions.append({
-                "disease": ent.text,
-                "method": "ner",
-                "confidence": 1.0,
-                "category": None
-            })
+    with metrics.timer("extract_ner"):
+        doc = nlp(text)
+        for ent in doc.ents:
+            if "disease" in ent.text.lower() or ent.label_.lower() in ("problem", "disorder", "diagnosis"):
+                # Adjust if your model differs
+                mentions.append({
+                    "disease": ent.text,
+                    "method": "ner",
+                    "confidence": 1.0,
+                    "category": None
+                })
+    metrics.incr("extract_texts")
+    metrics.incr("extract_chars", len(text))
 
     # Deduplicate mentions, keep highest confidence per (disease, method)
     seen = {}
@@ -94,8 +89,10 @@ def extract_text_from_nested(value):
         return ""
 
 class LabelExtractor:
-    def __init__(self, config_path):
+    def __init__(self, config_path, overrides=None, load_labels=True):
         self.config = load_yaml_config(config_path)
+        # Shard workers (shard_extraction.py) point the inputs, outputs and checkpoint at their shard
+        self.config.update(overrides or {})
 
         self.batch_size = self.config.get("batch_size", 100)
         self.checkpoint_file = self.config.get("label_checkpoint_file")
@@ -110,53 +107,48 @@ class LabelExtractor:
 
         self.fuzzy_threshold = self.config.get("fuzzy_threshold", 90)
         self.essential_label_fields = self.config.get("essential_label_fields", [])
+        # Only these segment types are scanned; add "other" to also match dosing and general sentences
+        self.matched_segment_types = tuple(self.config.get("label_segment_types", DEFAULT_MATCHED_TYPES))
+        self.segment_cache = SegmentCache(self.config.get("segment_cache_size", 65536))
 
         ensure_output_dir(self.output_dir)
         self.checkpoint = load_checkpoint(self.checkpoint_file)
         self.offset = self.checkpoint.get("last_offset", 0)
 
-        # Load base NDC entries
-        with open(self.ndc_input_file, "r", encoding="utf-8") as f:
-            self.ndc_entries = [json.loads(line) for line in f]
+        self.compression = resolve_compression(self.config.get("jsonl_compression"))
+        self.read_workers = self.config.get("jsonl_read_workers")
+        # NDC entries are streamed from the checkpoint on in _extract_batches
+        self.ndc_total = count_jsonl(self.ndc_input_file)
 
-        # Load label entries
-        with open(self.label_input_file, "r", encoding="utf-8") as f:
-            self.label_entries = [json.loads(line) for line in f]
-
-        # Load enriched NDC entries (flattened)
+        # Map each product NDC to its enriched NDC entry (flattened). A shard's entries are a subset
+        # of the NDC file, so shards read the enrichment from the whole file (ndc_enrichment_file)
+        enrichment_file = self.config.get("ndc_enrichment_file") or self.ndc_input_file
         self.enriched_ndc_map = {}
-        if self.ndc_input_file and os.path.exists(self.ndc_input_file):
-            with open(self.ndc_input_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    entry = json.loads(line)
-                    product_ndc = entry.get("product_ndc")
-                    if product_ndc:
-                        # Store entire enriched NDC entry except product_ndc key (optional)
-                        ndc_flat = dict(entry)
-                        ndc_flat.pop("product_ndc", None)
-                        self.enriched_ndc_map[product_ndc] = ndc_flat
-
-        # Build a map from spl_id to label data for quick lookup
-        self.label_map = {}
-        for entry in self.label_entries:
-            spl_id = entry.get("spl_id")
-            if spl_id:
-                self.label_map[spl_id] = entry.get("label_data", {})
+        for entry in iter_jsonl(enrichment_file, workers=self.read_workers):
+            product_ndc = entry.get("product_ndc")
+            if product_ndc:
+                # Store entire enriched NDC entry except product_ndc key (optional)
+                ndc_flat = dict(entry)
+                ndc_flat.pop("product_ndc", None)
+                self.enriched_ndc_map[product_ndc] = ndc_flat
+
+        # Fused runs (fused_extraction.py) receive the labels with each batch instead
+        self.label_map = self.load_label_map() if load_labels else {}
 
         self.output_path = os.path.join(self.output_dir, "label_extracted_with_diseases.jsonl")
 
+    def load_label_map(self, spl_ids=None):
+        """{spl_id: label data} from the label file, restricted to `spl_ids` when given."""
+        label_map = {}
+        for entry in iter_jsonl(self.label_input_file, workers=self.read_workers):
+            spl_id = entry.get("spl_id")
+            if spl_id and (spl_ids is None or spl_id in spl_ids):
+                label_map[spl_id] = entry.get("label_data", {})
+        return label_map
+
     def extract_disease_mentions_from_label(self, label_data):
         mentions = []
 
-        section_blacklist = [
-            "limitations of use",
-            "warnings",
-            "precautions",
-            "not recommended",
-            "contraindicated",
-            "use in specific populations"
-        ]
-
         for field in self.essential_label_fields:
             raw_value = label_data.get(field)
             if not raw_value:
@@ -166,12 +158,15 @@ class LabelExtractor:
             if not text.strip():
                 continue
 
-            # ✨ Check for known cautionary sections in this chunk of text
-            lowered = text.lower()
-            if any(bad_section in lowered for bad_section in section_blacklist):
-                continue  # ❌ Skip this field entirely if it's likely a caution or exclusion section
+            # Cautionary segments ("Limitations of Use: ...", contraindications) are dropped
+            # sentence by sentence instead of discarding the whole field
+            segments = self.segment_cache.segments(text)
+            text = matched_text(segments, self.matched_segment_types)
+            metrics.incr("label_chars", sum(len(t) for _, t in segments))
+            metrics.incr("caution_segments", sum(1 for kind, _ in segments if kind == "caution"))
+            if not text:
+                continue
 
-            # ✅ Proceed with disease extraction
             mentions.extend(extract_diseases_from_text(text, self.flat_diseases, self.fuzzy_threshold))
 
         # Deduplicate across fields
@@ -183,51 +178,86 @@ class LabelExtractor:
 
         return list(seen.values())
 
-    def run(self):
-        while self.offset < len(self.ndc_entries):
-            end = min(self.offset + self.batch_size, len(self.ndc_entries))
-            batch = self.ndc_entries[self.offset:end]
-            extracted = []
+    def run(self, batches=None):
+        with metrics.profiled(self.config, "diseases"):
+            self._run(batches)
+
+    def _run(self, batches=None):
+        # Records written after the last checkpoint (by a run killed mid-batch) are dropped, so the
+        # resumed run writes every entry exactly once
+        output_bytes = self.checkpoint.get("output_bytes")
+        if output_bytes is not None:
+            truncate_jsonl(self.output_path, output_bytes)
+        with JsonlWriter(self.output_path, key_order=MENTION_KEY_ORDER, uppercase=True,
+                         compression=self.compression) as writer:
+            self._extract_batches(writer, batches)
+
+    def file_batches(self, start):
+        """(offset, NDC entries, self.label_map) batches of the NDC file from `start` on."""
+        entries = iter_jsonl(self.ndc_input_file, start=start, workers=self.read_workers)
+        while start < self.ndc_total:
+            batch = list(islice(entries, self.batch_size))
+            if not batch:
+                break
+            yield start, batch, self.label_map
+            start += len(batch)
+
+    def _extract_batches(self, writer, batches=None):
+        """
+        Extract mentions from (offset, NDC entries, {spl_id: label data}) batches, by default
+        the NDC file with the label file's labels. Entries before the checkpoint are skipped.
+        """
+        start = time.perf_counter()
+        processed = 0
+        for batch_start, batch, labels in batches if batches is not None else self.file_batches(self.offset):
+            if batch_start > self.offset:
+                raise ValueError(f"Batch at offset {batch_start} skips entries from offset {self.offset}")
+            batch = batch[self.offset - batch_start:]
+            if not batch:
+                continue
+            end = self.offset + len(batch)
 
             for entry in batch:
                 spl_id = entry.get("spl_id")
                 product_ndc = entry.get("product_ndc")
-                label_data = self.label_map.get(spl_id, {})
+                label_data = labels.get(spl_id, {})
 
                 if label_data:
-                    disease_mentions = self.extract_disease_mentions_from_label(label_data)
+                    with metrics.timer("label_extract"):
+                        disease_mentions = self.extract_disease_mentions_from_label(label_data)
+                    metrics.incr("disease_mentions", len(disease_mentions))
                 else:
                     disease_mentions = []
+                    metrics.incr("labels_missing")
 
                 ndc_info = self.enriched_ndc_map.get(product_ndc, {})
 
-                combined = {
+                # Uppercased and reordered (MENTION_KEY_ORDER) by the writer while encoding
+                writer.write({
                     "spl_id": spl_id,
                     "product_ndc": product_ndc,
                     "disease_mentions": disease_mentions,
                     **ndc_info
-                }
-
-                # Uppercase all values
-                combined = uppercase_all_text_values(combined)
-
-                # Reorder keys before writing
-                desired_key_order = ["spl_id", "product_ndc", "brand_name", "generic_name", "disease_mentions",
-                                     "route", "dosage_form", "labeler_name", "product_type"]
-                combined = reorder_fields(combined, desired_key_order)
-
-                extracted.append(combined)
-                time.sleep(0.05)
-
-            with open(self.output_path, "a", encoding="utf-8") as f:
-                for item in extracted:
-                    f.write(json.dumps(item) + "\n")
+                })
 
+            # The batch's records reach the file before the checkpoint moves past them
+            writer.flush()
             self.offset = end
             self.checkpoint["last_offset"] = self.offset
+            self.checkpoint["output_bytes"] = writer.tell()
             save_checkpoint(self.checkpoint_file, self.checkpoint)
+            processed += len(batch)
+            metrics.incr("labels_processed", len(batch))
+            metrics.emit(self.config, "diseases")
 
-            print(f"Processed entries {self.offset - self.batch_size} to {self.offset} of {len(self.ndc_entries)}")
+            rate = processed / max(time.perf_counter() - start, 1e-9)
+            print(f"Processed entries {end - len(batch)} to {self.offset} of {self.ndc_total} "
+                  f"({rate:.1f} entries/s)")
+
+
+def main(config_path="../params.yaml"):
+    extractor = LabelExtractor(config_path)
+    extractor.run()
 
 
 if __name__ == "__main__":
@@ -236,5 +266,4 @@ if __name__ == "__main__":
         print("Usage: python extract_diseases_from_labels.py path/to/params.yaml")
         sys.exit(1)
 
-    extractor = LabelExtractor(sys.argv[1])
-    extractor.run()
+    main(sys.argv[1])
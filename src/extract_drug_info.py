@@ -1,7 +1,7 @@
 import os
-import json
 import requests
 import time
+from itertools import islice
 from typing import Optional, Dict, Any
 from utils import (
     load_yaml_config,
@@ -10,6 +10,8 @@ from utils import (
     save_checkpoint,
     rate_limited_request,
 )
+from codec import JsonlWriter, iter_jsonl, count_jsonl, resolve_compression
+import metrics
 
 API_NDC = "https://api.fda.gov/drug/ndc.json"
 
@@ -32,6 +34,7 @@ class NDCExtractor:
         self.checkpoint = load_checkpoint(self.checkpoint_file)
         self.offset = self.checkpoint.get("last_offset", 0)
         self.output_path = os.path.join(self.output_dir, "ndc_extracted.jsonl")
+        self.compression = resolve_compression(self.config.get("jsonl_compression"))
 
     def build_query_url(self, skip):
         has_nested = any("." in f for f in self.essential_fields)
@@ -72,20 +75,26 @@ class NDCExtractor:
         response = rate_limited_request(self.session, url, max_retries=5)
         return response.json()
 
-    def save_results(self, entries):
-        with open(self.output_path, "a", encoding="utf-8") as f:
-            for entry in entries:
-                f.write(json.dumps(entry) + "\n")
+    def save_results(self, writer, entries):
+        writer.write_many(entries)
+        writer.flush()
 
     def update_checkpoint(self, offset):
         self.checkpoint["last_offset"] = offset
         save_checkpoint(self.checkpoint_file, self.checkpoint)
 
     def run(self):
+        with metrics.profiled(self.config, "ndc"), \
+                JsonlWriter(self.output_path, compression=self.compression) as writer:
+            self._run(writer)
+
+    def _run(self, writer):
         total = None
         records_fetched = 0
+        start = time.perf_counter()
         while True:
-            data = self.fetch_batch(self.offset)
+            with metrics.timer("ndc_batch_fetch"):
+                data = self.fetch_batch(self.offset)
             if total is None:
                 total = data.get("meta", {}).get("results", {}).get("total", 0)
                 print(f"Total records to process: {total}")
@@ -96,12 +105,16 @@ class NDCExtractor:
                 break
 
             filtered = [self.extract_fields(e) for e in results if self.filter_entry(e)]
-            self.save_results(filtered)
+            self.save_results(writer, filtered)
 
             records_fetched += len(results)
             self.offset += len(results)
             self.update_checkpoint(self.offset)
-            print(f"Fetched {records_fetched} / {total} records...")
+            metrics.incr("ndc_records_fetched", len(results))
+            metrics.incr("ndc_records_kept", len(filtered))
+            metrics.emit(self.config, "ndc")
+            rate = records_fetched / max(time.perf_counter() - start, 1e-9)
+            print(f"Fetched {records_fetched} / {total} records ({rate:.1f} records/s)...")
 
             if self.offset >= total:
                 print("Extraction finished successfully.")
@@ -120,18 +133,19 @@ class LabelExtractor:
             self.session.headers.update({"Authorization": f"Bearer {self.api_key}"})
 
         self.batch_size = self.config.get("batch_size", 100)
-        self.checkpoint_file = self.config.get("label_checkpoint_file")
-        self.output_dir = self.config.get("label_output_dir")
+        # Own checkpoint, and write to the file the disease extraction step reads (label_input_file)
+        self.checkpoint_file = self.config.get("label_fetch_checkpoint_file")
+        self.output_path = self.config.get("label_input_file")
+        self.output_dir = os.path.dirname(self.output_path)
         self.ndc_input_file = self.config.get("ndc_input_file")
         self.essential_fields = self.config.get("essential_label_fields", [])
 
         ensure_output_dir(self.output_dir)
         self.checkpoint = load_checkpoint(self.checkpoint_file)
         self.offset = self.checkpoint.get("last_offset", 0)
-        self.output_path = os.path.join(self.output_dir, "label_extracted.jsonl")
-
-        with open(self.ndc_input_file, "r", encoding="utf-8") as f:
-            self.ndc_entries = [json.loads(line) for line in f.readlines()]
+        self.compression = resolve_compression(self.config.get("jsonl_compression"))
+        self.read_workers = self.config.get("jsonl_read_workers")
+        self.ndc_total = count_jsonl(self.ndc_input_file)
 
     def get_nested_field(self, data, field_path):
         keys = field_path.split(".")
@@ -168,62 +182,107 @@ class LabelExtractor:
         return None
 
     def run(self):
-        total = len(self.ndc_entries)
+        with metrics.profiled(self.config, "labels"), \
+                JsonlWriter(self.output_path, compression=self.compression) as writer:
+            self._run(writer)
+
+    def label_record(self, entry):
+        """The label_extracted.jsonl record of one NDC entry, or None when its label is not found."""
+        flat_entry = {
+            (k[len("openfda."):]) if k.startswith("openfda.") else k: v
+            for k, v in entry.items()
+        }
+
+        spl_id = flat_entry.get("spl_id")
+        spl_set_id = flat_entry.get("spl_set_id", [None])[0] if isinstance(flat_entry.get("spl_set_id"),
+                                                                           list) else flat_entry.get(
+            "spl_set_id")
+
+        with metrics.timer("label_fetch"):
+            label_data = self.fetch_label(spl_id, spl_set_id)
+        metrics.incr("labels_found" if label_data else "labels_missing")
+        if not label_data:
+            return None
+
+        filtered_label_data = {
+            k: self.get_nested_field(label_data, k)
+            for k in self.essential_fields
+        }
+        return {
+            "product_ndc": flat_entry.get("product_ndc"),
+            "spl_id": spl_id,
+            "label_data": filtered_label_data
+        }
+
+    def _run(self, writer):
+        for _ in self.iter_batches(writer):
+            pass
+        print("Label extraction complete.")
+
+    def iter_batches(self, writer):
+        """
+        Fetch labels batch by batch from the checkpoint on. Each batch is written and checkpointed
+        before it is yielded, so a consumer (fused_extraction.py) only ever sees saved labels.
+
+        Yields:
+            tuple: (offset of the batch, its NDC entries, {spl_id: label_data} of the labels found)
+        """
+        total = self.ndc_total
+        start = time.perf_counter()
+        processed = 0
+        # Resumes at the checkpoint: chunked input seeks straight to it instead of reading it all
+        entries = iter_jsonl(self.ndc_input_file, start=self.offset, workers=self.read_workers)
         while self.offset < total:
-            end = min(self.offset + self.batch_size, total)
-            batch = self.ndc_entries[self.offset:end]
+            batch = list(islice(entries, self.batch_size))
+            if not batch:
+                break
+            end = self.offset + len(batch)
             extracted = []
 
             for entry in batch:
-                flat_entry = {
-                    (k[len("openfda."):]) if k.startswith("openfda.") else k: v
-                    for k, v in entry.items()
-                }
-
-                spl_id = flat_entry.get("spl_id")
-                spl_set_id = flat_entry.get("spl_set_id", [None])[0] if isinstance(flat_entry.get("spl_set_id"),
-                                                                                   list) else flat_entry.get(
-                    "spl_set_id")
-
-                label_data = self.fetch_label(spl_id, spl_set_id)
-
-                if label_data:
-                    filtered_label_data = {
-                        k: self.get_nested_field(label_data, k)
-                        for k in self.essential_fields
-                    }
-
-                    combined = {
-                        "product_ndc": flat_entry.get("product_ndc"),
-                        "spl_id": spl_id,
-                        "label_data": filtered_label_data
-                    }
-                    extracted.append(combined)
+                record = self.label_record(entry)
+                if record:
+                    extracted.append(record)
 
                 time.sleep(0.1)
 
-            with open(self.output_path, "a", encoding="utf-8") as f:
-                for item in extracted:
-                    f.write(json.dumps(item) + "\n")
+            writer.write_many(extracted)
+            writer.flush()
 
+            batch_start = self.offset
             self.offset = end
             self.checkpoint["last_offset"] = self.offset
             save_checkpoint(self.checkpoint_file, self.checkpoint)
+            processed += len(batch)
+            metrics.emit(self.config, "labels")
 
+            rate = processed / max(time.perf_counter() - start, 1e-9)
             print(
-                f"Extracted labels for {len(extracted)} of {len(batch)} entries from offset {self.offset - len(batch)} to {self.offset}")
+                f"Extracted labels for {len(extracted)} of {len(batch)} entries from offset {batch_start} to {self.offset} ({rate:.1f} entries/s)")
+            yield batch_start, batch, {r["spl_id"]: r["label_data"] for r in extracted if r["spl_id"]}
+
+
+def run_ndc_extraction(config_path="../params.yaml"):
+    NDCExtractor(config_path).run()
 
-        print("Label extraction complete.")
 
+def run_label_extraction(config_path="../params.yaml"):
+    LabelExtractor(config_path).run()
 
-def main():
-    # Uncomment to run NDC extraction
-    # ndc_extractor = NDCExtractor("../params.yaml")
-    # ndc_extractor.run()
 
-    label_extractor = LabelExtractor("../params.yaml")
-    label_extractor.run()
+def main(config_path="../params.yaml", steps=("ndc", "labels")):
+    if "ndc" in steps:
+        run_ndc_extraction(config_path)
+    if "labels" in steps:
+        run_label_extraction(config_path)
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fetch NDC records and their drug labels from openFDA.")
+    parser.add_argument("config", nargs="?", default="../params.yaml")
+    parser.add_argument("--step", choices=["ndc", "labels"], action="append",
+                        help="Run only this step (repeatable); both run by default")
+    args = parser.parse_args()
+    main(args.config, args.step or ("ndc", "labels"))
@@ -0,0 +1,137 @@
+import queue
+import argparse
+import threading
+from itertools import islice
+from collections import OrderedDict
+
+import metrics
+from codec import JsonlWriter, iter_jsonl
+from utils import load_yaml_config
+
+_DONE = object()
+
+
+class RecentLabels:
+    """
+    {spl_id: label data} of the most recently fetched labels, at most `max_size` of them. NDCs of
+    one SPL are usually close together in the input, so an entry whose own label fetch failed
+    still finds the label another NDC of its SPL fetched shortly before.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._labels = OrderedDict()
+
+    def update(self, labels):
+        for spl_id, label_data in labels.items():
+            self._labels[spl_id] = label_data
+            self._labels.move_to_end(spl_id)
+        while len(self._labels) > self.max_size:
+            self._labels.popitem(last=False)
+
+    def get(self, spl_id, default=None):
+        return self._labels.get(spl_id, default)
+
+
+def _put(batches, item, stop):
+    # Blocks while the queue is full (backpressure), but gives up once the extraction has stopped
+    with metrics.timer("fused_fetch_blocked"):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+    return False
+
+
+def _fetch_labels(fetcher, batches, stop):
+    """Fetcher thread: write and checkpoint label batches as label extraction does, then queue them."""
+    try:
+        with JsonlWriter(fetcher.output_path, compression=fetcher.compression) as writer:
+            for item in fetcher.iter_batches(writer):
+                if not _put(batches, item, stop):
+                    return
+        _put(batches, _DONE, stop)
+    except BaseException as e:
+        _put(batches, e, stop)
+
+
+def backlog_batches(extractor, end):
+    """
+    Batches from the disease checkpoint up to the label fetch checkpoint `end`: labels fetched by
+    an earlier (interrupted) run but not yet extracted, read back from the label file.
+    """
+    start = extractor.offset
+    if start >= end:
+        return
+    spl_ids = {entry.get("spl_id") for entry in islice(iter_jsonl(extractor.ndc_input_file, start=start), end - start)}
+    labels = extractor.load_label_map(spl_ids)
+    print(f"Extracting {end - start} entries whose labels were fetched by an earlier run")
+    entries = iter_jsonl(extractor.ndc_input_file, start=start, workers=extractor.read_workers)
+    while start < end:
+        batch = list(islice(entries, min(extractor.batch_size, end - start)))
+        if not batch:
+            break
+        yield start, batch, labels
+        start += len(batch)
+
+
+def queued_batches(batches, recent):
+    """Batches from the fetcher thread, in order, until it is done; re-raises its errors."""
+    while True:
+        with metrics.timer("fused_extract_idle"):
+            item = batches.get()
+        metrics.set_gauge("fused_queue_batches", batches.qsize())
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        batch_start, batch, labels = item
+        recent.update(labels)
+        yield batch_start, batch, recent
+
+
+def run_fused_extraction(config_path="../params.yaml"):
+    """
+    Label fetching and disease extraction at once: a fetcher thread waits on openFDA while the
+    main thread extracts mentions from the batches it has fetched. At most `fused_queue_batches`
+    fetched batches wait in between; when extraction falls behind, the fetcher blocks. Each step
+    keeps its own output and checkpoint, exactly as when run one after the other, so either can
+    later be resumed or rerun on its own.
+    """
+    from extract_drug_info import LabelExtractor as LabelFetcher
+    from extract_diseases_from_labels import LabelExtractor as DiseaseExtractor
+
+    config = load_yaml_config(config_path)
+    fetcher = LabelFetcher(config_path)
+    extractor = DiseaseExtractor(config_path, load_labels=False)
+    recent = RecentLabels(max(config.get("fused_label_cache_size", 4096), fetcher.batch_size))
+
+    batches = queue.Queue(maxsize=max(1, config.get("fused_queue_batches", 4)))
+    stop = threading.Event()
+    fetch_start = fetcher.offset
+    thread = threading.Thread(target=_fetch_labels, args=(fetcher, batches, stop), name="label-fetcher",
+                              daemon=True)
+
+    def fused_batches():
+        yield from backlog_batches(extractor, fetch_start)
+        yield from queued_batches(batches, recent)
+
+    print(f"Fused extraction: labels from offset {fetch_start}, diseases from offset {extractor.offset}")
+    with metrics.profiled(config, "labels_diseases"):
+        thread.start()
+        try:
+            extractor.run(fused_batches())
+        finally:
+            # Lets a fetcher blocked on the full queue exit; it finishes and checkpoints its batch first
+            stop.set()
+            thread.join()
+    print("Fused label and disease extraction complete.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch labels and extract diseases from them concurrently.")
+    parser.add_argument("config", nargs="?", default="../params.yaml")
+    args = parser.parse_args()
+    run_fused_extraction(args.config)
@@ -0,0 +1,210 @@
+import numpy as np
+
+NODE_TYPE_CODES = {"Medication": 0, "Indication": 1}
+SIZE_METRICS = ("pagerank", "hits", "betweenness", "degree")
+
+
+def edge_arrays(graph, node_ids, weight=None):
+    """
+    Edges as (src, dst, w) arrays over integer node IDs, oriented Medication -> Indication where
+    the edge joins the two types. Weights are log-damped as in the layout, 1 when `weight` is None.
+    """
+    m = graph.number_of_edges()
+    src = np.empty(m, dtype=np.int64)
+    dst = np.empty(m, dtype=np.int64)
+    w = np.ones(m, dtype=np.float64)
+    for k, (u, v, data) in enumerate(graph.edges(data=True)):
+        if graph.nodes[u].get("type") == "Indication" and graph.nodes[v].get("type") == "Medication":
+            u, v = v, u
+        src[k], dst[k] = node_ids[u], node_ids[v]
+        if weight is not None:
+            w[k] = float(data.get(weight, 1.0))
+    return src, dst, 1.0 + np.log(np.maximum(w, 1.0))
+
+
+def pagerank(n, src, dst, w, alpha=0.85, tol=1e-10, max_iter=200):
+    """
+    PageRank of an undirected weighted graph by power iteration; each step is two bincount
+    sparse products over the edge arrays. Dangling (isolated) nodes spread their rank uniformly.
+    """
+    if n == 0:
+        return np.zeros(0)
+    strength = np.bincount(src, weights=w, minlength=n) + np.bincount(dst, weights=w, minlength=n)
+    dangling = strength == 0
+    inv_strength = np.divide(1.0, strength, out=np.zeros(n), where=~dangling)
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        share = rank * inv_strength
+        spread = np.bincount(dst, weights=w * share[src], minlength=n) + np.bincount(src, weights=w * share[dst],
+                                                                                  minlength=n)
+        new = alpha * (spread + rank[dangling].sum() / n) + (1.0 - alpha) / n
+        done = np.abs(new - rank).sum() < n * tol
+        rank = new
+        if done:
+            break
+    return rank / rank.sum()
+
+
+def hits(n, src, dst, w, tol=1e-10, max_iter=200):
+    """
+    HITS over the edges directed Medication -> Indication: a drug is a good hub when it treats
+    authoritative indications, an indication a good authority when good hubs treat it.
+
+    Returns:
+        tuple: (hubs, authorities), each summing to 1.
+    """
+    if len(src) == 0:
+        return np.zeros(n), np.zeros(n)
+    hubs = np.full(n, 1.0 / n)
+    authorities = hubs
+    for _ in range(max_iter):
+        authorities = np.bincount(dst, weights=w * hubs[src], minlength=n)
+        authorities /= authorities.sum()
+        new = np.bincount(src, weights=w * authorities[dst], minlength=n)
+        new /= new.sum()
+        done = np.abs(new - hubs).sum() < n * tol
+        hubs = new
+        if done:
+            break
+    return hubs, authorities
+
+
+def approximate_betweenness(n, src, dst, samples=256, seed=42):
+    """
+    Betweenness centrality estimated from `samples` random BFS sources (Brandes, unweighted).
+    Each BFS expands a whole level at once over the CSR adjacency; path counts and dependencies
+    are accumulated per level with bincount. Exact when samples >= n.
+    """
+    scores = np.zeros(n)
+    if n == 0 or len(src) == 0:
+        return scores
+    # Symmetric CSR adjacency
+    rows = np.concatenate([src, dst])
+    cols = np.concatenate([dst, src])
+    order = np.argsort(rows, kind="stable")
+    indices = cols[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+    k = min(samples, n)
+    sources = np.random.default_rng(seed).choice(n, size=k, replace=False) if k < n else np.arange(n)
+    for source in sources:
+        dist = np.full(n, -1, dtype=np.int64)
+        sigma = np.zeros(n)
+        dist[source], sigma[source] = 0, 1.0
+        frontier = np.array([source])
+        levels = []   # (parents, children) of the shortest-path edges between consecutive levels
+        depth = 0
+        while len(frontier):
+            starts = indptr[frontier]
+            lengths = indptr[frontier + 1] - starts
+            parents = np.repeat(frontier, lengths)
+            offsets = np.arange(len(parents)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            children = indices[starts.repeat(lengths) + offsets]
+            unseen = dist[children] < 0
+            dist[children[unseen]] = depth + 1
+            on_path = dist[children] == depth + 1
+            parents, children = parents[on_path], children[on_path]
+            sigma += np.bincount(children, weights=sigma[parents], minlength=n)
+            levels.append((parents, children))
+            frontier = np.unique(children)
+            depth += 1
+
+        delta = np.zeros(n)
+        for parents, children in reversed(levels):
+            delta += np.bincount(parents, weights=sigma[parents] / sigma[children] * (1.0 + delta[children]),
+                                 minlength=n)
+        delta[source] = 0.0
+        scores += delta
+    # Every undirected path is counted from both ends when all sources are used
+    return scores * (n / k) / 2.0
+
+
+def normalize_by_group(values, groups):
+    """values / max(values in the same group), so each group's most central node scores 1."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    _, inverse = np.unique(groups, return_inverse=True)
+    group_max = np.zeros(inverse.max() + 1)
+    np.maximum.at(group_max, inverse, values)
+    return np.divide(values, group_max[inverse], out=np.zeros_like(values), where=group_max[inverse] > 0)
+
+
+def rank_by_group(values, groups):
+    """1-based rank of each value within its group, highest first, ties broken by position."""
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.asarray(groups)
+    order = np.lexsort((np.arange(len(values)), -values, groups))
+    ranks = np.empty(len(values), dtype=np.int64)
+    sorted_groups = groups[order]
+    starts = np.r_[0, np.nonzero(sorted_groups[1:] != sorted_groups[:-1])[0] + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(values)]))
+    ranks[order] = np.arange(len(values)) - group_start + 1
+    return ranks
+
+
+def compute_graph_analytics(graph, node_ids, weight="evidence", betweenness_samples=256, seed=42):
+    """
+    Centrality of every node, as arrays indexed by node ID, also stored as node attributes
+    (pagerank, hits, betweenness, cluster_centrality).
+
+    Args:
+        graph (nx.Graph): Clustered bipartite graph (node attributes type and cluster_id).
+        node_ids (dict): {node: integer ID} as used in the page.
+        weight (str): Edge attribute weighting PageRank and HITS.
+        betweenness_samples (int): BFS sources for approximate betweenness.
+
+    Returns:
+        dict: {"type", "cluster", "degree", "pagerank", "hits", "betweenness", "cluster_centrality",
+        "type_rank", "cluster_rank"}; hits is the hub score of drugs and the authority score of
+        indications, cluster_centrality is PageRank relative to the top node of the node's cluster.
+    """
+    n = len(node_ids)
+    nodes = [None] * n
+    for node, i in node_ids.items():
+        nodes[i] = node
+    types = np.array([NODE_TYPE_CODES.get(graph.nodes[node].get("type"), -1) for node in nodes], dtype=np.int64)
+    clusters = np.array([graph.nodes[node].get("cluster_id", -1) for node in nodes], dtype=np.int64)
+
+    src, dst, w = edge_arrays(graph, node_ids, weight)
+    degree = (np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)).astype(np.float64)
+    rank = pagerank(n, src, dst, w)
+    hubs, authorities = hits(n, src, dst, w)
+    hits_score = np.where(types == NODE_TYPE_CODES["Indication"], authorities, hubs)
+    betweenness = approximate_betweenness(n, src, dst, betweenness_samples, seed)
+
+    # Unclustered nodes (indications) are grouped per node type
+    groups = np.where(clusters >= 0, clusters, -1 - types)
+    results = {
+        "type": types,
+        "cluster": clusters,
+        "degree": degree,
+        "pagerank": rank,
+        "hits": hits_score,
+        "betweenness": betweenness,
+        "cluster_centrality": normalize_by_group(rank, groups),
+        "type_rank": rank_by_group(rank, types),
+        "cluster_rank": rank_by_group(rank, groups),
+    }
+    for name in ("pagerank", "hits", "betweenness", "cluster_centrality"):
+        values = results[name].tolist()
+        for i, node in enumerate(nodes):
+            graph.nodes[node][name] = values[i]
+    return results
+
+
+def metric_sizes(analytics, metric="pagerank", min_size=10, max_size=40):
+    """
+    Node sizes from a centrality metric: the square root of the score relative to the most
+    central node of the same type, mapped onto [min_size, max_size]. Mirrored by metricSizes()
+    in the page's graph worker.
+    """
+    relative = normalize_by_group(analytics[metric], analytics["type"])
+    return min_size + (max_size - min_size) * np.sqrt(relative)
+
+
+def centrality_payload(analytics, digits=4):
+    """Per-node scores for the page, relative to the top node of each type and rounded."""
+    return {name: [float(f"{v:.{digits}g}") for v in normalize_by_group(analytics[name], analytics["type"])]
+            for name in SIZE_METRICS}
@@ -0,0 +1,335 @@
+import asyncio
+import hashlib
+import traceback
+import argparse
+from bisect import bisect_left
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+
+from graph_index import DrugGraphIndex
+from graph_export import normalize_search_text, SEARCH_ALIAS_KINDS
+from utils import load_yaml_config
+from codec import dumps
+import metrics
+
+NODE_TABLES = {"Medication": "drugs", "Indication": "indications"}
+NEIGHBOUR_RELATIONS = {"drugs": "drug_indications", "indications": "indication_drugs"}
+MAX_REQUEST_BYTES = 16 * 1024
+STATUS_TEXT = {200: "OK", 204: "No Content", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(params, name, default, lo, hi):
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    return max(lo, min(hi, value))
+
+
+class GraphQueryService:
+    """
+    JSON queries over a DrugGraphIndex: search, neighbours, k-hop subgraphs and clusters.
+    Independent of HTTP: `respond(path, params)` returns (status, body bytes, etag), and
+    identical requests are answered from an LRU cache of encoded responses.
+    """
+
+    def __init__(self, index, cache_size=4096, max_limit=500, max_khop_nodes=5000):
+        self.index = index
+        self.cache_size = cache_size
+        self.max_limit = max_limit
+        self.max_khop_nodes = max_khop_nodes
+        self._cache = OrderedDict()
+        self._build_search_index()
+        self.routes = {
+            "/health": self.health,
+            "/search": self.search,
+            "/neighbors": self.neighbors,
+            "/khop": self.khop,
+            "/clusters": self.clusters,
+        }
+
+    def _build_search_index(self):
+        # Same entries, matching and ranking as the page's search (graph_export.build_search_index)
+        entries = set()
+        for node_type, table in NODE_TABLES.items():
+            for name in self.index.tables[table]:
+                entries.add((normalize_search_text(name), SEARCH_ALIAS_KINDS["label"], node_type, name))
+        drugs = self.index.tables["drugs"]
+        for relation, table, kind in [("generic_brands", "generics", "generic_name"),
+                                      ("ndc_brands", "ndcs", "product_ndc")]:
+            for alias_id, alias in enumerate(self.index.tables[table]):
+                for drug_id in self.index.related_ids(relation, alias_id).tolist():
+                    entries.add((normalize_search_text(alias), SEARCH_ALIAS_KINDS[kind], "Medication", drugs[drug_id]))
+        self.search_entries = sorted(entries)
+        self.search_texts = [e[0] for e in self.search_entries]
+        self.trigrams = {}
+        for entry_id, text in enumerate(self.search_texts):
+            for tri in {text[i:i + 3] for i in range(len(text) - 2)}:
+                self.trigrams.setdefault(tri, []).append(entry_id)
+
+    # --- HTTP-independent entry point ---
+
+    def respond(self, path, params):
+        key = (path, tuple(sorted(params.items())))
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            metrics.incr("api_cache_hits")
+            return cached
+        metrics.incr("api_cache_misses")
+
+        handler = self.routes.get(path)
+        if handler is None and path.startswith("/clusters/"):
+            handler = self.cluster_members
+        try:
+            if handler is None:
+                raise ApiError(404, f"Unknown endpoint {path}")
+            status, body = 200, dumps(handler(path, params))
+        except ApiError as e:
+            status, body = e.status, dumps({"error": str(e)})
+        except Exception:
+            # A failure may be transient (or fixed by a restart), so it is neither cached nor given an ETag
+            print(f"Error handling {path} {params}:\n{traceback.format_exc()}", end="")
+            metrics.incr("api_errors")
+            return 500, dumps({"error": STATUS_TEXT[500]}), None
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        response = (status, body, etag)
+        # The index is read-only, so every response (client errors included) stays valid until restart
+        self._cache[key] = response
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return response
+
+    def _page(self, params):
+        offset = _int_param(params, "offset", 0, 0, 1 << 31)
+        limit = _int_param(params, "limit", 50, 1, self.max_limit)
+        return offset, limit
+
+    @staticmethod
+    def _paginated(items, offset, limit, **extra):
+        page = items[offset:offset + limit]
+        next_offset = offset + limit if offset + limit < len(items) else None
+        return dict(extra, total=len(items), offset=offset, limit=limit, next_offset=next_offset, results=page)
+
+    def _resolve(self, params):
+        """(table, ID) of the `node` parameter, restricted to `type` (Medication/Indication) if given."""
+        name = params.get("node")
+        if not name:
+            raise ApiError(400, "node is required")
+        node_type = params.get("type")
+        if node_type and node_type not in NODE_TABLES:
+            raise ApiError(400, f"type must be one of {sorted(NODE_TABLES)}")
+        for candidate_type, table in NODE_TABLES.items():
+            if node_type in (None, "", candidate_type):
+                node_id = self.index.id_of(table, name)
+                if node_id is not None:
+                    return table, node_id
+        raise ApiError(404, f"No node named {name!r}")
+
+    def _gather(self, relation, ids):
+        """Concatenated related IDs of all `ids`, in one take over the CSR arrays."""
+        indptr = self.index.arrays[f"{relation}_indptr"]
+        indices = self.index.arrays[f"{relation}_indices"]
+        starts = indptr[ids]
+        lengths = indptr[ids + 1] - starts
+        owner = np.repeat(np.arange(len(ids)), lengths)
+        offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return indices[starts[owner] + offsets]
+
+    # --- Endpoints ---
+
+    def health(self, path, params):
+        return {"status": "ok", "stats": self.index.stats(), "cached_responses": len(self._cache)}
+
+    def search(self, path, params):
+        """/search?q=...&limit=&offset= -> [{name, type, text, kind}], best match first."""
+        query = normalize_search_text(params.get("q", ""))
+        offset, limit = self._page(params)
+        if not query:
+            return self._paginated([], offset, limit, query=query)
+
+        if len(query) < 3:
+            start = bisect_left(self.search_texts, query)
+            candidates = []
+            for i in range(start, len(self.search_texts)):
+                if not self.search_texts[i].startswith(query) or len(candidates) >= 200:
+                    break
+                candidates.append(i)
+        else:
+            # The rarest trigram bounds the candidate set; each candidate is then verified directly
+            postings = [self.trigrams.get(query[i:i + 3], []) for i in range(len(query) - 2)]
+            smallest = min(postings, key=len)
+            candidates = [i for i in smallest if query in self.search_texts[i]]
+
+        def rank(i):
+            text, kind = self.search_texts[i], self.search_entries[i][1]
+            score = 0 if text == query else 1 if text.startswith(query) else 2 if (" " + query) in text else 3
+            return score, kind, len(text), i
+
+        results, seen = [], set()
+        for i in sorted(candidates, key=rank):
+            text, kind, node_type, name = self.search_entries[i]
+            if (node_type, name) in seen:
+                continue
+            seen.add((node_type, name))
+            results.append({"name": name, "type": node_type, "text": text, "kind": kind})
+        return self._paginated(results, offset, limit, query=query)
+
+    def neighbors(self, path, params):
+        """/neighbors?node=...&type=&limit=&offset= -> indications of a drug, or drugs of an indication."""
+        table, node_id = self._resolve(params)
+        offset, limit = self._page(params)
+        other_table = "indications" if table == "drugs" else "drugs"
+        other_type = "Indication" if table == "drugs" else "Medication"
+        names = self.index.tables[other_table]
+        related = self.index.related_ids(NEIGHBOUR_RELATIONS[table], node_id).tolist()
+        items = [{"name": names[i], "type": other_type} for i in related]
+        return self._paginated(items, offset, limit, node=self.index.tables[table][node_id])
+
+    def khop(self, path, params):
+        """
+        /khop?node=...&type=&hops=&max_nodes= -> every node within `hops` edges, with its distance.
+        Hops alternate between drugs and indications; the result is cut off after `max_nodes`.
+        """
+        table, node_id = self._resolve(params)
+        hops = _int_param(params, "hops", 2, 0, 10)
+        max_nodes = _int_param(params, "max_nodes", self.max_khop_nodes, 1, self.max_khop_nodes)
+
+        seen = {t: np.zeros(len(self.index.tables[t]), dtype=bool) for t in NEIGHBOUR_RELATIONS}
+        seen[table][node_id] = True
+        frontier = np.array([node_id])
+        nodes = [{"name": self.index.tables[table][node_id], "type": "Medication" if table == "drugs"
+                  else "Indication", "hop": 0}]
+        truncated = False
+        for hop in range(1, hops + 1):
+            next_table = "indications" if table == "drugs" else "drugs"
+            reached = np.unique(self._gather(NEIGHBOUR_RELATIONS[table], frontier))
+            reached = reached[~seen[next_table][reached]]
+            if len(nodes) + len(reached) > max_nodes:
+                reached = reached[:max_nodes - len(nodes)]
+                truncated = True
+            seen[next_table][reached] = True
+            names = self.index.tables[next_table]
+            node_type = "Medication" if next_table == "drugs" else "Indication"
+            nodes.extend({"name": names[i], "type": node_type, "hop": hop} for i in reached.tolist())
+            table, frontier = next_table, reached
+            if truncated or len(frontier) == 0:
+                break
+        return {"node": nodes[0]["name"], "hops": hops, "truncated": truncated, "total": len(nodes), "results": nodes}
+
+    def clusters(self, path, params):
+        """/clusters?limit=&offset= -> [{id, label, size}]"""
+        offset, limit = self._page(params)
+        indptr = self.index.arrays["cluster_drugs_indptr"]
+        sizes = np.diff(indptr).tolist()
+        items = [{"id": cid, "label": label, "size": sizes[cid]}
+                 for cid, label in enumerate(self.index.tables["clusters"])]
+        return self._paginated(items, offset, limit)
+
+    def cluster_members(self, path, params):
+        """/clusters/<id>?limit=&offset= -> drugs in the cluster"""
+        try:
+            cluster_id = int(path.rsplit("/", 1)[1])
+        except ValueError:
+            raise ApiError(400, "cluster ID must be an integer")
+        if not 0 <= cluster_id < len(self.index.tables["clusters"]):
+            raise ApiError(404, f"No cluster {cluster_id}")
+        offset, limit = self._page(params)
+        items = [{"name": name, "type": "Medication"} for name in self.index.cluster_members(cluster_id)]
+        return self._paginated(items, offset, limit, id=cluster_id, label=self.index.tables["clusters"][cluster_id])
+
+
+def _http_response(status, body, etag=None, keep_alive=True, head_only=False):
+    headers = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Unknown')}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        # The page may be opened from file:// or another local port
+        "Access-Control-Allow-Origin: *",
+        "Cache-Control: no-store" if status >= 500 else "Cache-Control: public, max-age=300",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if etag:
+        headers.append(f"ETag: {etag}")
+    head = ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1")
+    return head if head_only or status in (204, 304) else head + body
+
+
+async def _handle_connection(service, reader, writer):
+    # Minimal HTTP/1.1: GET/HEAD with keep-alive, no request bodies
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, version = lines[0].split(" ", 2)
+            except ValueError:
+                writer.write(_http_response(400, dumps({"error": "malformed request line"}), keep_alive=False))
+                break
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+            if method == "OPTIONS":
+                writer.write(_http_response(204, b"", keep_alive=keep_alive))
+            elif method not in ("GET", "HEAD"):
+                writer.write(_http_response(405, dumps({"error": f"{method} not allowed"}), keep_alive=keep_alive))
+            else:
+                url = urlsplit(target)
+                with metrics.timer("api_request"):
+                    status, body, etag = service.respond(url.path.rstrip("/") or "/", dict(parse_qsl(url.query)))
+                metrics.incr("api_requests")
+                if status == 200 and headers.get("if-none-match") == etag:
+                    status = 304
+                writer.write(_http_response(status, body, etag, keep_alive, head_only=method == "HEAD"))
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=8765):
+    server = await asyncio.start_server(lambda r, w: _handle_connection(service, r, w), host, port,
+                                        limit=MAX_REQUEST_BYTES)
+    print(f"Graph API listening on http://{host}:{port} ({service.index.stats()})")
+    async with server:
+        await server.serve_forever()
+
+
+def main(config_path="../params.yaml", host=None, port=None):
+    config = load_yaml_config(config_path)
+    index = DrugGraphIndex.load(config.get("graph_index_dir", "../data/graph_index"))
+    service = GraphQueryService(index, cache_size=config.get("graph_api_cache_size", 4096))
+    try:
+        asyncio.run(serve(service, host or config.get("graph_api_host", "127.0.0.1"),
+                          port or config.get("graph_api_port", 8765)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve read-only JSON queries over the graph index snapshot.")
+    parser.add_argument("config", nargs="?", default="../params.yaml")
+    parser.add_argument("--host", help="Bind address (default graph_api_host, 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="Port (default graph_api_port)")
+    args = parser.parse_args()
+    main(args.config, args.host, args.port)
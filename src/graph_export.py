@@ -0,0 +1,166 @@
+import re
+
+from utils import decode_attr_values
+
+NODE_TYPE_CODES = {"Medication": 0, "Indication": 1}
+DETAIL_SHARD_SIZE = 256
+SEARCH_ALIAS_KINDS = {"label": 0, "generic_name": 1, "product_ndc": 2}
+
+
+def assign_node_ids(graph):
+    """Map every node to a dense integer ID, in graph insertion order."""
+    return {node: i for i, node in enumerate(graph.nodes())}
+
+
+def build_csr_adjacency(graph, node_ids):
+    """
+    Compressed sparse row adjacency over integer node IDs: the neighbours of node i are
+    indices[indptr[i]:indptr[i + 1]], sorted ascending.
+    """
+    by_id = sorted(node_ids.items(), key=lambda item: item[1])
+    indptr = [0]
+    indices = []
+    for node, _ in by_id:
+        indices.extend(sorted(node_ids[nb] for nb in graph.neighbors(node)))
+        indptr.append(len(indices))
+    return indptr, indices
+
+
+def build_graph_payload(graph, node_ids, positions, sizes, cluster_labels, lod_map=None, lod_mode=False,
+                        centrality=None, size_metric=None):
+    """
+    Build the compact page payload: parallel per-node arrays indexed by integer ID, a flat
+    edge list [src0, dst0, src1, dst1, ...] and the same edges as CSR adjacency. `centrality`
+    ({metric: per-node score}, graph_analytics.centrality_payload) lets the page resize nodes by
+    another metric than `size_metric`, the one `sizes` were computed from.
+    """
+    lod_map = lod_map or {}
+    n = len(node_ids)
+    labels = [None] * n
+    types = [0] * n
+    clusters = [-1] * n
+    lod = [-1] * n
+    xs = [0.0] * n
+    ys = [0.0] * n
+    node_sizes = [0] * n
+
+    for node, i in node_ids.items():
+        data = graph.nodes[node]
+        labels[i] = str(node)
+        types[i] = NODE_TYPE_CODES.get(data.get("type"), -1)
+        clusters[i] = data.get("cluster_id", -1)
+        lod[i] = lod_map.get(node, -1)
+        xs[i], ys[i] = positions.get(node, (0.0, 0.0))
+        node_sizes[i] = sizes.get(node, 0)
+
+    edges = []
+    for source, target in graph.edges():
+        edges.append(node_ids[source])
+        edges.append(node_ids[target])
+    indptr, indices = build_csr_adjacency(graph, node_ids)
+
+    return {
+        "version": 1,
+        "types": {name: code for name, code in NODE_TYPE_CODES.items()},
+        "labels": labels,
+        "type": types,
+        "cluster": clusters,
+        "lod": lod,
+        "lodMode": bool(lod_mode),
+        "x": xs,
+        "y": ys,
+        "size": node_sizes,
+        "edges": edges,
+        "indptr": indptr,
+        "indices": indices,
+        "clusterLabels": {str(k): v for k, v in cluster_labels.items()},
+        "centrality": centrality or {},
+        "sizeMetric": size_metric,
+    }
+
+
+def write_detail_shards(details, bundler, shard_size=DETAIL_SHARD_SIZE, prefix="data/details"):
+    """
+    Write per-node detail HTML into shards of `shard_size` consecutive node IDs, so the page
+    fetches one small file the first time a node in that range is clicked. Each shard is a
+    separately hashed asset, so a rebuild only changes the URLs of shards whose nodes changed.
+
+    Args:
+        details (dict): {node_id (int): html}
+        bundler (AssetBundler): Receives the `<prefix>/<shard>.json` assets.
+        shard_size (int): Node IDs per shard.
+
+    Returns:
+        dict: {shard (str): hashed site-relative path}
+    """
+    shards = {}
+    for node_id, html in details.items():
+        shards.setdefault(node_id // shard_size, {})[str(node_id)] = html
+
+    return {str(shard): bundler.add_json(f"{prefix}/{shard}.json", entries)
+            for shard, entries in sorted(shards.items())}
+
+
+def normalize_search_text(text):
+    # Must match normalizeQuery() in graph_worker_script
+    return re.sub(r"\s+", " ", str(text).lower()).strip()
+
+
+def build_search_index(graph, node_ids, products):
+    """
+    Build the search bar index: one entry per searchable string (node label, generic name, NDC),
+    sorted by normalized text for prefix lookups, plus a trigram -> entry posting list for
+    substring lookups.
+
+    Args:
+        graph (nx.Graph): Drug-indication graph.
+        node_ids (dict): {node: integer ID} as used in the page.
+        products (ProductTable): Product attributes of each brand (utils.product_table).
+
+    Returns:
+        dict: {"text": [...], "node": [...], "kind": [...], "kinds": {...}, "trigrams": {tri: [entry, ...]}}
+    """
+    entries = set()
+    for node, node_id in node_ids.items():
+        entries.add((normalize_search_text(node), node_id, SEARCH_ALIAS_KINDS["label"]))
+        if graph.nodes[node].get("type") != "Medication":
+            continue
+        for field in ("generic_name", "product_ndc"):
+            for value in products.brand_values(node, field):
+                for alias in decode_attr_values(value):
+                    text = normalize_search_text(alias)
+                    if text and text != "unknown":
+                        entries.add((text, node_id, SEARCH_ALIAS_KINDS[field]))
+
+    ordered = sorted(entries)
+    trigrams = {}
+    for entry_id, (text, _, _) in enumerate(ordered):
+        for tri in {text[i:i + 3] for i in range(len(text) - 2)}:
+            trigrams.setdefault(tri, []).append(entry_id)
+
+    return {
+        "text": [e[0] for e in ordered],
+        "node": [e[1] for e in ordered],
+        "kind": [e[2] for e in ordered],
+        "kinds": {name: code for name, code in SEARCH_ALIAS_KINDS.items()},
+        # Sorted keys keep the file byte-identical between builds, so its hashed URL stays cached
+        "trigrams": dict(sorted(trigrams.items())),
+    }
+
+
+def export_graph_data(bundler, payload, details, search_index, shard_size=DETAIL_SHARD_SIZE):
+    """
+    Add the graph payload, search index and detail shards to the site as hashed assets.
+
+    Returns:
+        dict: Asset paths for the page (`graphDataPaths`).
+    """
+    detail_shards = write_detail_shards(details, bundler, shard_size)
+    paths = {
+        "graph": bundler.add_json("data/graph.json", payload),
+        "search": bundler.add_json("data/search_index.json", search_index),
+        "detailShards": detail_shards,
+        "detailShardSize": shard_size,
+    }
+    print(f"Graph payload saved to {paths['graph']} with {len(detail_shards)} detail shards")
+    return paths
@@ -0,0 +1,383 @@
+import os
+import time
+import argparse
+
+import networkx as nx
+
+import metrics
+from codec import JsonlWriter, iter_jsonl, loads, dumps, remove_jsonl, replace_jsonl, resolve_compression
+from graph_index import normalize_key
+from utils import load_yaml_config, ensure_output_dir
+
+HISTORY_VERSION = 1
+VERSIONS_FILE = "versions.jsonl"
+EVENTS_FILE = "events.jsonl"
+
+# History layout in graph_history_dir:
+#   versions.jsonl        one line per committed version: {"version", "created", "source", "nodes",
+#                         "edges", "changes", "checkpoint"}; appending it is what commits a version
+#   v000002.delta.jsonl   changes against the previous version, one op per line:
+#                         {"op": "node+" | "node-" | "node~" | "edge+" | "edge-" | "edge~", ...}
+#   v000001.full.jsonl    full snapshot (node+ / edge+ ops) written every checkpoint_every versions
+#   events.jsonl          one line per version naming the nodes and edges it added, removed or
+#                         changed, so history queries never reconstruct a graph
+# Edges are keyed by their sorted endpoint pair; attribute values are the graph's GraphML scalars.
+
+
+def graph_state(graph):
+    """
+    ({node: attrs}, {(u, v): attrs}) of a graph, with attributes reduced to GraphML scalars
+    (graphml_graph), the same values a written .graphml file holds.
+    """
+    from build_drug_graph import graphml_graph
+
+    graph = graphml_graph(graph)
+    nodes = {str(node): dict(data) for node, data in graph.nodes(data=True)}
+    edges = {_edge_key(u, v): dict(data) for u, v, data in graph.edges(data=True)}
+    return nodes, edges
+
+
+def _edge_key(u, v):
+    u, v = str(u), str(v)
+    return (u, v) if u <= v else (v, u)
+
+
+_MISSING = object()
+
+
+def _attr_changes(old, new):
+    changed = {k: v for k, v in new.items() if old.get(k, _MISSING) != v}
+    removed = sorted(k for k in old if k not in new)
+    return changed, removed
+
+
+def diff_states(old, new):
+    """
+    Ops turning state `old` into `new` (see graph_state), nodes before edges.
+
+    Returns:
+        list of dict: The delta, as stored one op per line.
+    """
+    old_nodes, old_edges = old
+    new_nodes, new_edges = new
+    ops = []
+    for kind, before, after, key_fields in (("node", old_nodes, new_nodes, ("id",)),
+                                            ("edge", old_edges, new_edges, ("u", "v"))):
+        def keyed(key):
+            return dict(zip(key_fields, (key,) if kind == "node" else key))
+
+        for key, attrs in after.items():
+            if key not in before:
+                ops.append({"op": f"{kind}+", **keyed(key), "attrs": attrs})
+                continue
+            changed, removed = _attr_changes(before[key], attrs)
+            if changed or removed:
+                ops.append({"op": f"{kind}~", **keyed(key), "set": changed, "unset": removed})
+        ops.extend({"op": f"{kind}-", **keyed(key)} for key in before if key not in after)
+    return ops
+
+
+def apply_ops(state, ops):
+    """Apply delta ops to a state in place."""
+    nodes, edges = state
+    for op in ops:
+        kind = op["op"]
+        if kind[:4] == "node":
+            table, key = nodes, op["id"]
+        else:
+            table, key = edges, (op["u"], op["v"])
+        if kind[4] == "+":
+            table[key] = dict(op["attrs"])
+        elif kind[4] == "-":
+            table.pop(key, None)
+        else:
+            attrs = table[key]
+            attrs.update(op["set"])
+            for name in op["unset"]:
+                attrs.pop(name, None)
+    return state
+
+
+def summarize_ops(ops):
+    """{"nodes+": [...], "nodes-": [...], "nodes~": [...], "edges+": [[u, v], ...], ...} of a delta."""
+    summary = {f"{kind}s{sign}": [] for kind in ("node", "edge") for sign in "+-~"}
+    for op in ops:
+        kind = op["op"]
+        summary[f"{kind[:4]}s{kind[4]}"].append(op["id"] if kind[:4] == "node" else [op["u"], op["v"]])
+    return summary
+
+
+def _read_log(path):
+    """
+    Records of an append-only JSONL log and the size of its valid prefix; a torn trailing line,
+    left by a crash while appending, is ignored and overwritten by the next append.
+    """
+    records, size = [], 0
+    if not os.path.exists(path):
+        return records, size
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(loads(line))
+            except ValueError:
+                break
+            size += len(line)
+    return records, size
+
+
+def _append_log(path, record, valid_size):
+    with open(path, "ab") as f:
+        f.truncate(valid_size)
+        f.write(dumps(record) + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class GraphHistory:
+    """
+    Versioned history of the drug–indication graph: each recorded build is stored as a delta
+    against the previous version, plus a full checkpoint every `checkpoint_every` versions (or
+    when a delta would be larger than the graph itself). Any version is rebuilt from its
+    checkpoint and at most `checkpoint_every - 1` deltas; `node_history` and `edge_history` read
+    only the small events log.
+
+        history = GraphHistory("../data/graph_history")
+        history.record(graph, source="label_extracted_with_diseases.jsonl")
+        history.edge_history("ADVAIR", "ASTHMA")   # [{"version": 3, "created": ..., "event": "added"}]
+        graph = history.graph_at(3)
+    """
+
+    def __init__(self, history_dir, compression=None, checkpoint_every=10):
+        if checkpoint_every < 1:
+            raise ValueError(f"checkpoint_every must be at least 1, got {checkpoint_every}")
+        self.history_dir = history_dir
+        self.compression = resolve_compression(compression)
+        self.checkpoint_every = checkpoint_every
+        self._versions, self._versions_size = _read_log(os.path.join(history_dir, VERSIONS_FILE))
+        self._events = None
+        self._head_state = None
+
+    # --- Versions ---
+
+    @property
+    def head(self):
+        """Latest committed version number, 0 for an empty history."""
+        return self._versions[-1]["version"] if self._versions else 0
+
+    def versions(self):
+        return list(self._versions)
+
+    def version_info(self, version):
+        if not 1 <= version <= self.head:
+            raise KeyError(f"No version {version} in {self.history_dir} (head is {self.head})")
+        return self._versions[version - 1]
+
+    def _path(self, version, kind):
+        return os.path.join(self.history_dir, f"v{version:06d}.{kind}.jsonl")
+
+    def _write_ops(self, path, ops):
+        tmp_path = f"{path}.tmp"
+        with JsonlWriter(tmp_path, mode="wb", compression=self.compression) as writer:
+            writer.write_many(ops)
+        replace_jsonl(tmp_path, path)
+
+    def _read_ops(self, version, kind):
+        return iter_jsonl(self._path(version, kind))
+
+    # --- Reconstruction ---
+
+    def state_at(self, version=None):
+        """({node: attrs}, {(u, v): attrs}) at `version` (default: head)."""
+        version = self.head if version is None else version
+        info = self.version_info(version)
+        checkpoint = info["checkpoint"]
+        state = apply_ops(({}, {}), self._read_ops(checkpoint, "full"))
+        for v in range(checkpoint + 1, version + 1):
+            apply_ops(state, self._read_ops(v, "delta"))
+        return state
+
+    def graph_at(self, version=None):
+        """The graph at `version` (default: head) as an nx.Graph with GraphML scalar attributes."""
+        nodes, edges = self.state_at(version)
+        graph = nx.Graph()
+        graph.add_nodes_from(nodes.items())
+        graph.add_edges_from((u, v, attrs) for (u, v), attrs in edges.items())
+        return graph
+
+    def diff(self, old_version, new_version):
+        """Summary of the changes between two versions (see summarize_ops)."""
+        return summarize_ops(diff_states(self.state_at(old_version), self.state_at(new_version)))
+
+    # --- Recording ---
+
+    def record(self, graph, source=None):
+        """
+        Record `graph` as a new version unless it equals the head.
+
+        Returns:
+            int: The new version, or the head when nothing changed.
+        """
+        with metrics.timer("history_diff"):
+            state = graph_state(graph)
+            head = self.head
+            if head and self._head_state is None:
+                self._head_state = self.state_at(head)
+            ops = diff_states(self._head_state or ({}, {}), state)
+        if head and not ops:
+            print(f"Graph unchanged since version {head}; nothing recorded")
+            return head
+
+        version = head + 1
+        size = len(state[0]) + len(state[1])
+        last_checkpoint = self._versions[-1]["checkpoint"] if self._versions else 0
+        checkpoint = not head or version - last_checkpoint >= self.checkpoint_every or len(ops) >= size
+        ensure_output_dir(self.history_dir)
+        with metrics.timer("history_write"):
+            if head:
+                self._write_ops(self._path(version, "delta"), ops)
+            if checkpoint:
+                self._write_ops(self._path(version, "full"), diff_states(({}, {}), state))
+        info = {
+            "history_version": HISTORY_VERSION,
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": source,
+            "nodes": len(state[0]),
+            "edges": len(state[1]),
+            "changes": len(ops),
+            "checkpoint": version if checkpoint else last_checkpoint,
+        }
+        _append_log(os.path.join(self.history_dir, VERSIONS_FILE), info, self._versions_size)
+        self._versions, self._versions_size = _read_log(os.path.join(self.history_dir, VERSIONS_FILE))
+        self._head_state = state
+        # The events log is derived data: a version committed without its line is backfilled on read
+        self._append_events(version, ops)
+        metrics.set_gauge("history_versions", version)
+        print(f"Recorded graph version {version} ({len(ops)} changes"
+              f"{', checkpoint' if checkpoint else ''}) in {self.history_dir}")
+        return version
+
+    # --- History queries ---
+
+    def _append_events(self, version, ops):
+        path = os.path.join(self.history_dir, EVENTS_FILE)
+        events, size = _read_log(path)
+        if not events or events[-1]["version"] < version:
+            _append_log(path, {"version": version, **summarize_ops(ops)}, size)
+        self._events = None
+
+    def _event_index(self):
+        if self._events is not None:
+            return self._events
+        path = os.path.join(self.history_dir, EVENTS_FILE)
+        events, _ = _read_log(path)
+        events = [e for e in events if e["version"] <= self.head]
+        logged = {e["version"] for e in events}
+        missing = [v for v in range(1, self.head + 1) if v not in logged]
+        for version in missing:
+            ops = self._read_ops(version, "delta" if version > 1 else "full")
+            events.append({"version": version, **summarize_ops(ops)})
+        events.sort(key=lambda e: e["version"])
+        if missing:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(dumps(e) + b"\n" for e in events))
+            os.replace(tmp_path, path)
+        index = {"node": {}, "edge": {}}
+        names = {"+": "added", "-": "removed", "~": "changed"}
+        for event in events:
+            for kind in ("node", "edge"):
+                for sign, name in names.items():
+                    for key in event[f"{kind}s{sign}"]:
+                        key = normalize_key(key) if kind == "node" else _edge_key(*map(normalize_key, key))
+                        index[kind].setdefault(key, []).append((event["version"], name))
+        self._events = index
+        return index
+
+    def _timeline(self, kind, key):
+        return [{"version": version, "created": self._versions[version - 1]["created"], "event": event}
+                for version, event in self._event_index()[kind].get(key, [])]
+
+    def node_history(self, node):
+        """Versions in which `node` was added, removed or had attributes changed, oldest first."""
+        return self._timeline("node", normalize_key(node))
+
+    def edge_history(self, u, v):
+        """
+        Versions in which the edge u–v was added, removed or changed, oldest first; the "added"
+        entries answer when a drug gained an indication.
+        """
+        return self._timeline("edge", _edge_key(normalize_key(u), normalize_key(v)))
+
+    def prune_uncommitted(self):
+        """Remove delta and checkpoint files of versions never committed (a crash during record)."""
+        removed = 0
+        for name in os.listdir(self.history_dir) if os.path.isdir(self.history_dir) else []:
+            if name.startswith("v") and name[1:7].isdigit() and int(name[1:7]) > self.head:
+                kind = name.split(".")[1]
+                remove_jsonl(self._path(int(name[1:7]), kind))
+                removed += 1
+        return removed
+
+
+def open_history(config):
+    return GraphHistory(config.get("graph_history_dir", "../data/graph_history"),
+                        compression=config.get("jsonl_compression"),
+                        checkpoint_every=config.get("graph_history_checkpoint_every", 10))
+
+
+def record_graph_history(config, graph=None):
+    """Record the graph built by the graph stage (read_graph) as the next history version."""
+    from build_drug_graph import read_graph, extracted_mentions_path
+
+    graph = read_graph() if graph is None else graph
+    history = open_history(config)
+    history.prune_uncommitted()
+    return history.record(graph, source=os.path.basename(extracted_mentions_path(config)))
+
+
+def _print_timeline(timeline):
+    if not timeline:
+        print("No history")
+    for entry in timeline:
+        print(f"v{entry['version']:<6} {entry['created']}  {entry['event']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versioned history of the drug-indication graph.")
+    parser.add_argument("command", choices=["record", "import", "log", "show", "diff", "node", "edge"])
+    parser.add_argument("args", nargs="*", help="import: graphml files; show: version; diff: two versions; "
+                                                "node: name; edge: drug indication")
+    parser.add_argument("--config", default="../params.yaml")
+    parser.add_argument("--output", default=None, help="GraphML path written by show")
+    args = parser.parse_args()
+
+    config = load_yaml_config(args.config)
+    history = open_history(config)
+    if args.command == "record":
+        record_graph_history(config)
+    elif args.command == "import":
+        # Seed the history from existing snapshots, oldest first, e.g. meds_indications_v1.graphml
+        for path in args.args:
+            history.record(nx.read_graphml(path), source=os.path.basename(path))
+    elif args.command == "log":
+        for info in history.versions():
+            print(f"v{info['version']:<6} {info['created']}  {info['nodes']} nodes  {info['edges']} edges  "
+                  f"{info['changes']} changes  {info['source'] or ''}")
+    elif args.command == "show":
+        graph = history.graph_at(int(args.args[0]) if args.args else None)
+        print(f"{graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+        if args.output:
+            nx.write_graphml(graph, args.output)
+    elif args.command == "diff":
+        changes = history.diff(int(args.args[0]), int(args.args[1]))
+        for name, keys in changes.items():
+            print(f"{name}: {len(keys)}")
+            for key in keys[:20]:
+                print(f"  {key if isinstance(key, str) else ' -- '.join(key)}")
+    elif args.command == "node":
+        _print_timeline(history.node_history(args.args[0]))
+    else:
+        _print_timeline(history.edge_history(args.args[0], args.args[1]))
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import shutil
+
+import numpy as np
+
+from utils import find_disease_category, decode_attr_values, product_table
+
+SNAPSHOT_VERSION = 2
+# Each relation is stored as CSR over the integer IDs of its key table:
+# values of key i are <relation>_indices[<relation>_indptr[i]:<relation>_indptr[i + 1]]
+RELATIONS = {
+    "drug_indications": ("drugs", "indications"),
+    "indication_drugs": ("indications", "drugs"),
+    "category_indications": ("categories", "indications"),
+    "generic_brands": ("generics", "drugs"),
+    "ndc_brands": ("ndcs", "drugs"),
+    "cluster_drugs": ("clusters", "drugs"),
+}
+
+
+def normalize_key(name):
+    # Pipeline output is uppercased, reference data (categories) is not
+    return " ".join(str(name).split()).upper()
+
+
+def _csr(pairs, n_keys):
+    """Build (indptr, indices) from (key_id, value_id) pairs; values per key are sorted and unique."""
+    if not pairs:
+        return np.zeros(n_keys + 1, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    arr = np.unique(np.asarray(pairs, dtype=np.int64), axis=0)  # sorted by key, then value
+    counts = np.bincount(arr[:, 0], minlength=n_keys)
+    indptr = np.zeros(n_keys + 1, dtype=np.int32)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, arr[:, 1].astype(np.int32)
+
+
+class DrugGraphIndex:
+    """
+    Read-only query index over the drug–indication graph. Names are interned into sorted tables
+    and every relation is a pair of CSR arrays, so a lookup is one dict probe plus an array slice.
+
+    Build it with `from_graph` (from build_graph_from_extracted output), or `load` a snapshot
+    written by `save`; snapshots are memory-mapped, so loading does not rebuild anything.
+    """
+
+    def __init__(self, tables, arrays):
+        # {"drugs": [...], "indications": [...], "categories": [...], "generics": [...], "ndcs": [...],
+        #  "clusters": [...]}, where clusters holds the label of each cluster ID
+        self.tables = tables
+        # Plain ndarray views: numpy.memmap slicing carries noticeable per-call overhead
+        self.arrays = {name: np.asarray(array) for name, array in arrays.items()}
+        self._ids = {name: {normalize_key(v): i for i, v in enumerate(values)} for name, values in tables.items()}
+
+    @classmethod
+    def from_graph(cls, graph, generic_field="generic_name", ndc_field="product_ndc", cluster_map=None,
+                   cluster_labels=None):
+        """
+        Args:
+            graph (nx.Graph): Bipartite graph with node attribute type "Medication" / "Indication".
+            generic_field (str): Product field holding the generic name(s) of a drug.
+            ndc_field (str): Product field holding the product NDC(s) of a drug.
+            cluster_map (dict): {drug: cluster ID} from assign_clusters_louvain, optional.
+            cluster_labels (dict): {cluster ID: label} from generate_cluster_labels, optional.
+        """
+        drugs = sorted(n for n, d in graph.nodes(data=True) if d.get("type") == "Medication")
+        indications = sorted(n for n, d in graph.nodes(data=True) if d.get("type") == "Indication")
+        drug_ids = {n: i for i, n in enumerate(drugs)}
+        indication_ids = {n: i for i, n in enumerate(indications)}
+
+        indication_category = [find_disease_category(str(n)) for n in indications]
+        categories = sorted(set(indication_category))
+        category_ids = {c: i for i, c in enumerate(categories)}
+
+        drug_indications = []
+        for u, v in graph.edges():
+            drug, indication = (u, v) if u in drug_ids else (v, u)
+            if drug in drug_ids and indication in indication_ids:
+                drug_indications.append((drug_ids[drug], indication_ids[indication]))
+
+        products = product_table(graph, [generic_field, ndc_field])
+        brand_generics = set()
+        brand_ndcs = set()
+        for drug, drug_id in drug_ids.items():
+            for field, pairs in ((generic_field, brand_generics), (ndc_field, brand_ndcs)):
+                for value in products.brand_values(drug, field):
+                    for alias in decode_attr_values(value):
+                        if alias != "unknown":
+                            pairs.add((normalize_key(alias), drug_id))
+
+        generics = sorted({g for g, _ in brand_generics})
+        generic_ids = {g: i for i, g in enumerate(generics)}
+        ndcs = sorted({n for n, _ in brand_ndcs})
+        ndc_ids = {n: i for i, n in enumerate(ndcs)}
+
+        cluster_map = cluster_map or {}
+        n_clusters = max(cluster_map.values(), default=-1) + 1
+        clusters = [(cluster_labels or {}).get(cid, f"Cluster {cid}") for cid in range(n_clusters)]
+
+        relations = {
+            "drug_indications": (drug_indications, len(drugs)),
+            "indication_drugs": ([(b, a) for a, b in drug_indications], len(indications)),
+            "category_indications": ([(category_ids[c], i) for i, c in enumerate(indication_category)],
+                                     len(categories)),
+            "generic_brands": ([(generic_ids[g], d) for g, d in brand_generics], len(generics)),
+            "ndc_brands": ([(ndc_ids[n], d) for n, d in brand_ndcs], len(ndcs)),
+            "cluster_drugs": ([(cid, drug_ids[d]) for d, cid in cluster_map.items() if d in drug_ids], n_clusters),
+        }
+        arrays = {}
+        for name, (pairs, n_keys) in relations.items():
+            arrays[f"{name}_indptr"], arrays[f"{name}_indices"] = _csr(pairs, n_keys)
+
+        tables = {"drugs": [str(d) for d in drugs], "indications": [str(i) for i in indications],
+                  "categories": categories, "generics": generics, "ndcs": ndcs,
+                  "clusters": clusters}
+        return cls(tables, arrays)
+
+    def save(self, snapshot_dir):
+        """
+        Write the index as `<array>.npy` files plus `tables.json`. The files are written to a new
+        directory that then replaces `snapshot_dir`, so a process that has the old snapshot
+        mapped keeps reading intact files, and a load never sees a half-written one.
+        """
+        target = os.path.normpath(snapshot_dir)
+        tmp_dir = f"{target}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        old_dir = None
+        try:
+            for name, array in self.arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+            with open(os.path.join(tmp_dir, "tables.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": SNAPSHOT_VERSION, "tables": self.tables}, f, ensure_ascii=False)
+            # os.replace cannot replace a non-empty directory, so the old snapshot is moved aside first
+            if os.path.exists(target):
+                old_dir = f"{target}.old-{os.getpid()}"
+                shutil.rmtree(old_dir, ignore_errors=True)
+                os.rename(target, old_dir)
+            os.rename(tmp_dir, target)
+        except BaseException:
+            if old_dir and not os.path.exists(target):
+                os.rename(old_dir, target)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        return snapshot_dir
+
+    @classmethod
+    def load(cls, snapshot_dir, mmap=True, retries=5):
+        """
+        Load a snapshot written by `save`. A load that overlaps a save (the snapshot directory
+        replaced while its files were being opened, or briefly missing) is retried.
+        """
+        tables_path = os.path.join(snapshot_dir, "tables.json")
+        for attempt in range(retries + 1):
+            try:
+                index, stamp = cls._load(snapshot_dir, mmap)
+                current = os.stat(tables_path)
+                if (current.st_ino, current.st_mtime_ns) == stamp:
+                    return index
+            except FileNotFoundError:
+                if attempt == retries:
+                    raise
+            time.sleep(0.05 * (attempt + 1))
+        raise RuntimeError(f"Graph index snapshot {snapshot_dir} kept changing while it was loaded")
+
+    @classmethod
+    def _load(cls, snapshot_dir, mmap):
+        with open(os.path.join(snapshot_dir, "tables.json"), "r", encoding="utf-8") as f:
+            stat = os.fstat(f.fileno())
+            meta = json.load(f)
+        if meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported graph index snapshot version {meta.get('version')} in {snapshot_dir}")
+        arrays = {}
+        for relation in RELATIONS:
+            for part in ("indptr", "indices"):
+                name = f"{relation}_{part}"
+                arrays[name] = np.load(os.path.join(snapshot_dir, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        return cls(meta["tables"], arrays), (stat.st_ino, stat.st_mtime_ns)
+
+    # --- ID level: zero-copy array slices, for callers that chain queries ---
+
+    def id_of(self, table, name):
+        """Integer ID of `name` in `table` ("drugs", "indications", "generics", "ndcs", ...), or None."""
+        return self._ids[table].get(normalize_key(name))
+
+    def related_ids(self, relation, key_id):
+        indptr = self.arrays[f"{relation}_indptr"]
+        return self.arrays[f"{relation}_indices"][indptr[key_id]:indptr[key_id + 1]]
+
+    def _lookup(self, relation, name):
+        key_table, value_table = RELATIONS[relation]
+        key_id = self.id_of(key_table, name)
+        if key_id is None:
+            return []
+        values = self.tables[value_table]
+        return [values[i] for i in self.related_ids(relation, key_id).tolist()]
+
+    # --- Name level ---
+
+    def drugs_for(self, indication):
+        """Drugs (brand names) that treat `indication`."""
+        return self._lookup("indication_drugs", indication)
+
+    def indications_for(self, drug):
+        """Indications of the brand `drug`."""
+        return self._lookup("drug_indications", drug)
+
+    def indications_in_category(self, category):
+        return self._lookup("category_indications", category)
+
+    def brands_for_generic(self, generic):
+        return self._lookup("generic_brands", generic)
+
+    def brands_for_ndc(self, ndc):
+        return self._lookup("ndc_brands", ndc)
+
+    def cluster_members(self, cluster_id):
+        """Drugs in cluster `cluster_id` (clusters are looked up by ID, their labels are not unique)."""
+        if not 0 <= cluster_id < len(self.tables["clusters"]):
+            return []
+        drugs = self.tables["drugs"]
+        return [drugs[i] for i in self.related_ids("cluster_drugs", cluster_id).tolist()]
+
+    def batch(self, relation, names):
+        """Batched lookup: one result list per name, e.g. batch("indication_drugs", ["ASTHMA", "GOUT"])."""
+        return [self._lookup(relation, name) for name in names]
+
+    def drugs_sharing_indications(self, drug, min_shared=3, limit=None):
+        """
+        Drugs sharing at least `min_shared` indications with `drug`, as [(drug, shared_count), ...]
+        sorted by count (descending) then name.
+        """
+        drug_id = self.id_of("drugs", drug)
+        if drug_id is None:
+            return []
+        indications = self.related_ids("drug_indications", drug_id)
+        if len(indications) == 0:
+            return []
+        indptr = self.arrays["indication_drugs_indptr"]
+        indices = self.arrays["indication_drugs_indices"]
+        # Concatenate the drug lists of all its indications and count occurrences per drug
+        neighbours = np.concatenate([indices[indptr[i]:indptr[i + 1]] for i in indications])
+        counts = np.bincount(neighbours, minlength=len(self.tables["drugs"]))
+        counts[drug_id] = 0
+        candidates = np.nonzero(counts >= min_shared)[0]
+        order = np.lexsort((candidates, -counts[candidates]))
+        if limit is not None:
+            order = order[:limit]
+        names = self.tables["drugs"]
+        return [(names[candidates[k]], int(counts[candidates[k]])) for k in order]
+
+    def stats(self):
+        return {name: len(values) for name, values in self.tables.items()}
+
+
+def build_graph_index(config, snapshot_dir=None):
+    """
+    Build the index from the graph stage's GraphML output (read_graph) and save a snapshot to
+    `graph_index_dir`. Its clusters are the ones the site uses, so cluster IDs match the page's.
+    """
+    from build_drug_graph import read_graph, graph_clusters
+
+    snapshot_dir = snapshot_dir or config.get("graph_index_dir", "../data/graph_index")
+    graph = read_graph()
+    cluster_map, cluster_labels = graph_clusters(graph, config)
+    index = DrugGraphIndex.from_graph(graph, cluster_map=cluster_map, cluster_labels=cluster_labels)
+    index.save(snapshot_dir)
+    print(f"Graph index saved to {snapshot_dir}: {index.stats()}")
+    return snapshot_dir
+
+
+if __name__ == "__main__":
+    import sys
+    from utils import load_yaml_config
+
+    build_graph_index(load_yaml_config(sys.argv[1] if len(sys.argv) > 1 else "../params.yaml"))
@@ -0,0 +1,194 @@
+import math
+import zlib
+
+import numpy as np
+
+
+def _stable_unit(name, salt=0):
+    # Hash-based jitter in [-1, 1) so a node keeps its seed position regardless of input order
+    h = zlib.crc32(f"{salt}:{name}".encode("utf-8"))
+    return (h / 2**31) - 1.0
+
+
+def _initial_positions(nodes, index, G, cluster_map, spread, seed):
+    n = len(nodes)
+    pos = np.zeros((n, 2), dtype=np.float64)
+
+    # Lay cluster centres out on a golden-angle spiral, largest cluster in the middle
+    cluster_sizes = {}
+    for cid in cluster_map.values():
+        cluster_sizes[cid] = cluster_sizes.get(cid, 0) + 1
+    ordered = sorted(cluster_sizes, key=lambda c: (-cluster_sizes[c], c))
+    golden = math.pi * (3 - math.sqrt(5))
+    centres = {}
+    for rank, cid in enumerate(ordered):
+        r = spread * math.sqrt(rank)
+        centres[cid] = (r * math.cos(rank * golden), r * math.sin(rank * golden))
+
+    unclustered = []
+    for node in nodes:
+        i = index[node]
+        cid = cluster_map.get(node)
+        if cid is None:
+            unclustered.append(node)
+            continue
+        cx, cy = centres[cid]
+        radius = spread * 0.5 * math.sqrt(cluster_sizes[cid]) / max(1.0, math.sqrt(n))
+        pos[i] = (cx + radius * _stable_unit(node, 2 * seed), cy + radius * _stable_unit(node, 2 * seed + 1))
+
+    # Nodes without a cluster (indications) start at the mean of their clustered neighbours
+    for node in unclustered:
+        i = index[node]
+        anchors = [centres[cluster_map[nb]] for nb in G.neighbors(node) if nb in cluster_map]
+        if anchors:
+            ax = sum(a[0] for a in anchors) / len(anchors)
+            ay = sum(a[1] for a in anchors) / len(anchors)
+        else:
+            ax, ay = 0.0, 0.0
+        jitter = spread * 0.25
+        pos[i] = (ax + jitter * _stable_unit(node, 2 * seed), ay + jitter * _stable_unit(node, 2 * seed + 1))
+
+    return pos
+
+
+def _repulsion_exact(pos, mass, kr, chunk=1024):
+    n = len(pos)
+    force = np.zeros_like(pos)
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        diff = pos[start:stop, None, :] - pos[None, :, :]
+        d2 = np.einsum("ijk,ijk->ij", diff, diff)
+        d2[d2 < 1e-9] = np.inf  # self-interaction and exact overlaps contribute nothing
+        f = kr * mass[start:stop, None] * mass[None, :] / d2
+        force[start:stop] = np.einsum("ij,ijk->ik", f, diff)
+    return force
+
+
+def _repulsion_grid(pos, mass, kr, cells_per_side, chunk=2048):
+    # Barnes–Hut style approximation on a uniform grid: far-field repulsion comes from each
+    # cell's centre of mass, near-field repulsion is computed exactly within a node's own cell.
+    n = len(pos)
+    lo = pos.min(axis=0)
+    span = np.maximum(pos.max(axis=0) - lo, 1e-9)
+    cell_xy = np.minimum(((pos - lo) / span * cells_per_side).astype(np.int64), cells_per_side - 1)
+    cell = cell_xy[:, 0] * cells_per_side + cell_xy[:, 1]
+    n_cells = cells_per_side * cells_per_side
+
+    cell_mass = np.bincount(cell, weights=mass, minlength=n_cells)
+    occupied = np.nonzero(cell_mass)[0]
+    com = np.stack([
+        np.bincount(cell, weights=mass * pos[:, 0], minlength=n_cells)[occupied],
+        np.bincount(cell, weights=mass * pos[:, 1], minlength=n_cells)[occupied],
+    ], axis=1) / cell_mass[occupied, None]
+    occ_mass = cell_mass[occupied]
+    own_slot = np.searchsorted(occupied, cell)
+
+    force = np.zeros_like(pos)
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        diff = pos[start:stop, None, :] - com[None, :, :]
+        d2 = np.einsum("ijk,ijk->ij", diff, diff)
+        d2[np.arange(stop - start), own_slot[start:stop]] = np.inf
+        d2[d2 < 1e-9] = np.inf
+        f = kr * mass[start:stop, None] * occ_mass[None, :] / d2
+        force[start:stop] = np.einsum("ij,ijk->ik", f, diff)
+
+    order = np.argsort(cell, kind="stable")
+    bounds = np.searchsorted(cell[order], occupied, side="left")
+    ends = np.append(bounds[1:], n)
+    for b, e in zip(bounds, ends):
+        if e - b > 1:
+            members = order[b:e]
+            force[members] += _repulsion_exact(pos[members], mass[members], kr)
+    return force
+
+
+def forceatlas2_layout(G, cluster_map=None, iterations=300, seed=42, scaling_ratio=2.0, gravity=1.0,
+                       jitter_tolerance=1.0, exact_threshold=3000, weight="weight"):
+    """
+    NumPy ForceAtlas2 layout, seeded by cluster membership.
+
+    Args:
+        G (nx.Graph): Graph to lay out.
+        cluster_map (dict): {node: cluster_id}; nodes of the same cluster start close together.
+        iterations (int): Number of force iterations.
+        seed (int): Salt for the deterministic initial jitter.
+        scaling_ratio (float): Repulsion strength (FA2 kr).
+        gravity (float): Pull towards the origin (FA2 kg), keeps disconnected components in view.
+        jitter_tolerance (float): FA2 swing tolerance used for the adaptive global speed.
+        exact_threshold (int): Above this many nodes repulsion uses the grid approximation.
+        weight (str): Edge attribute used as attraction weight, 1 when missing.
+
+    Returns:
+        dict: {node: (x, y)}
+    """
+    cluster_map = cluster_map or {}
+    nodes = sorted(G.nodes(), key=str)
+    n = len(nodes)
+    if n == 0:
+        return {}
+    index = {node: i for i, node in enumerate(nodes)}
+
+    src = np.fromiter((index[u] for u, v in G.edges()), dtype=np.int64, count=G.number_of_edges())
+    dst = np.fromiter((index[v] for u, v in G.edges()), dtype=np.int64, count=G.number_of_edges())
+    w = np.fromiter((float(d.get(weight, 1.0)) for _, _, d in G.edges(data=True)), dtype=np.float64,
+                    count=G.number_of_edges())
+    # Log-damped weights stop heavily evidenced edges from collapsing whole clusters into a point
+    w = 1.0 + np.log1p(np.maximum(w, 1.0) - 1.0)
+
+    degree = np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+    mass = degree.astype(np.float64) + 1.0
+
+    spread = 10.0 * math.sqrt(n)
+    pos = _initial_positions(nodes, index, G, cluster_map, spread, seed)
+
+    cells_per_side = max(2, int(math.sqrt(n / 50)))
+    prev_force = np.zeros_like(pos)
+    speed = 1.0
+
+    for _ in range(iterations):
+        if n <= exact_threshold:
+            force = _repulsion_exact(pos, mass, scaling_ratio)
+        else:
+            force = _repulsion_grid(pos, mass, scaling_ratio, cells_per_side)
+
+        # Linear attraction along edges
+        delta = (pos[dst] - pos[src]) * w[:, None]
+        for axis in range(2):
+            force[:, axis] += np.bincount(src, weights=delta[:, axis], minlength=n)
+            force[:, axis] -= np.bincount(dst, weights=delta[:, axis], minlength=n)
+
+        # Gravity
+        dist = np.sqrt(np.einsum("ij,ij->i", pos, pos)) + 1e-9
+        force -= (gravity * mass / dist)[:, None] * pos
+
+        # Adaptive speed (FA2 swing / traction)
+        swing = np.sqrt(np.einsum("ij,ij->i", force - prev_force, force - prev_force))
+        traction = 0.5 * np.sqrt(np.einsum("ij,ij->i", force + prev_force, force + prev_force))
+        total_swing = float(np.dot(mass, swing))
+        total_traction = float(np.dot(mass, traction))
+        if total_swing > 0:
+            target = jitter_tolerance * total_traction / total_swing
+            speed = min(target, 1.5 * speed) if speed > 0 else target
+
+        node_speed = speed / (1.0 + speed * np.sqrt(swing))
+        # Cap per-node displacement so a single iteration can never fling a node across the map
+        max_step = spread / 10.0
+        step = force * node_speed[:, None]
+        step_len = np.sqrt(np.einsum("ij,ij->i", step, step))
+        too_far = step_len > max_step
+        step[too_far] *= (max_step / step_len[too_far])[:, None]
+        pos += step
+        prev_force = force
+
+    pos -= pos.mean(axis=0)
+    return {node: (float(pos[i, 0]), float(pos[i, 1])) for node, i in index.items()}
+
+
+def scale_layout(positions, extent):
+    """Rescale positions so the furthest node sits `extent` units from the origin."""
+    if not positions:
+        return {}
+    radius = max(math.hypot(x, y) for x, y in positions.values()) or 1.0
+    factor = extent / radius
+    return {node: (round(x * factor, 2), round(y * factor, 2)) for node, (x, y) in positions.items()}
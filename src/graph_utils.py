@@ -1,3 +1,4 @@
+import numpy as np
 import networkx as nx
 from networkx.algorithms.community import greedy_modularity_communities
 from networkx.algorithms import bipartite
@@ -32,17 +33,121 @@ def assign_clusters_greedy(G, node_type="Medication"):
     return cluster_map
 
 
-def assign_clusters_louvain(G, node_type="Medication", resolution=1.0):
-
-    # Project bipartite graph if needed
-    if node_type:
+# Pair instances generated (and folded into the distinct pairs) at a time by weighted_projection
+PROJECTION_CHUNK_PAIRS = 1 << 22
+
+
+def _pair_indices(size, max_pairs):
+    """(a, b) index arrays of the pairs a < b of range(size), in blocks of rows of about `max_pairs` pairs."""
+    if size * (size - 1) // 2 <= max_pairs:
+        yield np.triu_indices(size, k=1)
+        return
+    start = 0
+    while start < size - 1:
+        end, pairs = start, 0
+        while end < size - 1 and (pairs == 0 or pairs + size - 1 - end <= max_pairs):
+            pairs += size - 1 - end
+            end += 1
+        rows = np.arange(start, end)
+        a = np.repeat(rows, size - 1 - rows)
+        # Row r pairs with r + 1 .. size - 1: offsets of each pair within its row, plus r + 1
+        b = np.arange(len(a)) - np.repeat(np.cumsum(size - 1 - rows) - (size - 1 - rows), size - 1 - rows) + a + 1
+        yield a, b
+        start = end
+
+
+def _max_by_key(keys, weights):
+    """Sorted distinct `keys`, each with its largest weight."""
+    order = np.argsort(keys, kind="stable")
+    keys, weights = keys[order], weights[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.maximum.reduceat(weights, starts)
+
+
+def _fold_pairs(keys, weights, new_keys, new_weights):
+    """Fold pair instances into the sorted distinct pairs `keys`, keeping the largest weight of each."""
+    new_keys, new_weights = _max_by_key(new_keys, new_weights)
+    pos = np.searchsorted(keys, new_keys)
+    found = pos < len(keys)
+    found[found] = keys[pos[found]] == new_keys[found]
+    weights[pos[found]] = np.maximum(weights[pos[found]], new_weights[found])
+    fresh = ~found
+    if fresh.any():
+        keys = np.insert(keys, pos[fresh], new_keys[fresh])
+        weights = np.insert(weights, pos[fresh], new_weights[fresh])
+    return keys, weights
+
+
+def weighted_projection(G, nodes, weight="weight"):
+    """
+    Project a bipartite graph onto `nodes`, weighting each pair by its best-evidenced shared
+    neighbour: the smaller of the two (log-damped) edge weights through it. Pairs linked only by
+    single mentions keep weight 1, as in the unweighted projection; summing over all shared
+    neighbours instead lets a few popular indications swallow every cluster.
+
+    Pairs are generated a chunk at a time and folded into the distinct pairs found so far, so a
+    pair shared by many neighbours is held once. Pairs of weight 1 carry no weight attribute
+    (Louvain's default). Edges with the same weight share one attribute dict, so the projection
+    is returned frozen and should be treated as read-only.
+    """
+    nodes = list(nodes)
+    n = len(nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    keys, weights = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    pending_keys, pending_weights, pending = [], [], 0
+    for other in G:
+        if other in index:
+            continue
+        members = [(index[nb], data.get(weight, 1)) for nb, data in G[other].items() if nb in index]
+        if len(members) < 2:
+            continue
+        ids = np.array([i for i, _ in members], dtype=np.int64)
+        damped = 1.0 + np.log(np.maximum(np.array([w for _, w in members], dtype=np.float64), 1.0))
+        for a, b in _pair_indices(len(ids), PROJECTION_CHUNK_PAIRS):
+            pending_keys.append(np.minimum(ids[a], ids[b]) * n + np.maximum(ids[a], ids[b]))
+            pending_weights.append(np.minimum(damped[a], damped[b]))
+            pending += len(a)
+            if pending >= PROJECTION_CHUNK_PAIRS:
+                keys, weights = _fold_pairs(keys, weights, np.concatenate(pending_keys),
+                                            np.concatenate(pending_weights))
+                pending_keys, pending_weights, pending = [], [], 0
+    if pending:
+        keys, weights = _fold_pairs(keys, weights, np.concatenate(pending_keys), np.concatenate(pending_weights))
+
+    G_proj = nx.Graph()
+    G_proj.add_nodes_from(nodes)
+    # Edges are set in the adjacency directly, sharing one attribute dict per distinct weight (there
+    # are few) instead of allocating one per edge as add_edges_from does
+    shared = {}
+    adj = G_proj._adj
+    for start in range(0, len(keys), PROJECTION_CHUNK_PAIRS):
+        chunk = slice(start, start + PROJECTION_CHUNK_PAIRS)
+        for k, w in zip(keys[chunk].tolist(), weights[chunk].tolist()):
+            attrs = shared.get(w)
+            if attrs is None:
+                attrs = shared[w] = {} if w == 1.0 else {"weight": w}
+            u, v = nodes[k // n], nodes[k % n]
+            adj[u][v] = adj[v][u] = attrs
+    return nx.freeze(G_proj)
+
+
+def assign_clusters_louvain(G, node_type="Medication", resolution=1.0, random_state=None, projection=None,
+                            weight=None):
+
+    # Project bipartite graph if needed; `projection` replaces the projection, e.g. a
+    # similarity.similarity_graph of top-k neighbours, which avoids its all-pairs edges.
+    # With `weight` (an edge attribute such as "evidence") the projection is weighted.
+    if projection is not None:
+        G_proj = projection
+    elif node_type:
         nodes = [n for n, d in G.nodes(data=True) if d.get("type") == node_type]
-        G_proj = bipartite.projected_graph(G, nodes)
+        G_proj = weighted_projection(G, nodes, weight) if weight else bipartite.projected_graph(G, nodes)
     else:
         G_proj = G
 
     # Louvain clustering
-    partition = community_louvain.best_partition(G_proj, resolution=resolution)
+    # Fixed random_state keeps cluster membership (and so the seeded layout) stable across builds
+    partition = community_louvain.best_partition(G_proj, resolution=resolution, random_state=random_state)
     nx.set_node_attributes(G, partition, "cluster_id")
 
     print(f"Number of clusters: {len(set(partition.values()))}")
@@ -77,3 +182,29 @@ def generate_cluster_labels(G, cluster_map):
 
     return cluster_labels
 
+
+
+def assign_lod_clusters(G, cluster_map):
+    """
+    Give every node a level-of-detail cluster: clustered nodes keep their cluster_id, other nodes
+    (indications) join the cluster most common among their neighbours, ties going to the lower ID.
+    """
+    lod_map = dict(cluster_map)
+    for node in G.nodes():
+        if node in lod_map:
+            continue
+        counts = Counter(cluster_map[nb] for nb in G.neighbors(node) if nb in cluster_map)
+        if counts:
+            lod_map[node] = min(counts, key=lambda cid: (-counts[cid], cid))
+    return lod_map
+
+
+def aggregate_cluster_edges(G, lod_map):
+    """Count edges running between each pair of level-of-detail clusters, keyed (low_id, high_id)."""
+    weights = Counter()
+    for u, v in G.edges():
+        cu, cv = lod_map.get(u), lod_map.get(v)
+        if cu is None or cv is None or cu == cv:
+            continue
+        weights[(min(cu, cv), max(cu, cv))] += 1
+    return dict(weights)
@@ -1,4 +1,625 @@
 # html_components.py
+import json
+
+CLUSTER_COLORS = [
+    "#e6194b",  # red
+    "#ffe119",  # yellow
+    "#4363d8",  # blue
+    "#f58231",  # orange
+    "#911eb4",  # purple
+    "#46f0f0",  # cyan
+    "#f032e6",  # magenta
+    "#fabebe",  # light pink
+    "#008080",  # teal
+    "#e6beff",  # lavender
+    "#9a6324",  # brown
+    "#fffac8",  # pale yellow
+    "#800000",  # maroon
+]
+
+# Colors of nodes outside a cluster (all indications, unclustered medications)
+NODE_TYPE_COLORS = {"Medication": "#4dd0e1", "Indication": "#79db60"}
+DEFAULT_NODE_COLOR = "#e0e0e0"
+
+
+def node_color(node_type, cluster_id=-1):
+    """Display color of a node. Mirrored by nodeColors() in the WebGL page (graph_page_webgl.html)."""
+    if node_type == "Medication" and cluster_id >= 0:
+        return CLUSTER_COLORS[cluster_id % len(CLUSTER_COLORS)]
+    return NODE_TYPE_COLORS.get(node_type, DEFAULT_NODE_COLOR)
+
+
+# (graph_analytics metric, label) choices of the node size panel
+NODE_SIZE_METRICS = [
+    ("pagerank", "PageRank"),
+    ("hits", "Hub / authority"),
+    ("betweenness", "Betweenness"),
+    ("degree", "Degree"),
+]
+
+
+def graph_worker_script():
+    return """
+// Graph worker: owns the compact graph payload and the search index, and answers cluster filter,
+// level-of-detail, hop explorer, node size and search queries. Visibility and size changes are
+// diffed against what the page already shows, so the reply only lists nodes that must change.
+function createGraphEngine(post) {
+  const INDICATION = 1;
+  const state = {
+    n: 0,
+    type: null,             // Int8Array, 0 = Medication, 1 = Indication
+    cluster: null,          // Int32Array, -1 when unclustered
+    lod: null,              // Int32Array, level-of-detail cluster, -1 when none
+    centrality: {},         // metric name -> Float32Array, relative to the top node of the same type
+    indptr: null,           // Int32Array, CSR adjacency
+    indices: null,          // Int32Array
+    clusters: [],           // sorted cluster IDs
+    lodMode: false,
+    visibleClusters: new Set(),
+    collapsed: new Set(),
+    exploring: false,       // hop explorer: only nodes with visited[id] === exploreStamp show
+    exploreStamp: 0,
+    sizeScale: null,        // node size slider, null keeps the build-time sizes
+    sizeMetric: null        // metric the sizes follow, initially the one the build sized nodes by
+  };
+  // Must match graph_analytics.metric_sizes()
+  const MIN_SIZE = 10, MAX_SIZE = 40;
+
+  let appliedHidden = null;
+  let nextHidden = null;
+  let appliedSize = null;
+  let baseSize = null;
+  let buildSizeMetric = null;
+  let metricSize = null;    // sizes by state.sizeMetric before the slider scale
+  let visited = null;       // Uint32Array stamped per hop search, so nothing is cleared between searches
+  let queue = null;
+  const appliedSuperHidden = new Map();
+  let searchIndex = null;
+
+  function desiredSize(id) {
+    return state.sizeScale === null ? metricSize[id] : metricSize[id] * state.sizeScale;
+  }
+
+  function metricSizes(metric) {
+    const scores = state.centrality[metric];
+    if (metric === buildSizeMetric || !scores) return baseSize;
+    const sizes = new Float32Array(state.n);
+    for (let id = 0; id < state.n; id++) sizes[id] = MIN_SIZE + (MAX_SIZE - MIN_SIZE) * Math.sqrt(scores[id]);
+    return sizes;
+  }
+
+  function load(payload) {
+    const n = payload.labels.length;
+    state.n = n;
+    state.type = Int8Array.from(payload.type);
+    state.cluster = Int32Array.from(payload.cluster);
+    state.lod = Int32Array.from(payload.lod);
+    state.indptr = Int32Array.from(payload.indptr);
+    state.indices = Int32Array.from(payload.indices);
+    state.centrality = {};
+    Object.entries(payload.centrality || {}).forEach(([metric, scores]) => {
+      state.centrality[metric] = Float32Array.from(scores);
+    });
+    state.clusters = [...new Set(payload.cluster.filter(cid => cid >= 0))].sort((a, b) => a - b);
+    state.visibleClusters = new Set(state.clusters);
+    state.lodMode = payload.lodMode === true;
+
+    // Mirror what the build wrote into the page, so the first diff only holds real changes
+    baseSize = Float32Array.from(payload.size);
+    appliedSize = Float32Array.from(payload.size);
+    buildSizeMetric = state.sizeMetric = payload.sizeMetric || null;
+    metricSize = baseSize;
+    appliedHidden = new Uint8Array(n);
+    nextHidden = new Uint8Array(n);
+    visited = new Uint32Array(n);
+    queue = new Int32Array(n);
+    if (state.lodMode) {
+      state.collapsed = new Set(state.clusters);
+      for (let id = 0; id < n; id++) appliedHidden[id] = state.lod[id] >= 0 ? 1 : 0;
+      state.clusters.forEach(cid => appliedSuperHidden.set(cid, false));
+    }
+  }
+
+  function computeHidden(out) {
+    const { n, type, cluster, lod, indptr, indices } = state;
+    if (state.exploring) {
+      for (let id = 0; id < n; id++) out[id] = visited[id] === state.exploreStamp ? 0 : 1;
+      return;
+    }
+    for (let id = 0; id < n; id++) {
+      if (type[id] === INDICATION) continue;
+      const filtered = cluster[id] >= 0 && !state.visibleClusters.has(cluster[id]);
+      out[id] = filtered || state.collapsed.has(lod[id]) ? 1 : 0;
+    }
+    // Indications only show while at least one of their medications does
+    for (let id = 0; id < n; id++) {
+      if (type[id] !== INDICATION) continue;
+      let visible = 0;
+      if (!state.collapsed.has(lod[id])) {
+        for (let k = indptr[id]; k < indptr[id + 1]; k++) {
+          const nb = indices[k];
+          if (type[nb] !== INDICATION && out[nb] === 0) { visible = 1; break; }
+        }
+      }
+      out[id] = visible ? 0 : 1;
+    }
+  }
+
+  function exploreHops(startId, maxHops) {
+    // Index-based BFS over the CSR arrays; nodes are marked when enqueued, never twice
+    const stamp = ++state.exploreStamp;
+    const { indptr, indices } = state;
+    let head = 0, tail = 0;
+    queue[tail++] = startId;
+    visited[startId] = stamp;
+
+    let levelEnd = tail;
+    let depth = 0;
+    while (head < tail && depth < maxHops) {
+      while (head < levelEnd) {
+        const node = queue[head++];
+        for (let k = indptr[node]; k < indptr[node + 1]; k++) {
+          const neighbor = indices[k];
+          if (visited[neighbor] !== stamp) {
+            visited[neighbor] = stamp;
+            queue[tail++] = neighbor;
+          }
+        }
+      }
+      levelEnd = tail;
+      depth++;
+    }
+    state.exploring = true;
+  }
+
+  function diff(visibility, sizes) {
+    // Parallel arrays: hidden is -1 when unchanged, size is NaN when unchanged
+    const ids = [], hidden = [], size = [];
+    const superIds = [], superHidden = [];
+
+    if (visibility) {
+      computeHidden(nextHidden);
+      for (let id = 0; id < state.n; id++) {
+        if (nextHidden[id] === appliedHidden[id]) continue;
+        appliedHidden[id] = nextHidden[id];
+        ids.push(id);
+        hidden.push(nextHidden[id]);
+        if (!nextHidden[id] && appliedSize[id] !== desiredSize(id)) {
+          appliedSize[id] = desiredSize(id);
+          size.push(appliedSize[id]);
+        } else {
+          size.push(NaN);
+        }
+      }
+      if (state.lodMode) {
+        state.clusters.forEach(cid => {
+          const superHide = state.exploring || !state.visibleClusters.has(cid) || !state.collapsed.has(cid);
+          if (appliedSuperHidden.get(cid) !== superHide) {
+            appliedSuperHidden.set(cid, superHide);
+            superIds.push(cid);
+            superHidden.push(superHide ? 1 : 0);
+          }
+        });
+      }
+    }
+
+    if (sizes) {
+      // Hidden nodes pick up the current scale when they are next shown
+      for (let id = 0; id < state.n; id++) {
+        if (appliedHidden[id]) continue;
+        const target = desiredSize(id);
+        if (target !== appliedSize[id]) {
+          appliedSize[id] = target;
+          ids.push(id);
+          hidden.push(-1);
+          size.push(target);
+        }
+      }
+    }
+
+    const message = {
+      type: "diff",
+      ids: Int32Array.from(ids),
+      hidden: Int8Array.from(hidden),
+      size: Float32Array.from(size),
+      superIds: Int32Array.from(superIds),
+      superHidden: Uint8Array.from(superHidden)
+    };
+    post(message, [message.ids.buffer, message.hidden.buffer, message.size.buffer,
+                   message.superIds.buffer, message.superHidden.buffer]);
+  }
+
+  function normalizeQuery(text) {
+    // Must match normalize_search_text() in graph_export.py
+    return text.toLowerCase().replace(/\\s+/g, " ").trim();
+  }
+
+  function prefixCandidates(query) {
+    const texts = searchIndex.text;
+    let lo = 0, hi = texts.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >>> 1;
+      if (texts[mid] < query) lo = mid + 1; else hi = mid;
+    }
+    const candidates = [];
+    for (let i = lo; i < texts.length && texts[i].startsWith(query) && candidates.length < 200; i++) {
+      candidates.push(i);
+    }
+    return candidates;
+  }
+
+  function trigramCandidates(query) {
+    // The rarest trigram bounds the candidate set; each candidate is then verified directly
+    let smallest = null;
+    for (let i = 0; i + 3 <= query.length; i++) {
+      const postings = searchIndex.trigrams[query.substring(i, i + 3)];
+      if (!postings) return [];
+      if (smallest === null || postings.length < smallest.length) smallest = postings;
+    }
+    return smallest.filter(entry => searchIndex.text[entry].includes(query));
+  }
+
+  function rankEntry(entry, query) {
+    const text = searchIndex.text[entry];
+    let score;
+    if (text === query) score = 0;
+    else if (text.startsWith(query)) score = 1;
+    else if (text.includes(" " + query)) score = 2;
+    else score = 3;
+    return [score, searchIndex.kind[entry], text.length];
+  }
+
+  function findMatches(rawQuery, limit) {
+    const query = normalizeQuery(rawQuery);
+    if (!query || !searchIndex) return [];
+    const candidates = query.length < 3 ? prefixCandidates(query) : trigramCandidates(query);
+
+    const ranked = candidates
+      .map(entry => ({ entry, rank: rankEntry(entry, query) }))
+      .sort((a, b) => a.rank[0] - b.rank[0] || a.rank[1] - b.rank[1] || a.rank[2] - b.rank[2]);
+
+    const seen = new Set();
+    const results = [];
+    for (const { entry } of ranked) {
+      const nodeId = searchIndex.node[entry];
+      if (seen.has(nodeId)) continue;
+      seen.add(nodeId);
+      results.push({ nodeId, text: searchIndex.text[entry], kind: searchIndex.kind[entry], query });
+      if (results.length >= limit) break;
+    }
+    return results;
+  }
+
+  // Commands arrive batched, at most one batch per animation frame of the page
+  const commands = {
+    clusterVisible(cmd) {
+      if (cmd.visible) state.visibleClusters.add(cmd.cluster); else state.visibleClusters.delete(cmd.cluster);
+      return true;
+    },
+    collapsed(cmd) {
+      state.collapsed = new Set(cmd.clusters);
+      return true;
+    },
+    expand(cmd) {
+      return state.collapsed.delete(cmd.cluster);
+    },
+    collapse(cmd) {
+      if (cmd.cluster < 0 || state.collapsed.has(cmd.cluster)) return false;
+      state.collapsed.add(cmd.cluster);
+      return true;
+    },
+    explore(cmd) {
+      exploreHops(cmd.node, cmd.hops);
+      return true;
+    },
+    exploreNodes(cmd) {
+      // Hop result computed elsewhere (the graph API): show exactly these nodes
+      const stamp = ++state.exploreStamp;
+      cmd.nodes.forEach(id => { visited[id] = stamp; });
+      state.exploring = true;
+      return true;
+    },
+    clearExplore() {
+      if (!state.exploring) return false;
+      state.exploring = false;
+      return true;
+    }
+  };
+
+  let ready = null;
+
+  function init(msg) {
+    const json = url => fetch(url).then(response => response.json());
+    const graphReady = json(msg.graph).then(payload => {
+      load(payload);
+      const type = Int8Array.from(state.type);
+      const lod = Int32Array.from(state.lod);
+      const ready = { type: "ready", labels: payload.labels, nodeType: type, lod: lod, clusters: state.clusters,
+                      lodMode: state.lodMode };
+      const transfer = [type.buffer, lod.buffer];
+      if (msg.render) {
+        // A renderer drawing from the payload itself (WebGL) gets it as typed arrays, so the page
+        // never parses the graph JSON on the main thread
+        ready.render = {
+          x: Float32Array.from(payload.x),
+          y: Float32Array.from(payload.y),
+          size: Float32Array.from(payload.size),
+          cluster: Int32Array.from(state.cluster),
+          edges: Int32Array.from(payload.edges)
+        };
+        Object.values(ready.render).forEach(array => transfer.push(array.buffer));
+      }
+      post(ready, transfer);
+    });
+    // With a graph API configured, search is answered by the API and the index is never fetched
+    const searchReady = msg.search ? json(msg.search).then(index => { searchIndex = index; }) : Promise.resolve();
+    ready = Promise.all([graphReady, searchReady]);
+    ready.then(() => post({ type: "searchReady" }));
+  }
+
+  return function handle(msg) {
+    if (msg.type === "init") {
+      init(msg);
+    } else if (msg.type === "batch") {
+      ready.then(() => {
+        let visibility = false;
+        msg.commands.forEach(cmd => { if (commands[cmd.type](cmd)) visibility = true; });
+        if (msg.sizeScale !== undefined) state.sizeScale = msg.sizeScale;
+        if (msg.sizeMetric !== undefined) {
+          state.sizeMetric = msg.sizeMetric;
+          metricSize = metricSizes(msg.sizeMetric);
+        }
+        diff(visibility, msg.sizeScale !== undefined || msg.sizeMetric !== undefined);
+      });
+    } else if (msg.type === "search") {
+      ready.then(() => post({ type: "searchResults", seq: msg.seq, results: findMatches(msg.query, msg.limit) }));
+    }
+  };
+}
+
+if (typeof WorkerGlobalScope !== "undefined" && self instanceof WorkerGlobalScope) {
+  const handle = createGraphEngine((msg, transfer) => self.postMessage(msg, transfer || []));
+  self.onmessage = event => handle(event.data);
+}
+"""
+
+
+def html_graph_state():
+    return """
+    <script type="text/javascript">
+    // Shared graph state. The graph data, search index and all visibility, hop and search work live
+    // in a Web Worker (graph_worker_script); panels send it commands through this object, and the
+    // node diffs it replies with are the only thing applied to vis on the main thread.
+    var graphState = (function () {
+      const state = {
+        ready: false,
+        n: 0,
+        labels: null,
+        type: null,             // Int8Array, 0 = Medication, 1 = Indication
+        lod: null,              // Int32Array, level-of-detail cluster, -1 when none
+        clusters: [],           // sorted cluster IDs
+        lodMode: false,
+        collapsed: new Set(),
+        render: null            // {x, y, size, cluster, edges} typed arrays, for the WebGL renderer
+      };
+
+      const readyCallbacks = [];
+      const listeners = [];
+      const pendingSearches = new Map();
+      let searchSeq = 0;
+      let searchReady = false;
+      const searchWaiting = [];
+      let commands = [];
+      let sizeScale;
+      let sizeMetric;
+      let frameRequested = false;
+      let worker = null;
+      // Optional graph API (graph_api.py): search and hop queries go to it instead of the worker
+      const api = graphDataPaths.api || null;
+      let idsByName = null;
+      let exploreSeq = 0;       // a reset or newer hop query drops older API replies
+
+      function superNodeId(cid) {
+        return `cluster-${cid}`;
+      }
+
+      function applyDiff(msg) {
+        const updates = [];
+        for (let k = 0; k < msg.ids.length; k++) {
+          const update = { id: msg.ids[k] };
+          if (msg.hidden[k] >= 0) update.hidden = msg.hidden[k] === 1;
+          if (!Number.isNaN(msg.size[k])) update.size = msg.size[k];
+          updates.push(update);
+        }
+        for (let k = 0; k < msg.superIds.length; k++) {
+          updates.push({ id: superNodeId(msg.superIds[k]), hidden: msg.superHidden[k] === 1 });
+        }
+        if (updates.length) {
+          // The WebGL renderer takes the same updates through updateNodes
+          if (typeof network.updateNodes === "function") network.updateNodes(updates);
+          else network.body.data.nodes.update(updates);
+        }
+        listeners.forEach(fn => fn(state, updates.length));
+      }
+
+      function onMessage(msg) {
+        if (msg.type === "diff") {
+          applyDiff(msg);
+        } else if (msg.type === "ready") {
+          state.n = msg.labels.length;
+          state.labels = msg.labels;
+          state.type = msg.nodeType;
+          state.lod = msg.lod;
+          state.clusters = msg.clusters;
+          state.lodMode = msg.lodMode;
+          state.render = msg.render || null;
+          if (state.lodMode) state.collapsed = new Set(state.clusters);
+          state.ready = true;
+          readyCallbacks.splice(0).forEach(fn => fn(state));
+        } else if (msg.type === "searchReady") {
+          searchReady = true;
+          searchWaiting.splice(0).forEach(fn => fn());
+        } else if (msg.type === "searchResults") {
+          const resolve = pendingSearches.get(msg.seq);
+          pendingSearches.delete(msg.seq);
+          if (resolve) resolve(msg.results);
+        }
+      }
+
+      function flush() {
+        frameRequested = false;
+        if (!commands.length && sizeScale === undefined && sizeMetric === undefined) return;
+        worker.postMessage({ type: "batch", commands: commands, sizeScale: sizeScale, sizeMetric: sizeMetric });
+        commands = [];
+        sizeScale = undefined;
+        sizeMetric = undefined;
+      }
+
+      function send(command) {
+        if (command) commands.push(command);
+        if (frameRequested) return;
+        frameRequested = true;
+        requestAnimationFrame(flush);
+      }
+
+      function whenReady() {
+        return new Promise(resolve => { if (state.ready) resolve(state); else readyCallbacks.push(resolve); });
+      }
+
+      function apiGet(endpoint, params) {
+        const url = new URL(endpoint, api.endsWith("/") ? api : api + "/");
+        Object.entries(params).forEach(([key, value]) => url.searchParams.set(key, value));
+        return fetch(url.href).then(response => response.ok
+          ? response.json() : Promise.reject(new Error(`${endpoint}: HTTP ${response.status}`)));
+      }
+
+      function nodeIdOf(name, type) {
+        // API results are node names; labels are unique per node type
+        if (!idsByName) {
+          idsByName = new Map();
+          for (let id = 0; id < state.n; id++) idsByName.set(state.type[id] + ":" + state.labels[id], id);
+        }
+        return idsByName.get((type === "Medication" ? 0 : 1) + ":" + name);
+      }
+
+      function apiSearch(query, limit) {
+        return Promise.all([apiGet("search", { q: query, limit: limit }), whenReady()])
+          .then(([body]) => body.results
+            .map(r => ({ nodeId: nodeIdOf(r.name, r.type), text: r.text, kind: r.kind, query: body.query }))
+            .filter(r => r.nodeId !== undefined))
+          .catch(err => {
+            console.warn("Graph API search failed", err);
+            return [];
+          });
+      }
+
+      function apiExploreHops(id, hops) {
+        const type = state.type[id] === 0 ? "Medication" : "Indication";
+        const seq = ++exploreSeq;
+        apiGet("khop", { node: state.labels[id], type: type, hops: hops })
+          .then(body => {
+            if (seq !== exploreSeq) return;
+            if (body.truncated) throw new Error("khop result truncated");
+            const nodes = body.results.map(r => nodeIdOf(r.name, r.type)).filter(n => n !== undefined);
+            send({ type: "exploreNodes", nodes: nodes });
+          })
+          .catch(err => {
+            if (seq !== exploreSeq) return;
+            // The worker holds the graph anyway, so fall back to its BFS
+            console.warn("Graph API hop query failed, exploring locally", err);
+            send({ type: "explore", node: id, hops: hops });
+          });
+      }
+
+      function startEngine() {
+        const resolve = path => new URL(path, document.baseURI).href;
+        const init = { type: "init", graph: resolve(graphDataPaths.graph),
+                       search: api ? null : resolve(graphDataPaths.search),
+                       render: typeof network.updateNodes === "function" };
+        try {
+          worker = new Worker(graphDataPaths.worker);
+          worker.onmessage = event => onMessage(event.data);
+          worker.postMessage(init);
+        } catch (err) {
+          // No worker support: run the same engine on the main thread, replying asynchronously
+          const script = document.createElement("script");
+          script.src = graphDataPaths.worker;
+          script.onload = function () {
+            const handle = createGraphEngine(msg => setTimeout(() => onMessage(msg), 0));
+            worker = { postMessage: msg => handle(msg) };
+            worker.postMessage(init);
+          };
+          document.head.appendChild(script);
+        }
+      }
+
+      window.addEventListener("load", function () {
+        if (typeof network === 'undefined') return;
+        startEngine();
+      });
+
+      return {
+        state: state,
+        onReady(fn) {
+          if (state.ready) fn(state); else readyCallbacks.push(fn);
+        },
+        subscribe(fn) {
+          listeners.push(fn);
+        },
+        setClusterVisible(cid, visible) {
+          send({ type: "clusterVisible", cluster: cid, visible: visible });
+        },
+        isCollapsed(cid) {
+          return state.collapsed.has(cid);
+        },
+        setCollapsed(cids) {
+          state.collapsed = new Set(cids);
+          send({ type: "collapsed", clusters: [...cids] });
+        },
+        expand(cid) {
+          if (state.collapsed.delete(cid)) send({ type: "expand", cluster: cid });
+        },
+        collapse(cid) {
+          if (cid < 0 || state.collapsed.has(cid)) return;
+          state.collapsed.add(cid);
+          send({ type: "collapse", cluster: cid });
+        },
+        reveal(id) {
+          if (state.ready && typeof id === "number") this.expand(state.lod[id]);
+        },
+        exploreHops(id, hops) {
+          if (api && state.ready) apiExploreHops(id, hops); else send({ type: "explore", node: id, hops: hops });
+        },
+        clearExplore() {
+          exploreSeq++;
+          send({ type: "clearExplore" });
+        },
+        setSizeScale(scale) {
+          sizeScale = scale;
+          send(null);
+        },
+        setSizeMetric(metric) {
+          // "pagerank", "hits", "betweenness" or "degree" (graph_analytics.SIZE_METRICS)
+          sizeMetric = metric;
+          send(null);
+        },
+        search(query, limit) {
+          // Resolves with [{nodeId, text, kind, query}], best match first
+          if (api) return apiSearch(query, limit);
+          return new Promise(resolve => {
+            const run = () => {
+              const seq = ++searchSeq;
+              pendingSearches.set(seq, resolve);
+              worker.postMessage({ type: "search", seq: seq, query: query, limit: limit });
+            };
+            if (searchReady) run(); else searchWaiting.push(run);
+          });
+        }
+      };
+    })();
+    </script>
+    """
+
 
 def html_hop_explorer():
     return """
@@ -15,77 +636,33 @@ def html_hop_explorer():
     window.addEventListener("load", function () {
       if (typeof network === 'undefined') return;
 
-      const allNodes = network.body.data.nodes.get();
-      const allEdges = network.body.data.edges.get();
-
-      const nodeMap = new Map(allNodes.map(n => [n.id, n]));
-      const edgeMap = new Map();
-      allEdges.forEach(edge => {
-        if (!edgeMap.has(edge.from)) edgeMap.set(edge.from, []);
-        if (!edgeMap.has(edge.to)) edgeMap.set(edge.to, []);
-        edgeMap.get(edge.from).push(edge.to);
-        edgeMap.get(edge.to).push(edge.from);  // undirected
-      });
-
-      const originalNodeStates = new Map(allNodes.map(n => [n.id, { hidden: n.hidden, color: n.color }]));
-
-      function resetGraph() {
-        const restoredNodes = allNodes.map(n => {
-          const orig = originalNodeStates.get(n.id);
-          return { id: n.id, hidden: orig.hidden, color: orig.color };
-        });
-        network.body.data.nodes.update(restoredNodes);
-      }
-
-      function bfsDiseaseHops(startId, maxHops) {
-        const visited = new Set();
-        const queue = [{ id: startId, depth: 0 }];
-        const result = new Set();
-
-        while (queue.length > 0) {
-          const { id, depth } = queue.shift();
-          if (visited.has(id)) continue;
-          visited.add(id);
-          result.add(id);
-
-          if (depth >= maxHops) continue;
-
-          const neighbors = edgeMap.get(id) || [];
-          for (const neighbor of neighbors) {
-            queue.push({ id: neighbor, depth: depth + 1 });
-          }
-        }
-
-        return result;
-      }
+      const INDICATION = 1;
 
       network.on("click", function (params) {
         const hopEnabled = document.getElementById("hopModeToggle").checked;
         const hopDepth = parseInt(document.getElementById("hopDepth").value, 10);
-        if (!hopEnabled || isNaN(hopDepth) || params.nodes.length === 0) return;
+        if (!graphState.state.ready || !hopEnabled || isNaN(hopDepth) || params.nodes.length === 0) return;
 
         const clickedNodeId = params.nodes[0];
-        const node = nodeMap.get(clickedNodeId);
-        if (!node || node.type !== "Indication") return;
-
-        const visibleIds = bfsDiseaseHops(clickedNodeId, hopDepth * 2); // each hop includes both node types
-
-        const updated = allNodes.map(n => ({
-          id: n.id,
-          hidden: !visibleIds.has(n.id)
-        }));
+        if (typeof clickedNodeId !== "number" || graphState.state.type[clickedNodeId] !== INDICATION) return;
 
-        network.body.data.nodes.update(updated);
+        // BFS runs in the graph worker; each hop includes both node types
+        graphState.exploreHops(clickedNodeId, hopDepth * 2);
       });
 
       document.getElementById("resetGraphBtn").addEventListener("click", () => {
-        resetGraph();
+        graphState.clearExplore();
       });
     });
     </script>
     """
 
-def html_node_size_panel():
+
+def html_node_size_panel(size_metric="pagerank"):
+    options = "".join(
+        f'<option value="{value}"{" selected" if value == size_metric else ""}>{label}</option>'
+        for value, label in NODE_SIZE_METRICS
+    )
     return """
     <div id="nodeSizePanel" style="
       position: fixed;
@@ -105,44 +682,29 @@ def html_node_size_panel():
       <label for="nodeSizeRange" style="white-space: nowrap; margin: 0;">Node size:</label>
       <input id="nodeSizeRange" type="range" min="0.1" max="2.0" step="0.1" value="1" style="flex-grow: 1;">
       <span id="nodeSizeValue" style="min-width: 30px; text-align: center;">1.0</span>
+      <select id="nodeSizeMetric" title="Size nodes by">__OPTIONS__</select>
 
     <script type="text/javascript">
     window.addEventListener("load", function () {
       if (typeof network === 'undefined') return;
 
-      // Precompute degree (number of edges) for each node
-      const edges = network.body.data.edges.get();
-      const degreeMap = new Map();
-      edges.forEach(edge => {
-        degreeMap.set(edge.from, (degreeMap.get(edge.from) || 0) + 1);
-        degreeMap.set(edge.to, (degreeMap.get(edge.to) || 0) + 1);
-      });
-
       const nodeSizeInput = document.getElementById("nodeSizeRange");
       const nodeSizeValue = document.getElementById("nodeSizeValue");
 
       nodeSizeInput.addEventListener("input", function() {
         const scale = parseFloat(this.value);
         nodeSizeValue.innerText = scale.toFixed(1);
+        // Sizes come from the build-time centrality scores; graph state applies them once per frame
+        graphState.setSizeScale(scale);
+      });
 
-        const nodes = network.body.data.nodes.get();
-        const baseSize = 15;  // base size for zero-degree nodes
-
-        const updatedNodes = nodes.map(node => {
-          const degree = degreeMap.get(node.id) || 0;
-          const size = (baseSize + Math.sqrt(degree)) * scale;  // size based on degree scaled by slider
-          return {
-            id: node.id,
-            size: size,
-          };
-        });
-
-        network.body.data.nodes.update(updatedNodes);
+      document.getElementById("nodeSizeMetric").addEventListener("change", function() {
+        graphState.setSizeMetric(this.value);
       });
     });
     </script>
     </div>
-    """
+    """.replace("__OPTIONS__", options)
 
 
 def html_cluster_legend():
@@ -156,69 +718,13 @@ def html_cluster_legend():
     window.addEventListener("load", function () {
       if (typeof network === 'undefined') return;
 
-      const clusterColors = [
-      "#e6194b", // red
-      "#ffe119", // yellow
-      "#4363d8", // blue
-      "#f58231", // orange
-      "#911eb4", // purple
-      "#46f0f0", // cyan
-      "#f032e6", // magenta
-      "#fabebe", // light pink
-      "#008080", // teal
-      "#e6beff", // lavender
-      "#9a6324", // brown
-      "#fffac8", // pale yellow
-      "#800000"  // maroon
-    ];
-
-
-      const allNodes = network.body.data.nodes.get();
+      const clusterColors = __CLUSTER_COLORS__;
       const clusterLegendContainer = document.getElementById("clusterLegend");
 
-      let visibleClusters = new Set();
-
-      function updateVisibilityAndColors() {
-        const nodeUpdates = [];
-
-        // Update medication nodes
-        allNodes.forEach(node => {
-          if (node.cluster_id !== undefined && node.cluster_id !== null) {
-            const isVisible = visibleClusters.has(node.cluster_id);
-            nodeUpdates.push({
-              id: node.id,
-              hidden: !isVisible,
-              color: isVisible ? clusterColors[node.cluster_id % clusterColors.length] : '#ddd'
-            });
-          } else {
-            // Non-clustered nodes visible by default
-            nodeUpdates.push({ id: node.id, hidden: false, color: node.color || '#ccc' });
-          }
-        });
-
-        network.body.data.nodes.update(nodeUpdates);
-
-        // Hide disease nodes with no visible meds
-        const diseaseUpdates = [];
-        allNodes.forEach(node => {
-          if (node.type === "Indication") {
-            const neighbors = network.getConnectedNodes(node.id);
-            const hasVisibleMed = neighbors.some(nid => {
-              const medNode = network.body.data.nodes.get(nid);
-              return medNode && !medNode.hidden && medNode.type === "Medication";
-            });
-            diseaseUpdates.push({ id: node.id, hidden: !hasVisibleMed });
-          }
-        });
-
-        network.body.data.nodes.update(diseaseUpdates);
-      }
-
-      function buildClusterLegend() {
+      function buildClusterLegend(state) {
         clusterLegendContainer.innerHTML = "";
-        const clusters = [...new Set(allNodes.map(n => n.cluster_id).filter(cid => cid !== undefined))].sort((a,b) => a - b);
 
-        clusters.forEach(cid => {
+        state.clusters.forEach(cid => {
           const color = clusterColors[cid % clusterColors.length];
 
           const label = document.createElement("label");
@@ -233,12 +739,7 @@ def html_cluster_legend():
           checkbox.dataset.clusterId = cid;
 
           checkbox.addEventListener("change", (e) => {
-            if (e.target.checked) {
-              visibleClusters.add(cid);
-            } else {
-              visibleClusters.delete(cid);
-            }
-            updateVisibilityAndColors();
+            graphState.setClusterVisible(cid, e.target.checked);
           });
 
           const colorBox = document.createElement("div");
@@ -255,21 +756,18 @@ def html_cluster_legend():
 
           clusterLegendContainer.appendChild(label);
         });
-
-        // Initially all clusters visible
-        visibleClusters = new Set(clusters);
-        updateVisibilityAndColors();
       }
 
-      buildClusterLegend();
+      graphState.onReady(buildClusterLegend);
     });
     </script>
-    """
+    """.replace("__CLUSTER_COLORS__", json.dumps(CLUSTER_COLORS))
+
 
 def html_search_bar():
     return """
     <div style="position:fixed; top:20px; left:10px; z-index:1000; background:white; padding:10px; border-radius:5px; max-width: 280px;">
-      <input type="text" id="nodeSearch" placeholder="Search for drug or disease" style="width:250px; padding:5px;" autocomplete="off"/>
+      <input type="text" id="nodeSearch" placeholder="Search drug, generic name, NDC or disease" style="width:250px; padding:5px;" autocomplete="off"/>
       <button onclick="searchNode()">Search</button>
       <div id="autocompleteList" style="position: absolute; background: white; border: 1px solid #d4d4d4; max-height: 150px; overflow-y: auto; width: 250px; display: none; z-index: 1001;"></div>
     </div>
@@ -280,63 +778,90 @@ def html_search_bar():
 
       const searchInput = document.getElementById("nodeSearch");
       const autocompleteList = document.getElementById("autocompleteList");
+      const MAX_RESULTS = 10;
+      const aliasNames = ["", "generic", "NDC"];
 
-      const allNodes = network.body.data.nodes.get();
-      const allNodeLabels = allNodes.map(n => n.label);
+      function highlight(text, query) {
+        const idx = text.toLowerCase().indexOf(query);
+        if (idx < 0) return text;
+        return `${text.substring(0, idx)}<strong>${text.substring(idx, idx + query.length)}</strong>${text.substring(idx + query.length)}`;
+      }
 
-      // Autocomplete behavior
-      searchInput.addEventListener("input", function () {
-        const val = this.value.trim().toLowerCase();
+      function hideAutocomplete() {
         autocompleteList.innerHTML = "";
-        if (!val) {
-          autocompleteList.style.display = "none";
-          return;
-        }
+        autocompleteList.style.display = "none";
+      }
+
+      let latestRequest = 0;
 
-        const matches = allNodeLabels.filter(label => label.toLowerCase().includes(val)).slice(0, 10);
+      function renderAutocomplete(matches) {
+        autocompleteList.innerHTML = "";
         if (matches.length === 0) {
           autocompleteList.style.display = "none";
           return;
         }
 
-        matches.forEach(match => {
+        matches.forEach(({ nodeId, text, kind, query }) => {
+          const node = { id: nodeId, label: graphState.state.labels[nodeId] };
           const item = document.createElement("div");
           item.style.padding = "6px";
           item.style.cursor = "pointer";
-          const idx = match.toLowerCase().indexOf(val);
-          item.innerHTML = `${match.substring(0, idx)}<strong>${match.substring(idx, idx + val.length)}</strong>${match.substring(idx + val.length)}`;
+          item.innerHTML = kind === 0
+            ? highlight(node.label, query)
+            : `${node.label} <span style="color:#666;">(${aliasNames[kind]}: ${highlight(text, query)})</span>`;
           item.addEventListener("click", () => {
-            searchInput.value = match;
-            autocompleteList.innerHTML = "";
-            autocompleteList.style.display = "none";
-            searchNode();
+            searchInput.value = node.label;
+            hideAutocomplete();
+            focusNode(node);
           });
           autocompleteList.appendChild(item);
         });
 
         autocompleteList.style.display = "block";
+      }
+
+      // Autocomplete behavior, debounced so fast typing only searches once it settles; matching
+      // runs in the graph worker and replies for anything but the latest request are dropped
+      let debounceTimer = null;
+      searchInput.addEventListener("input", function () {
+        clearTimeout(debounceTimer);
+        const request = ++latestRequest;
+        if (!searchInput.value.trim()) {
+          hideAutocomplete();
+          return;
+        }
+        debounceTimer = setTimeout(() => {
+          graphState.search(searchInput.value, MAX_RESULTS).then(matches => {
+            if (request === latestRequest) graphState.onReady(() => renderAutocomplete(matches));
+          });
+        }, 120);
       });
 
       // Hide autocomplete on click away
       document.addEventListener("click", (e) => {
-        if (e.target !== searchInput && e.target.parentNode !== autocompleteList) {
-          autocompleteList.innerHTML = "";
-          autocompleteList.style.display = "none";
+        if (e.target !== searchInput && !autocompleteList.contains(e.target)) {
+          hideAutocomplete();
         }
       });
 
+      function focusNode(node) {
+        graphState.reveal(node.id);
+        network.selectNodes([node.id]);
+        network.focus(node.id, { scale: 1.5, animation: true });
+      }
+
       // Search node function
       window.searchNode = function () {
-        const input = searchInput.value.toLowerCase();
-        if (!input) return;
-        const matches = allNodes.filter(n => n.label.toLowerCase().includes(input));
-        if (matches.length === 0) {
-          alert("No match found.");
-          return;
-        }
-        const nodeId = matches[0].id;
-        network.selectNodes([nodeId]);
-        network.focus(nodeId, { scale: 1.5, animation: true });
+        if (!searchInput.value.trim()) return;
+        const request = ++latestRequest;
+        graphState.search(searchInput.value, 1).then(matches => {
+          if (matches.length === 0) {
+            alert("No match found.");
+            return;
+          }
+          if (request === latestRequest) hideAutocomplete();
+          graphState.onReady(() => focusNode({ id: matches[0].nodeId }));
+        });
       };
     });
     </script>
@@ -374,6 +899,22 @@ def html_info_panel():
           return;
         }
 
+        const detailShards = new Map();  // shard index -> Promise of {nodeId: html}
+
+        function loadNodeDetails(nodeId) {
+          const shardSize = graphDataPaths.detailShardSize;
+          const shard = Math.floor(nodeId / shardSize);
+          const url = graphDataPaths.detailShards[shard];
+          if (!url) return Promise.resolve(undefined);
+          if (!detailShards.has(shard)) {
+            const request = fetch(url)
+              .then(response => response.ok ? response.json() : {})
+              .catch(() => ({}));
+            detailShards.set(shard, request);
+          }
+          return detailShards.get(shard).then(entries => entries[String(nodeId)]);
+        }
+
         network.on("click", function (params) {
           if (params.nodes.length === 0) {
             document.getElementById("infoPanel").style.display = "none";
@@ -381,19 +922,66 @@ def html_info_panel():
           }
 
           const nodeId = params.nodes[0];
-          const node = network.body.data.nodes.get(nodeId);
-          if (!node || node.type !== "Medication") {
+          const state = graphState.state;
+          if (!state.ready || typeof nodeId !== "number" || state.type[nodeId] !== 0) {
             document.getElementById("infoPanel").style.display = "none";
             return;
           }
 
-          const title = typeof node.label === "string" ? node.label.replace(/^"|"$/g, "") : "Unnamed";
-          const detailsHTML = node.panel_info || "<em>No additional details available.</em>";
+          const title = state.labels[nodeId];
+          const panelDetails = document.getElementById("panelDetails");
 
           document.getElementById("panelTitle").innerText = title;
-          document.getElementById("panelDetails").innerHTML = detailsHTML;
+          panelDetails.innerHTML = "<em>Loading details...</em>";
+          panelDetails.dataset.nodeId = nodeId;
           document.getElementById("infoPanel").style.display = "block";
+
+          loadNodeDetails(nodeId).then(detailsHTML => {
+            // Ignore responses for a node that is no longer selected
+            if (panelDetails.dataset.nodeId !== String(nodeId)) return;
+            panelDetails.innerHTML = detailsHTML || "<em>No additional details available.</em>";
+          });
+        });
+      });
+    </script>
+    """
+
+
+def html_lod_panel():
+    return """
+    <div id="lodPanel" style="position:fixed; top:110px; left:10px; z-index:1000; background:white; padding:10px; border-radius:5px; font-size:12px; width:360px; box-shadow: 0 2px 6px rgba(0,0,0,0.2);">
+      <strong>Level of Detail</strong>
+      <span style="color:#666;">(click a cluster to expand, double-click a node to collapse)</span><br>
+      <button id="lodExpandAllBtn" style="margin-top:6px;">Expand all</button>
+      <button id="lodCollapseAllBtn" style="margin-top:6px; margin-left:6px;">Collapse all</button>
+    </div>
+
+    <script type="text/javascript">
+    window.addEventListener("load", function () {
+      if (typeof network === 'undefined') return;
+
+      graphState.onReady(state => {
+        if (!state.lodMode) {
+          document.getElementById("lodPanel").remove();
+          return;
+        }
+
+        network.on("click", function (params) {
+          if (params.nodes.length === 0) return;
+          const nodeId = params.nodes[0];
+          if (typeof nodeId === "string" && nodeId.startsWith("cluster-")) {
+            graphState.expand(parseInt(nodeId.substring("cluster-".length), 10));
+          }
         });
+
+        network.on("doubleClick", function (params) {
+          if (params.nodes.length === 0 || typeof params.nodes[0] !== "number") return;
+          graphState.collapse(state.lod[params.nodes[0]]);
+        });
+
+        document.getElementById("lodExpandAllBtn").addEventListener("click", () => graphState.setCollapsed([]));
+        document.getElementById("lodCollapseAllBtn").addEventListener("click", () => graphState.setCollapsed(state.clusters));
       });
+    });
     </script>
     """
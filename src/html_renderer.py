@@ -0,0 +1,128 @@
+import os
+import re
+
+from jinja2 import Environment, FileSystemLoader
+
+from codec import dumps_text
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib")
+# Page scripts of this project that are shipped as files rather than generated
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+VIS_DIR = "vis-9.1.2"
+# Page template of each graph renderer (graph_renderer in params.yaml)
+RENDERER_TEMPLATES = {"vis": "graph_page.html", "webgl": "graph_page_webgl.html"}
+SCRIPT_BLOCK = re.compile(r'<script type="text/javascript">(.*?)</script>', re.S)
+
+
+def _script_safe(text):
+    # Data is written inside a <script> block, so a label containing "</script>" must not close it
+    return text.replace("</", "<\\/")
+
+
+def iter_json_array(items, batch_size=2000):
+    """Serialize an iterable as one JSON array, yielded in batches so it never exists as one string."""
+    yield "["
+    batch = []
+    first = True
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield ("" if first else ",") + _script_safe(dumps_text(batch)[1:-1])
+            first = False
+            batch = []
+    if batch:
+        yield ("" if first else ",") + _script_safe(dumps_text(batch)[1:-1])
+    yield "]"
+
+
+def bundle_vis_library(bundler):
+    """Add vis-network from src/lib to the site as hashed assets; returns (css_path, js_path)."""
+    vis_dir = os.path.join(LIB_DIR, VIS_DIR)
+    css = bundler.add_file(f"assets/lib/{VIS_DIR}/vis-network.css", os.path.join(vis_dir, "vis-network.css"))
+    js = bundler.add_file(f"assets/lib/{VIS_DIR}/vis-network.min.js", os.path.join(vis_dir, "vis-network.min.js"))
+    return css, js
+
+
+def bundle_webgl_renderer(bundler):
+    """Add the WebGL graph renderer (src/static/webgl_graph.js) to the site as a hashed asset; returns its path."""
+    return bundler.add_file("assets/webgl_graph.js", os.path.join(STATIC_DIR, "webgl_graph.js"))
+
+
+def split_component_scripts(components):
+    """
+    Separate panel markup from panel scripts. The markup stays inline in the page; the scripts,
+    which only change when the code does, are concatenated (in page order) into one cacheable file.
+    """
+    markup = []
+    scripts = []
+    for component in components:
+        scripts.extend(m.strip() for m in SCRIPT_BLOCK.findall(component))
+        markup.append(SCRIPT_BLOCK.sub("", component))
+    return markup, "\n;\n".join(scripts) + "\n"
+
+
+def write_graph_data_script(f, nodes, edges, options):
+    f.write("var graphNodes = ")
+    for chunk in iter_json_array(nodes):
+        f.write(chunk)
+    f.write(";\nvar graphEdges = ")
+    for chunk in iter_json_array(edges):
+        f.write(chunk)
+    f.write(";\nvar graphOptions = ")
+    f.write(dumps_text(options))
+    f.write(";\n")
+
+
+def render_graph_page(output_path, nodes, edges, options, components, cluster_labels, graph_data_paths, bundler,
+                      title="Medication Indications", height="750px", width="100%", bgcolor="#1a1a1a",
+                      renderer="vis"):
+    """
+    Write the graph page and its hashed script assets. The vis node/edge arrays are streamed
+    into their own asset in a single pass; the page itself only holds markup and asset paths.
+
+    Args:
+        output_path (str): HTML file to write, inside `bundler.site_dir`.
+        nodes (iterable of dict): vis-network node objects; consumed lazily. For the WebGL renderer,
+            which draws the graph payload, only the level-of-detail super-nodes.
+        edges (iterable of dict): vis-network edge objects; consumed lazily (super-node edges for WebGL).
+        options (dict): vis-network options, or WebGLGraph options.
+        components (list of str): Panel markup and scripts, in page order.
+        cluster_labels (dict): {cluster_id: label} shown by the cluster legend.
+        graph_data_paths (dict): Locations of the external graph data, relative to the page.
+        bundler (AssetBundler): Receives the library, panel and graph data assets.
+        renderer (str): "vis" (vis-network canvas) or "webgl" (src/static/webgl_graph.js, for very large graphs).
+    """
+    if renderer not in RENDERER_TEMPLATES:
+        raise ValueError(f"Unknown graph renderer {renderer!r}; expected one of {sorted(RENDERER_TEMPLATES)}")
+    if renderer == "webgl":
+        library = {"webgl_js": bundle_webgl_renderer(bundler)}
+    else:
+        vis_css, vis_js = bundle_vis_library(bundler)
+        library = {"vis_css": vis_css, "vis_js": vis_js}
+    markup, panel_js = split_component_scripts(components)
+    panels_js = bundler.add_text("assets/panels.js", panel_js)
+    data_asset = f"assets/graph_{renderer}.js"
+    with bundler.stream_text(data_asset) as f:
+        write_graph_data_script(f, nodes, edges, options)
+    graph_data_js = bundler.manifest[data_asset]["path"]
+
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=False)
+    template = env.get_template(RENDERER_TEMPLATES[renderer])
+    stream = template.stream(
+        title=title,
+        height=height,
+        width=width,
+        bgcolor=bgcolor,
+        components=markup,
+        panels_js=panels_js,
+        graph_data_js=graph_data_js,
+        cluster_labels_json=_script_safe(dumps_text({str(k): v for k, v in cluster_labels.items()})),
+        graph_data_paths_json=_script_safe(dumps_text(graph_data_paths)),
+        **library,
+    )
+    stream.enable_buffering(64)
+    with open(output_path, "w", encoding="utf-8") as f:
+        stream.dump(f)
+    bundler.add_entry_page(output_path)
+    return output_path
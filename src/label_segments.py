@@ -0,0 +1,141 @@
+import re
+import hashlib
+from functools import lru_cache
+from collections import OrderedDict
+
+import metrics
+
+# Segment types: "heading" (section titles, list items without a sentence end), "indication"
+# (sentences stating what the drug is used for), "caution" (limitations, contraindications and
+# the sentences under such a heading) and "other" (dosing, supervision, trial design, ...)
+SEGMENT_TYPES = ("heading", "indication", "caution", "other")
+DEFAULT_MATCHED_TYPES = ("heading", "indication")
+
+# Numbered subsection headings ("1.2 Heart Failure") start a new segment and end a caution block
+SUBSECTION_RE = re.compile(r"(?:^|\s)(?=\d{1,2}\.\d{1,2}\s+[A-Z])")
+# Sentence ends: terminal punctuation followed by a capital, digit, bullet or parenthesis
+SENTENCE_END_RE = re.compile(r"(?<=[.!?;])\s+(?=[A-Z0-9(•●*-])|\s+(?=[•●]\s)")
+# Cross references such as "[see Warnings and Precautions (5.1)]" are dropped before classifying,
+# so the words in them do not mark an indication sentence as cautionary
+CROSS_REFERENCE_RE = re.compile(r"\s*(?:\[\s*see [^\]]*\]|\(\s*see [^)]*\))", re.IGNORECASE)
+ABBREVIATIONS = ("e.g.", "i.e.", "etc.", "vs.", "approx.", "dr.", "no.", "u.s.")
+
+CAUTION_HEADING_RE = re.compile(
+    r"^\W*(?:important\s+)?(?:limitations? of use|warnings|precautions|contraindications|"
+    r"use in specific populations)\b", re.IGNORECASE)
+CAUTION_PHRASE_RE = re.compile(
+    r"limitations? of use|warnings|precautions|not recommended|contraindicated|use in specific populations|"
+    r"not (?:been )?(?:indicated|established|approved|studied)|should not be used", re.IGNORECASE)
+INDICATION_CUE_RE = re.compile(
+    r"\b(?:indicat\w*|treat\w*|management|manage|prevent\w*|prophyla\w*|reduc\w*|relie\w*|control(?:s|ling)?|"
+    r"adjunct\w*|symptom\w*|used (?:for|in|to)|lower\w*)\b", re.IGNORECASE)
+POSITIVE_INDICATION_RE = re.compile(r"\b(?:is|are)\s+(?:also\s+)?indicated\b", re.IGNORECASE)
+
+
+def split_segments(text):
+    """
+    Split label text into subsections and sentences.
+
+    Returns:
+        list of (str, bool): (segment text, starts a numbered subsection) in text order.
+    """
+    segments = []
+    for i, subsection in enumerate(SUBSECTION_RE.split(text)):
+        subsection = subsection.strip()
+        if not subsection:
+            continue
+        pieces = []
+        for piece in SENTENCE_END_RE.split(subsection):
+            piece = piece.strip()
+            if not piece:
+                continue
+            # Re-join splits after abbreviations ("e.g. Type 2 diabetes")
+            if pieces and pieces[-1].lower().endswith(ABBREVIATIONS):
+                pieces[-1] = f"{pieces[-1]} {piece}"
+            else:
+                pieces.append(piece)
+        segments.extend((piece, i > 0 and j == 0) for j, piece in enumerate(pieces))
+    return segments
+
+
+@lru_cache(maxsize=65536)
+def _sentence_type(text):
+    """(type ignoring context, is a caution heading, states an indication) of one cleaned segment."""
+    if CAUTION_HEADING_RE.match(text):
+        return "caution", True, False
+    # "... not recommended in hepatic disease, but is indicated for hyperlipidemia." states an indication
+    if POSITIVE_INDICATION_RE.search(text):
+        return "indication", False, True
+    if CAUTION_PHRASE_RE.search(text):
+        return "caution", False, False
+    if INDICATION_CUE_RE.search(text):
+        return "indication", False, False
+    return ("other" if text.endswith((".", "!", "?", ";")) else "heading"), False, False
+
+
+def classify_segments(segments):
+    """
+    Type each segment. A caution heading ("Limitations of Use:") makes the sentences after it
+    cautionary until the next numbered subsection or positive indication statement. Items of a
+    ";"-separated list ("relieves: Headache; Muscular aches; Toothache") without a cue of their
+    own take the type of the item before them.
+
+    Returns:
+        list of (str, str): (segment type, segment text) with cross references removed.
+    """
+    typed = []
+    in_caution = False
+    for text, new_subsection in segments:
+        text = " ".join(CROSS_REFERENCE_RE.sub("", text).split())
+        if not text:
+            continue
+        # Boilerplate sentences repeat across labels, so their context-free type is cached
+        kind, caution_heading, positive = _sentence_type(text)
+        if new_subsection:
+            in_caution = False
+        elif kind in ("heading", "other") and typed and typed[-1][1].endswith(";"):
+            kind = typed[-1][0]
+        if caution_heading:
+            in_caution = True
+        elif in_caution and kind != "caution":
+            if positive:
+                in_caution = False
+            else:
+                kind = "caution"
+        typed.append((kind, text))
+    return typed
+
+
+class SegmentCache:
+    """
+    LRU cache of label segmentations keyed by the SHA-1 of the text. Labels are shared by all
+    NDCs of an SPL and boilerplate fields repeat across labels, so most texts are split only once.
+    """
+
+    def __init__(self, max_size=65536):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def segments(self, text):
+        """Typed segments of `text` as a tuple of (segment type, segment text)."""
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+            metrics.incr("segment_cache_hits")
+            return cached
+        metrics.incr("segment_cache_misses")
+        with metrics.timer("segment_label"):
+            cached = tuple(classify_segments(split_segments(text)))
+        self._entries[key] = cached
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return cached
+
+
+def matched_text(segments, types=DEFAULT_MATCHED_TYPES):
+    """Join the segments of the given types into the text handed to the matchers."""
+    return " ".join(text for kind, text in segments if kind in types)
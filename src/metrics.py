@@ -0,0 +1,165 @@
+import os
+import time
+import socket
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+from codec import dumps_text
+
+PROMETHEUS_PREFIX = "medinf"
+
+
+class Metrics:
+    """
+    In-process counters, gauges and timers. Timers keep count, sum, min and max of their
+    observations, which is enough for means and for Prometheus summaries without storing samples.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stats = self.timers.get(name)
+            if stats is None:
+                self.timers[name] = {"count": 1, "sum": seconds, "min": seconds, "max": seconds}
+            else:
+                stats["count"] += 1
+                stats["sum"] += seconds
+                stats["min"] = min(stats["min"], seconds)
+                stats["max"] = max(stats["max"], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self, stage=None):
+        with self._lock:
+            elapsed = time.time() - self.started
+            return {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "stage": stage,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "elapsed_s": round(elapsed, 3),
+                "counters": dict(self.counters),
+                # Per-second rates over the whole run, e.g. records per second
+                "rates": {name: round(value / elapsed, 3) for name, value in self.counters.items()} if elapsed > 0 else {},
+                "gauges": dict(self.gauges),
+                "timers": {name: {"count": s["count"], "sum_s": round(s["sum"], 6),
+                                  "mean_s": round(s["sum"] / s["count"], 6),
+                                  "min_s": round(s["min"], 6), "max_s": round(s["max"], 6)}
+                           for name, s in self.timers.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.gauges.clear()
+            self.timers.clear()
+
+
+# One registry per process; the pipeline scripts record into it through the functions below
+registry = Metrics()
+incr = registry.incr
+set_gauge = registry.set_gauge
+observe = registry.observe
+timer = registry.timer
+
+
+def _metric_name(name):
+    return f"{PROMETHEUS_PREFIX}_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text(snapshot):
+    """Render a snapshot in the Prometheus text exposition format (for the node_exporter textfile collector)."""
+    stage = snapshot.get("stage") or "pipeline"
+    label = f'{{stage="{stage}"}}'
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = _metric_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric}{label} {value}"]
+    for name, value in sorted(snapshot["gauges"].items()):
+        metric = _metric_name(name)
+        lines += [f"# TYPE {metric} gauge", f"{metric}{label} {value}"]
+    for name, stats in sorted(snapshot["timers"].items()):
+        metric = _metric_name(name) + "_seconds"
+        lines += [f"# TYPE {metric} summary",
+                  f"{metric}_count{label} {stats['count']}",
+                  f"{metric}_sum{label} {stats['sum_s']}",
+                  f"# TYPE {metric}_max gauge",
+                  f"{metric}_max{label} {stats['max_s']}"]
+    return "\n".join(lines) + "\n"
+
+
+def emit(config, stage):
+    """
+    Write the current metrics as configured in params.yaml: `metrics_format` is "jsonl" (one
+    line appended per call), "prometheus" (a `<stage>.prom` textfile rewritten per call) or
+    "none"; files go to `metrics_dir`.
+    """
+    fmt = config.get("metrics_format", "jsonl")
+    if fmt == "none":
+        return None
+    metrics_dir = config.get("metrics_dir", "../data/metrics")
+    os.makedirs(metrics_dir, exist_ok=True)
+    snapshot = registry.snapshot(stage)
+
+    if fmt == "prometheus":
+        path = os.path.join(metrics_dir, f"{stage}.prom")
+        # Written to a temp file and renamed, so the collector never reads a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(prometheus_text(snapshot))
+        os.replace(tmp_path, path)
+    else:
+        path = os.path.join(metrics_dir, "metrics.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(dumps_text(snapshot) + "\n")
+    return path
+
+
+@contextmanager
+def profiled(config, stage):
+    """
+    Opt-in cProfile for a stage, enabled by `profile: true` in params.yaml or the MEDINF_PROFILE=1
+    environment variable. Stats are dumped to `<profile_dir>/<stage>.prof` (open with pstats or
+    snakeviz), and the top functions by cumulative time are printed. Sampling profilers such as
+    py-spy need nothing from here: `py-spy record -o profile.svg -- python pipeline.py`.
+    """
+    enabled = config.get("profile", False) or os.environ.get("MEDINF_PROFILE") == "1"
+    if not enabled:
+        yield None
+        return
+
+    profile_dir = config.get("profile_dir", "../data/profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        path = os.path.join(profile_dir, f"{stage}.prof")
+        profiler.dump_stats(path)
+        print(f"Profile for {stage} saved to {path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from utils import load_yaml_config
+from codec import jsonl_files, remove_jsonl
+
+STATE_FILE = "../data/pipeline_state.json"
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class Stage:
+    """
+    One pipeline step. A stage reruns only when the fingerprint of its input files, its
+    params.yaml slice or its source modules changes, or when one of its outputs is missing or
+    was modified after it ran. A rerun after a code-only change resumes from the stage's
+    checkpoint; any other rerun (or --force) removes `clean` first and starts over.
+
+    Attributes:
+        name (str): Stage name, used on the command line and in the state file.
+        func (callable): Module-level function called as func(config_path).
+        inputs (list of str): Files the stage reads; a stage producing one of them runs first.
+        outputs (list of str): Files the stage writes.
+        params (list of str): params.yaml keys the stage depends on.
+        code (list of str): Source files (relative to src/) whose changes invalidate the stage.
+        clean (list of str): Checkpoints and append-mode outputs removed before a stage reruns
+            from scratch, so it starts over instead of resuming.
+    """
+    name: str
+    func: object
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    params: list = field(default_factory=list)
+    code: list = field(default_factory=list)
+    clean: list = field(default_factory=list)
+
+
+# Stage entry points import lazily, so e.g. the medspacy model only loads in the stage that needs it
+def run_ndc_stage(config_path):
+    from extract_drug_info import run_ndc_extraction
+    run_ndc_extraction(config_path)
+
+
+def run_label_stage(config_path):
+    from extract_drug_info import run_label_extraction
+    run_label_extraction(config_path)
+
+
+def run_disease_stage(config_path):
+    from extract_diseases_from_labels import main
+    main(config_path)
+
+
+def run_fused_stage(config_path):
+    from fused_extraction import run_fused_extraction
+    run_fused_extraction(config_path)
+
+
+def run_graphml_stage(config_path):
+    import metrics
+    from build_drug_graph import load_graph, cluster_drugs, write_graphml
+    config = load_yaml_config(config_path)
+    # The one place the graph is built and clustered; later stages read the GraphML back
+    with metrics.profiled(config, "graphml"):
+        graph = load_graph(config)
+        cluster_drugs(graph, config)
+        write_graphml(graph)
+    metrics.emit(config, "graphml")
+
+
+def run_site_stage(config_path):
+    import metrics
+    from build_drug_graph import read_graph, build_site
+    config = load_yaml_config(config_path)
+    with metrics.profiled(config, "site"):
+        build_site(read_graph(), config)
+    metrics.emit(config, "site")
+
+
+def run_history_stage(config_path):
+    import metrics
+    from graph_history import record_graph_history
+    config = load_yaml_config(config_path)
+    record_graph_history(config)
+    metrics.emit(config, "history")
+
+
+def run_index_stage(config_path):
+    from graph_index import build_graph_index
+    build_graph_index(load_yaml_config(config_path))
+
+
+def define_stages(config):
+    from build_drug_graph import extracted_mentions_path, graph_products_path, GRAPHML_PATH, SITE_DIR
+    from graph_index import RELATIONS
+
+    ndc_file = config["ndc_input_file"]
+    label_file = config["label_input_file"]
+    mentions_file = extracted_mentions_path(config)
+    graph_code = ["build_drug_graph.py", "utils.py", "codec.py", "graph_utils.py", "graph_layout.py"]
+    index_dir = config.get("graph_index_dir", "../data/graph_index")
+    history_dir = config.get("graph_history_dir", "../data/graph_history")
+    # Built and clustered once by the graphml stage; the stages after it read these back
+    graph_files = [GRAPHML_PATH, graph_products_path(GRAPHML_PATH)]
+
+    # Fetch stages fingerprint only the params that select the fetched records: batch sizes and the
+    # JSONL codec change how records are fetched and stored, not which, and a fetch stage started
+    # over fetches everything from openFDA again. For the same reason a code change (to a module
+    # shared with other stages, say) only resumes the stage; see run_pipeline
+
+    labels = Stage(
+        name="labels",
+        func=run_label_stage,
+        inputs=[ndc_file],
+        outputs=[label_file],
+        params=["essential_label_fields"],
+        code=["extract_drug_info.py"],
+        clean=[label_file, config["label_fetch_checkpoint_file"]],
+    )
+    diseases = Stage(
+        name="diseases",
+        func=run_disease_stage,
+        inputs=[ndc_file, label_file, config["disease_pattern_path"]],
+        outputs=[mentions_file],
+        params=["essential_label_fields", "fuzzy_threshold", "label_segment_types"],
+        code=["extract_diseases_from_labels.py", "label_segments.py", "utils.py", "codec.py"],
+        clean=[mentions_file, config["label_checkpoint_file"]],
+    )
+    extraction = [labels, diseases]
+    if config.get("fused_extraction", False):
+        # One stage running both steps concurrently (fused_extraction.py), each with its own checkpoint
+        extraction = [Stage(
+            name="labels_diseases",
+            func=run_fused_stage,
+            inputs=[ndc_file, config["disease_pattern_path"]],
+            outputs=labels.outputs + diseases.outputs,
+            params=sorted(set(labels.params + diseases.params)),
+            code=sorted(set(labels.code + diseases.code)) + ["fused_extraction.py"],
+            clean=labels.clean + diseases.clean,
+        )]
+
+    return [
+        Stage(
+            name="ndc",
+            func=run_ndc_stage,
+            outputs=[ndc_file],
+            params=["essential_ndc_fields", "allowed_product_types", "excluded_product_classes"],
+            code=["extract_drug_info.py"],
+            clean=[ndc_file, config["checkpoint_file"]],
+        ),
+        *extraction,
+        Stage(
+            name="graphml",
+            func=run_graphml_stage,
+            inputs=[mentions_file],
+            outputs=graph_files,
+            params=["cluster_projection", "similarity_cluster_k"],
+            code=graph_code + ["similarity.py"],
+        ),
+        # Never cleaned: each run appends a version to the history
+        Stage(
+            name="history",
+            func=run_history_stage,
+            inputs=graph_files,
+            outputs=[os.path.join(history_dir, "versions.jsonl")],
+            params=["graph_history_dir"],
+            code=["graph_history.py"] + graph_code,
+        ),
+        Stage(
+            name="index",
+            func=run_index_stage,
+            inputs=graph_files + [config["disease_pattern_path"]],
+            outputs=[os.path.join(index_dir, "tables.json")]
+                    + [os.path.join(index_dir, f"{relation}_{part}.npy")
+                       for relation in RELATIONS for part in ("indptr", "indices")],
+            params=["graph_index_dir"],
+            code=["graph_index.py"] + graph_code,
+        ),
+        Stage(
+            name="site",
+            func=run_site_stage,
+            inputs=graph_files,
+            outputs=[os.path.join(SITE_DIR, "meds_indications.html"), os.path.join(SITE_DIR, "asset-manifest.json")],
+            params=["graph_lod_mode", "graph_api_url", "similar_drugs_top_k", "node_size_metric", "betweenness_samples", "graph_renderer"],
+            code=graph_code + ["similarity.py", "graph_index.py", "graph_analytics.py", "graph_export.py", "html_components.py", "html_renderer.py", "site_assets.py",
+                               "templates/graph_page.html", "templates/graph_page_webgl.html",
+                               "static/webgl_graph.js"],
+        ),
+    ]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    # Chunked JSONL is stored as a compressed data file plus its index; both are hashed
+    files = jsonl_files(path)
+    if not files:
+        return None
+    digest = hashlib.sha256()
+    for file in files:
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _json_digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def stage_fingerprint(stage, config):
+    """
+    Hash of everything a stage's result depends on: input files, its params slice and its code.
+
+    Returns:
+        tuple: (fingerprint, {"inputs" | "params" | "code": hash of that part alone})
+    """
+    parts = {
+        "inputs": {path: file_digest(path) for path in stage.inputs},
+        "params": {key: config.get(key) for key in stage.params},
+        "code": {name: file_digest(os.path.join(SRC_DIR, name)) for name in stage.code},
+    }
+    return _json_digest(parts), {kind: _json_digest(value) for kind, value in parts.items()}
+
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def outputs_unchanged(record):
+    """Whether the stage's outputs are still the files it wrote."""
+    return all(file_digest(path) == digest for path, digest in record.get("outputs", {}).items())
+
+
+def is_up_to_date(stage, fingerprint, record):
+    if not record or record.get("fingerprint") != fingerprint:
+        return False
+    return outputs_unchanged(record)
+
+
+def code_changed_only(record, fingerprint, parts):
+    """
+    Whether only the stage's code changed since `record`, with its inputs, params and outputs as
+    they were. Such a stage resumes from its checkpoint rather than starting over: a change to a
+    shared module (utils.py, say) then costs no refetch from openFDA and no NER pass.
+    """
+    recorded = record.get("parts") or {}
+    return (record.get("fingerprint") != fingerprint
+            and all(kind in recorded and recorded[kind] == parts[kind] for kind in ("inputs", "params"))
+            and outputs_unchanged(record))
+
+
+def stage_dependencies(stages):
+    """{stage name: set of stage names producing one of its inputs}"""
+    producers = {}
+    for stage in stages:
+        for path in stage.outputs:
+            producers[os.path.normpath(path)] = stage.name
+    return {
+        stage.name: {producers[os.path.normpath(p)] for p in stage.inputs if os.path.normpath(p) in producers}
+        for stage in stages
+    }
+
+
+def _timed_call(func, config_path):
+    start = time.perf_counter()
+    func(config_path)
+    return time.perf_counter() - start
+
+
+def run_pipeline(config_path="../params.yaml", force=(), only=None, max_workers=None, dry_run=False,
+                 state_path=STATE_FILE):
+    """
+    Run the stages whose fingerprint changed, in dependency order. Independent stages run in
+    parallel worker processes.
+
+    Args:
+        config_path (str): params.yaml path.
+        force (iterable of str): Stage names to rerun regardless of their fingerprint.
+        only (iterable of str): Restrict the run to these stages (their dependencies are not added).
+        max_workers (int): Worker processes for independent stages.
+        dry_run (bool): Report what would run without running it.
+
+    Returns:
+        dict: {stage name: {"status": "ran" | "skipped" | "failed" | "blocked" | "pending", "seconds": float}}
+    """
+    config = load_yaml_config(config_path)
+    stages = [s for s in define_stages(config) if only is None or s.name in only]
+    by_name = {s.name: s for s in stages}
+    deps = stage_dependencies(stages)
+    state = load_state(state_path)
+    force = set(force)
+
+    report = {}
+    remaining = [s.name for s in stages]
+    running = {}
+
+    def settled(name):
+        return name in report and name not in running.values()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while remaining or running:
+            for name in list(remaining):
+                if not all(settled(dep) for dep in deps[name]):
+                    continue
+                remaining.remove(name)
+                stage = by_name[name]
+                if any(report[dep]["status"] in ("failed", "blocked") for dep in deps[name]):
+                    report[name] = {"status": "blocked", "seconds": 0.0}
+                    continue
+                if any(report[dep]["status"] == "pending" for dep in deps[name]):
+                    report[name] = {"status": "pending", "seconds": 0.0}
+                    continue
+
+                fingerprint, parts = stage_fingerprint(stage, config)
+                record = state.get(name)
+                if name not in force and is_up_to_date(stage, fingerprint, record):
+                    report[name] = {"status": "skipped", "seconds": 0.0}
+                    continue
+                if dry_run:
+                    report[name] = {"status": "pending", "seconds": 0.0}
+                    continue
+
+                # A stage without a record, or whose code alone changed, resumes from its checkpoint;
+                # any other rerun starts over
+                if record and (name in force or not code_changed_only(record, fingerprint, parts)):
+                    for path in stage.clean:
+                        remove_jsonl(path)
+                print(f"[pipeline] running {name}")
+                future = executor.submit(_timed_call, stage.func, config_path)
+                running[future] = name
+                report[name] = {"status": "running", "seconds": 0.0}
+
+            if not running:
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                stage = by_name[name]
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    print(f"[pipeline] {name} failed: {e}")
+                    report[name] = {"status": "failed", "seconds": 0.0}
+                    continue
+                report[name] = {"status": "ran", "seconds": round(seconds, 3)}
+                # Fingerprint after the run, against the inputs the stage actually saw
+                fingerprint, parts = stage_fingerprint(stage, config)
+                state[name] = {
+                    "fingerprint": fingerprint,
+                    "parts": parts,
+                    "outputs": {path: file_digest(path) for path in stage.outputs},
+                    "seconds": round(seconds, 3),
+                    "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                save_state(state, state_path)
+
+    return report
+
+
+def print_report(report):
+    width = max((len(name) for name in report), default=5)
+    print(f"{'stage'.ljust(width)}  {'status':<8}  seconds")
+    for name, result in report.items():
+        print(f"{name.ljust(width)}  {result['status']:<8}  {result['seconds']:.2f}")
+    print(f"{'total'.ljust(width)}  {'':<8}  {sum(r['seconds'] for r in report.values()):.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the medication-inference pipeline, skipping unchanged stages.")
+    parser.add_argument("config", nargs="?", default="../params.yaml")
+    parser.add_argument("--force", action="append", default=[], help="Rerun this stage even if unchanged")
+    parser.add_argument("--only", action="append", help="Run only this stage (repeatable)")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes for independent stages")
+    parser.add_argument("--dry-run", action="store_true", help="Show which stages would run")
+    args = parser.parse_args()
+
+    print_report(run_pipeline(args.config, force=args.force, only=args.only, max_workers=args.jobs,
+                              dry_run=args.dry_run))
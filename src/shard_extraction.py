@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import argparse
+import threading
+import multiprocessing
+
+from utils import load_yaml_config, ensure_output_dir
+from codec import JsonlWriter, iter_jsonl, iter_jsonl_lines, remove_jsonl, replace_jsonl, resolve_compression
+from pipeline import file_digest
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def shard_of(spl_id, num_shards):
+    """Stable shard of an SPL ID (the same on every machine, unlike hash())."""
+    digest = hashlib.sha1(str(spl_id or "").encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_paths(shard_dir, shard_id):
+    name = f"shard-{shard_id:05d}"
+    return {
+        "dir": os.path.join(shard_dir, name),
+        "lock": os.path.join(shard_dir, f"{name}.lock"),
+        "done": os.path.join(shard_dir, f"{name}.done"),
+    }
+
+
+def plan_shards(config, num_shards, shard_dir):
+    """
+    Split the NDC input (and the labels) into `num_shards` shards by hash of spl_id and write
+    `manifest.json`. Each shard directory gets its own ndc/label inputs; workers write their
+    output and checkpoint next to them. Labels of one SPL always land in the shard of its NDCs.
+
+    Returns:
+        dict: The manifest.
+    """
+    ndc_file = config["ndc_input_file"]
+    label_file = config["label_input_file"]
+    compression = resolve_compression(config.get("jsonl_compression"))
+    ensure_output_dir(shard_dir)
+
+    writers = {}
+    counts = [0] * num_shards
+    try:
+        for shard_id in range(num_shards):
+            paths = shard_paths(shard_dir, shard_id)
+            ensure_output_dir(paths["dir"])
+            for path in (paths["lock"], paths["done"]):
+                if os.path.exists(path):
+                    os.remove(path)
+            for name in ("label_extracted_with_diseases.jsonl", "checkpoint.json"):
+                remove_jsonl(os.path.join(paths["dir"], name))
+            writers[shard_id] = (
+                JsonlWriter(os.path.join(paths["dir"], "ndc.jsonl"), mode="wb", compression=compression),
+                JsonlWriter(os.path.join(paths["dir"], "labels.jsonl"), mode="wb", compression=compression))
+
+        for entry in iter_jsonl(ndc_file):
+            shard_id = shard_of(entry.get("spl_id"), num_shards)
+            writers[shard_id][0].write(entry)
+            counts[shard_id] += 1
+        for entry in iter_jsonl(label_file):
+            writers[shard_of(entry.get("spl_id"), num_shards)][1].write(entry)
+    finally:
+        for ndc_writer, label_writer in writers.values():
+            ndc_writer.close()
+            label_writer.close()
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "num_shards": num_shards,
+        # Inputs as planned: merging refuses shards planned from other inputs
+        "ndc_input_digest": file_digest(ndc_file),
+        "label_input_digest": file_digest(label_file),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        # Paths are relative to the shard directory, which may be mounted elsewhere on each worker
+        "shards": [{"id": shard_id, "dir": os.path.basename(shard_paths(shard_dir, shard_id)["dir"]),
+                    "entries": counts[shard_id]} for shard_id in range(num_shards)],
+    }
+    tmp_path = os.path.join(shard_dir, f"{MANIFEST_NAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(shard_dir, MANIFEST_NAME))
+    print(f"Planned {num_shards} shards in {shard_dir}: {min(counts)} to {max(counts)} NDC entries each")
+    return manifest
+
+
+def load_manifest(shard_dir):
+    with open(os.path.join(shard_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported shard manifest version {manifest.get('version')} in {shard_dir}")
+    return manifest
+
+
+class ShardLost(RuntimeError):
+    """Raised when another worker took over the lock of the shard being extracted."""
+
+
+def _read_lock(path):
+    """(owner JSON, mtime) of a lock file, or (None, None) when there is none."""
+    try:
+        with open(path, "r") as f:
+            owner = f.read()
+        return owner, os.path.getmtime(path)
+    except FileNotFoundError:
+        return None, None
+
+
+def _create_exclusive(path, content):
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    return True
+
+
+def claim_shard(shard_dir, shard_id, stale_after=600):
+    """
+    Claim a shard by creating its lock file exclusively (O_EXCL, atomic on local and NFS storage).
+    A lock not refreshed for `stale_after` seconds belongs to a dead worker: it is renamed away
+    and the shard is claimed anew. Workers racing for the same stale lock may rename each other's
+    fresh lock, so the renamed file is checked again and put back unless it is the stale one.
+
+    Returns:
+        str: The owner JSON written to the lock when this process now owns the shard, else None.
+    """
+    paths = shard_paths(shard_dir, shard_id)
+    if os.path.exists(paths["done"]):
+        return None
+    owner = json.dumps({"host": socket.gethostname(), "pid": os.getpid(), "claimed": time.time()})
+    if _create_exclusive(paths["lock"], owner):
+        return owner
+    stale_owner, mtime = _read_lock(paths["lock"])
+    if stale_owner is None:
+        return owner if _create_exclusive(paths["lock"], owner) else None
+    age = time.time() - mtime
+    if age < stale_after:
+        return None
+    stale_path = f"{paths['lock']}.stale-{socket.gethostname()}-{os.getpid()}"
+    try:
+        os.rename(paths["lock"], stale_path)
+    except FileNotFoundError:
+        return None
+    renamed_owner, renamed_mtime = _read_lock(stale_path)
+    if renamed_owner != stale_owner or time.time() - renamed_mtime < stale_after:
+        # Another worker replaced the stale lock first: this is its fresh lock, restore it.
+        # link() fails rather than overwrite a lock created in the meantime
+        try:
+            os.link(stale_path, paths["lock"])
+        except FileExistsError:
+            pass
+        os.remove(stale_path)
+        return None
+    os.remove(stale_path)
+    print(f"Taking over shard {shard_id}: its lock was not refreshed for {age:.0f}s")
+    return owner if _create_exclusive(paths["lock"], owner) else None
+
+
+def _heartbeat(lock_path, owner, interval, stop, lost):
+    # Refresh the lock's mtime so other workers do not consider the shard abandoned; a lock that
+    # is gone or names another owner means the shard was taken over, and the extraction stops
+    while not stop.wait(interval):
+        if _read_lock(lock_path)[0] != owner:
+            lost.set()
+            return
+        os.utime(lock_path)
+
+
+def _guarded(batches, lost, shard_id):
+    for batch in batches:
+        if lost.is_set():
+            raise ShardLost(f"Shard {shard_id} was taken over by another worker")
+        yield batch
+
+
+def extract_shard(config_path, shard_dir, shard_id, owner, stale_after=600):
+    """Run the disease extraction on one claimed shard, resuming from its checkpoint."""
+    from extract_diseases_from_labels import LabelExtractor
+
+    config = load_yaml_config(config_path)
+    paths = shard_paths(shard_dir, shard_id)
+    overrides = {
+        "ndc_input_file": os.path.join(paths["dir"], "ndc.jsonl"),
+        "label_input_file": os.path.join(paths["dir"], "labels.jsonl"),
+        "ndc_enrichment_file": config["ndc_input_file"],
+        "label_output_dir": paths["dir"],
+        "label_checkpoint_file": os.path.join(paths["dir"], "checkpoint.json"),
+    }
+    stop = threading.Event()
+    lost = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(paths["lock"], owner, stale_after / 4, stop, lost),
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        extractor = LabelExtractor(config_path, overrides)
+        # Checked between batches: a worker that lost its lock stops before writing another batch
+        extractor.run(_guarded(extractor.file_batches(extractor.offset), lost, shard_id))
+    finally:
+        stop.set()
+        heartbeat.join()
+    if lost.is_set() or _read_lock(paths["lock"])[0] != owner:
+        raise ShardLost(f"Shard {shard_id} was taken over by another worker")
+    with open(paths["done"], "w", encoding="utf-8") as f:
+        f.write(json.dumps({"host": socket.gethostname(), "pid": os.getpid(), "finished": time.time()}))
+    os.remove(paths["lock"])
+
+
+def run_worker(config_path, shard_dir, stale_after=600, max_shards=None):
+    """
+    Claim and extract shards until none is left unclaimed. Any number of workers, on any number
+    of machines sharing `shard_dir`, can run at once.
+
+    Returns:
+        list of int: IDs of the shards this worker extracted.
+    """
+    manifest = load_manifest(shard_dir)
+    finished = []
+    for shard in manifest["shards"]:
+        if max_shards is not None and len(finished) >= max_shards:
+            break
+        owner = claim_shard(shard_dir, shard["id"], stale_after)
+        if owner is None:
+            continue
+        print(f"[{socket.gethostname()}:{os.getpid()}] extracting shard {shard['id']} ({shard['entries']} entries)")
+        try:
+            extract_shard(config_path, shard_dir, shard["id"], owner, stale_after)
+        except ShardLost as e:
+            print(e)
+            continue
+        finished.append(shard["id"])
+    return finished
+
+
+def merge_shards(config, shard_dir, output_path=None):
+    """
+    Interleave the shard outputs back into NDC input order, producing the same
+    label_extracted_with_diseases.jsonl as a single-node run, record for record and byte for byte
+    once decompressed: the extractor writes exactly one line per NDC entry, so entry i of the input
+    is the next line of its shard's output. Compressed output is chunked differently than a
+    single-node run's, whose chunks are its batches.
+
+    Returns:
+        str: Path of the merged file.
+    """
+    from build_drug_graph import extracted_mentions_path
+
+    manifest = load_manifest(shard_dir)
+    if file_digest(config["ndc_input_file"]) != manifest["ndc_input_digest"] or \
+            file_digest(config["label_input_file"]) != manifest["label_input_digest"]:
+        raise ValueError(f"Inputs changed since the shards in {shard_dir} were planned; plan them again")
+    num_shards = manifest["num_shards"]
+    missing = [s["id"] for s in manifest["shards"] if not os.path.exists(shard_paths(shard_dir, s["id"])["done"])]
+    if missing:
+        raise ValueError(f"Shards not finished yet: {missing}")
+
+    output_path = output_path or extracted_mentions_path(config)
+    ensure_output_dir(os.path.dirname(output_path))
+    # Lines are copied as stored, without decoding and re-encoding the records
+    outputs = [iter_jsonl_lines(os.path.join(shard_dir, s["dir"], "label_extracted_with_diseases.jsonl"), workers=1)
+               for s in manifest["shards"]]
+    tmp_path = f"{output_path}.tmp"
+    written = 0
+    try:
+        with JsonlWriter(tmp_path, mode="wb", compression=resolve_compression(config.get("jsonl_compression"))) as out:
+            for entry in iter_jsonl(config["ndc_input_file"]):
+                shard_id = shard_of(entry.get("spl_id"), num_shards)
+                line = next(outputs[shard_id], None)
+                if line is None:
+                    raise ValueError(f"Shard {shard_id} output is shorter than its input")
+                out.write_line(line)
+                written += 1
+        for shard_id, lines in enumerate(outputs):
+            if next(lines, None) is not None:
+                raise ValueError(f"Shard {shard_id} output is longer than its input")
+    except Exception:
+        remove_jsonl(tmp_path)
+        raise
+    finally:
+        for lines in outputs:
+            lines.close()
+    replace_jsonl(tmp_path, output_path)
+    print(f"Merged {num_shards} shards ({written} records) into {output_path}")
+    return output_path
+
+
+def run_local(config_path, num_shards, workers, shard_dir):
+    """Plan, extract with `workers` local processes, and merge; the multi-machine flow on one box."""
+    config = load_yaml_config(config_path)
+    plan_shards(config, num_shards, shard_dir)
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=run_worker, args=(config_path, shard_dir)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [p.exitcode for p in processes if p.exitcode]
+    if failed:
+        raise RuntimeError(f"{len(failed)} worker processes failed")
+    return merge_shards(config, shard_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded disease extraction across processes or machines.")
+    parser.add_argument("command", choices=["plan", "work", "merge", "local"])
+    parser.add_argument("config", nargs="?", default="../params.yaml")
+    parser.add_argument("--shards", type=int, default=None, help="Number of shards to plan (plan, local)")
+    parser.add_argument("--shard-dir", default=None, help="Shared directory holding the manifest and shards")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Local worker processes (local)")
+    parser.add_argument("--stale-after", type=float, default=600,
+                        help="Seconds after which an unrefreshed shard lock is taken over (work)")
+    parser.add_argument("--max-shards", type=int, default=None, help="Stop after this many shards (work)")
+    args = parser.parse_args()
+
+    config = load_yaml_config(args.config)
+    shard_dir = args.shard_dir or config.get("shard_dir", "../data/shards")
+    num_shards = args.shards or config.get("num_shards", 16)
+    if args.command == "plan":
+        plan_shards(config, num_shards, shard_dir)
+    elif args.command == "work":
+        run_worker(args.config, shard_dir, args.stale_after, args.max_shards)
+    elif args.command == "merge":
+        merge_shards(config, shard_dir)
+    else:
+        run_local(args.config, num_shards, args.workers, shard_dir)
@@ -0,0 +1,136 @@
+import numpy as np
+import networkx as nx
+
+from graph_index import DrugGraphIndex
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def minhash_signatures(indptr, indices, num_perm=128, seed=42, block_size=4096):
+    """
+    MinHash signatures of CSR rows, one row per drug over its indication IDs. Each permutation is
+    the universal hash (a * x + b) mod p; rows are processed in blocks to bound memory.
+
+    Returns:
+        ndarray: (n_rows, num_perm) uint32; empty rows get p in every column.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+    b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+
+    n_rows = len(indptr) - 1
+    signatures = np.full((n_rows, num_perm), MERSENNE_PRIME, dtype=np.uint32)
+    lengths = np.diff(indptr)
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        rows = np.nonzero(lengths[start:stop])[0] + start
+        if len(rows) == 0:
+            continue
+        values = indices[indptr[start]:indptr[stop]].astype(np.int64)
+        hashed = (values[:, None] * a + b) % MERSENNE_PRIME
+        # reduceat takes the minimum over each non-empty row's slice of `values`
+        signatures[rows] = np.minimum.reduceat(hashed, indptr[rows] - indptr[start], axis=0)
+    return signatures
+
+
+class DrugSimilarity:
+    """
+    Approximate Jaccard nearest neighbours of drugs by their indication sets.
+
+    MinHash signatures are split into `bands` bands of `rows` values; drugs whose signatures agree
+    on a whole band share an LSH bucket and become candidates, which are then re-ranked by exact
+    Jaccard on the indication sets. With the default 64 bands of 2 rows a pair with Jaccard 0.2
+    is a candidate with probability ~0.93 and one with Jaccard 0.1 with ~0.47; fewer, wider bands
+    trade recall of weak neighbours for fewer candidates.
+    """
+
+    def __init__(self, index, num_perm=128, bands=64, seed=42, max_bucket=200):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.index = index
+        self.drugs = index.tables["drugs"]
+        self.indptr = index.arrays["drug_indications_indptr"]
+        self.indices = index.arrays["drug_indications_indices"]
+        self.rows = num_perm // bands
+
+        signatures = minhash_signatures(self.indptr, self.indices, num_perm, seed)
+        # One 64-bit key per (band, drug): the band's values combined with random odd multipliers
+        multipliers = np.random.default_rng(seed + 1).integers(1, 1 << 62, size=self.rows, dtype=np.uint64) | 1
+        banded = signatures.astype(np.uint64).reshape(len(self.drugs), bands, self.rows)
+        self.band_keys = (banded * multipliers).sum(axis=2).T                # (bands, n_drugs)
+        self.band_order = np.argsort(self.band_keys, axis=1, kind="stable")  # drugs grouped by key
+        sorted_keys = np.take_along_axis(self.band_keys, self.band_order, axis=1)
+        # Buckets larger than max_bucket (e.g. the thousands of drugs for hypertension alone) only
+        # contribute their first max_bucket members, keeping a query sub-linear.
+        # Bucket of drug d in band b: band_order[b, bucket_start[b, d]:bucket_stop[b, d]]
+        self.bucket_start = np.stack([np.searchsorted(sorted_keys[b], self.band_keys[b], side="left")
+                                      for b in range(bands)])
+        self.bucket_stop = np.minimum(
+            np.stack([np.searchsorted(sorted_keys[b], self.band_keys[b], side="right") for b in range(bands)]),
+            self.bucket_start + max_bucket)
+        # Empty rows would all collide on the same signature, so they are never candidates
+        self.has_indications = np.diff(self.indptr) > 0
+
+    @classmethod
+    def from_graph(cls, graph, **kwargs):
+        return cls(DrugGraphIndex.from_graph(graph), **kwargs)
+
+    def candidates(self, drug_id):
+        """IDs of drugs sharing at least one LSH bucket with `drug_id`."""
+        starts, stops = self.bucket_start[:, drug_id].tolist(), self.bucket_stop[:, drug_id].tolist()
+        order = self.band_order
+        candidates = np.unique(np.concatenate([order[b, lo:hi] for b, (lo, hi) in enumerate(zip(starts, stops))]))
+        return candidates[(candidates != drug_id) & self.has_indications[candidates]]
+
+    def jaccard(self, drug_id, others):
+        """Exact Jaccard similarity between the indication set of `drug_id` and each of `others`."""
+        if len(others) == 0:
+            return np.zeros(0)
+        own = self.indices[self.indptr[drug_id]:self.indptr[drug_id + 1]]
+        starts = self.indptr[others]
+        lengths = self.indptr[others + 1] - starts
+        # Gather all candidates' indication IDs in one take: position j of candidate c is starts[c] + j
+        owner = np.repeat(np.arange(len(others)), lengths)
+        offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        members = self.indices[starts[owner] + offsets]
+        shared = np.bincount(owner, weights=np.isin(members, own), minlength=len(others))
+        return shared / (len(own) + lengths - shared)
+
+    def top_k_ids(self, drug_id, k=10, min_jaccard=0.0):
+        """[(drug_id, jaccard), ...] of the k most similar drugs, best first, ties broken by ID."""
+        if not self.has_indications[drug_id]:
+            return []
+        candidates = self.candidates(drug_id)
+        scores = self.jaccard(drug_id, candidates)
+        keep = scores >= min_jaccard if min_jaccard > 0 else scores > 0
+        candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))[:k]
+        return [(int(candidates[i]), float(scores[i])) for i in order]
+
+    def top_k(self, drug, k=10, min_jaccard=0.0):
+        """[(drug name, jaccard), ...] of the k drugs whose indications are most similar to `drug`'s."""
+        drug_id = self.index.id_of("drugs", drug)
+        if drug_id is None:
+            return []
+        return [(self.drugs[i], score) for i, score in self.top_k_ids(drug_id, k, min_jaccard)]
+
+    def all_top_k(self, k=10, min_jaccard=0.0):
+        """{drug name: top_k(drug)} for every drug."""
+        return {
+            self.drugs[drug_id]: [(self.drugs[i], score) for i, score in self.top_k_ids(drug_id, k, min_jaccard)]
+            for drug_id in range(len(self.drugs))
+        }
+
+
+def similarity_graph(neighbours):
+    """
+    Weighted drug-drug graph from `all_top_k` output, an alternative to projecting the bipartite
+    graph (which links every pair of drugs sharing an indication, quadratic in popular indications).
+    Drugs without neighbours are kept as isolated nodes so every drug still gets a cluster.
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(neighbours)
+    for drug, similar in neighbours.items():
+        for other, score in similar:
+            graph.add_edge(drug, other, weight=score)
+    return graph
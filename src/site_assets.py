@@ -0,0 +1,147 @@
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+from codec import dumps
+
+try:
+    import brotli
+except ImportError:  # optional: .br siblings are skipped without it
+    brotli = None
+
+HASH_LENGTH = 10
+HASHED_NAME = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^.]+)(\.gz|\.br)?$" % HASH_LENGTH)
+
+
+def compress_siblings(path, chunk_size=1 << 20):
+    """Write precompressed .gz (and .br when brotli is installed) next to `path`, streaming it."""
+    # mtime=0 keeps the gzip bytes identical for identical input
+    with open(path, "rb") as src, open(path + ".gz", "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=9, mtime=0, filename="") as gz:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                gz.write(chunk)
+    if brotli is not None:
+        compressor = brotli.Compressor(quality=11)
+        with open(path, "rb") as src, open(path + ".br", "wb") as out:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                out.write(compressor.process(chunk))
+            out.write(compressor.finish())
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetBundler:
+    """
+    Writes site assets under content-hashed names (`graph.json` -> `graph.<hash>.json`) with
+    precompressed siblings, so unchanged files keep their URL and stay cached between builds.
+    """
+
+    def __init__(self, site_dir):
+        self.site_dir = site_dir
+        self.manifest = {}
+
+    def _hashed_path(self, logical_path, digest):
+        stem, ext = os.path.splitext(logical_path)
+        return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+    def _finalize(self, logical_path, source_path, move):
+        digest = file_sha256(source_path)
+        hashed_path = self._hashed_path(logical_path, digest)
+        full_path = os.path.join(self.site_dir, hashed_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        # Same hash means same bytes: an asset left by the previous build is reused as is
+        if os.path.exists(full_path):
+            if move:
+                os.remove(source_path)
+        elif move:
+            os.replace(source_path, full_path)
+        else:
+            shutil.copyfile(source_path, full_path)
+        if not os.path.exists(full_path + ".gz") or (brotli is not None and not os.path.exists(full_path + ".br")):
+            compress_siblings(full_path)
+
+        entry = {
+            "path": hashed_path,
+            "sha256": digest,
+            "size": os.path.getsize(full_path),
+            "gzip": os.path.getsize(full_path + ".gz"),
+        }
+        if brotli is not None:
+            entry["br"] = os.path.getsize(full_path + ".br")
+        self.manifest[logical_path] = entry
+        return hashed_path
+
+    def add_file(self, logical_path, source_path):
+        """Copy `source_path` in under its content-hashed name and return the site-relative path."""
+        return self._finalize(logical_path, source_path, move=False)
+
+    def add_bytes(self, logical_path, data):
+        with self._temp_file("wb") as (f, tmp_path):
+            f.write(data)
+        return self._finalize(logical_path, tmp_path, move=True)
+
+    def add_text(self, logical_path, text):
+        return self.add_bytes(logical_path, text.encode("utf-8"))
+
+    def add_json(self, logical_path, obj):
+        return self.add_bytes(logical_path, dumps(obj))
+
+    @contextmanager
+    def _temp_file(self, mode):
+        os.makedirs(self.site_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.site_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+                yield f, tmp_path
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def stream_text(self, logical_path):
+        """
+        Yield a text file handle for a large asset. It is written to a temporary file and hashed
+        once closed, so its contents never have to be held in memory.
+        """
+        with self._temp_file("w") as (f, tmp_path):
+            yield f
+        self._finalize(logical_path, tmp_path, move=True)
+
+    def add_entry_page(self, path):
+        """Precompress an unhashed entry page (its URL has to stay stable)."""
+        compress_siblings(path)
+
+    def prune(self):
+        """Delete hashed files from earlier builds in the directories this build wrote to."""
+        current = set()
+        for entry in self.manifest.values():
+            current.update({entry["path"], entry["path"] + ".gz", entry["path"] + ".br"})
+        directories = {os.path.dirname(entry["path"]) for entry in self.manifest.values()}
+
+        removed = 0
+        for directory in directories:
+            full_dir = os.path.join(self.site_dir, directory)
+            for name in os.listdir(full_dir):
+                rel = os.path.join(directory, name) if directory else name
+                if HASHED_NAME.match(name) and rel not in current:
+                    os.remove(os.path.join(full_dir, name))
+                    removed += 1
+        return removed
+
+    def write_manifest(self, name="asset-manifest.json"):
+        path = os.path.join(self.site_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(self.manifest.items())), f, indent=2)
+        return path
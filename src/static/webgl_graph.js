@@ -0,0 +1,737 @@
+/**
+ * WebGL renderer of the graph page (graph_renderer: webgl), written for this project.
+ * Minimal WebGL renderer for large node-link graphs with precomputed positions. Nodes are drawn
+ * as point sprites and edges as lines, one draw call each, and the canvas is only redrawn when
+ * the view or the data changes. Labels go on a 2D canvas overlay, largest nodes first.
+ *
+ * Implements the part of the vis-network Network API the graph page uses: on("click" |
+ * "doubleClick"), selectNodes, getSelectedNodes, focus, moveTo, fit and redraw, plus
+ * updateNodes([{id, hidden, size}]) in place of network.body.data.nodes.update.
+ */
+(function (global) {
+  "use strict";
+
+  const NODE_VERTEX = [
+    "attribute vec2 a_position;",
+    "attribute float a_size;",
+    "attribute vec4 a_color;",
+    "uniform vec2 u_center;",
+    "uniform float u_scale;",
+    "uniform vec2 u_viewport;",
+    "uniform float u_pixelRatio;",
+    "uniform float u_minRadius;",
+    "uniform float u_maxPointSize;",
+    "varying vec4 v_color;",
+    "varying float v_radius;",
+    "void main() {",
+    "  vec2 p = (a_position - u_center) * u_scale;",
+    "  gl_Position = vec4(2.0 * p.x / u_viewport.x, -2.0 * p.y / u_viewport.y, 0.0, 1.0);",
+    // Size 0 marks a hidden node; visible nodes never shrink below u_minRadius pixels
+    "  float radius = a_size > 0.0 ? max(a_size * u_scale, u_minRadius) * u_pixelRatio : 0.0;",
+    "  gl_PointSize = min(2.0 * radius, u_maxPointSize);",
+    "  if (a_size <= 0.0) gl_Position = vec4(2.0, 2.0, 2.0, 1.0);",
+    "  v_color = a_color;",
+    "  v_radius = gl_PointSize * 0.5;",
+    "}"
+  ].join("\n");
+
+  const NODE_FRAGMENT = [
+    "precision mediump float;",
+    "varying vec4 v_color;",
+    "varying float v_radius;",
+    "void main() {",
+    "  float d = length(gl_PointCoord * 2.0 - 1.0);",
+    "  if (d > 1.0) discard;",
+    // One pixel of antialiasing at the rim
+    "  float rim = 1.0 - smoothstep(1.0 - 1.0 / max(v_radius, 1.0), 1.0, d);",
+    "  gl_FragColor = vec4(v_color.rgb, v_color.a * rim);",
+    "}"
+  ].join("\n");
+
+  const EDGE_VERTEX = [
+    "attribute vec2 a_position;",
+    "attribute vec4 a_color;",
+    "uniform vec2 u_center;",
+    "uniform float u_scale;",
+    "uniform vec2 u_viewport;",
+    "varying vec4 v_color;",
+    "void main() {",
+    "  vec2 p = (a_position - u_center) * u_scale;",
+    "  gl_Position = vec4(2.0 * p.x / u_viewport.x, -2.0 * p.y / u_viewport.y, 0.0, 1.0);",
+    "  v_color = a_color;",
+    "}"
+  ].join("\n");
+
+  const EDGE_FRAGMENT = [
+    "precision mediump float;",
+    "varying vec4 v_color;",
+    "void main() {",
+    "  gl_FragColor = v_color;",
+    "}"
+  ].join("\n");
+
+  const DEFAULTS = {
+    background: "#1a1a1a",
+    edgeColor: "#79db60",
+    edgeOpacity: 0.25,
+    extraEdgeOpacity: 0.8,
+    selectionColor: "#ffffff",
+    labelColor: "#ffffff",
+    font: "12px arial",
+    labelMinRadius: 6,      // nodes smaller than this on screen (px) are not labelled
+    maxLabels: 300,
+    minRadius: 1.5,         // px, so zoomed-out nodes stay visible
+    pickRadius: 4,          // px, click tolerance around small nodes
+    minScale: 1e-4,
+    maxScale: 50,
+    animationMs: 500
+  };
+
+  function parseColor(color) {
+    let hex = String(color || "#ffffff").replace("#", "");
+    if (hex.length === 3) hex = hex.split("").map(c => c + c).join("");
+    const value = parseInt(hex.substring(0, 6), 16);
+    return [(value >> 16) & 255, (value >> 8) & 255, value & 255];
+  }
+
+  function compile(gl, type, source) {
+    const shader = gl.createShader(type);
+    gl.shaderSource(shader, source);
+    gl.compileShader(shader);
+    if (!gl.getShaderParameter(shader, gl.COMPILE_STATUS)) {
+      throw new Error("webgl-graph: shader failed to compile: " + gl.getShaderInfoLog(shader));
+    }
+    return shader;
+  }
+
+  function createProgram(gl, vertexSource, fragmentSource, attributes, uniforms) {
+    const program = gl.createProgram();
+    gl.attachShader(program, compile(gl, gl.VERTEX_SHADER, vertexSource));
+    gl.attachShader(program, compile(gl, gl.FRAGMENT_SHADER, fragmentSource));
+    gl.linkProgram(program);
+    if (!gl.getProgramParameter(program, gl.LINK_STATUS)) {
+      throw new Error("webgl-graph: program failed to link: " + gl.getProgramInfoLog(program));
+    }
+    const info = { program: program, attributes: {}, uniforms: {} };
+    attributes.forEach(name => { info.attributes[name] = gl.getAttribLocation(program, name); });
+    uniforms.forEach(name => { info.uniforms[name] = gl.getUniformLocation(program, name); });
+    return info;
+  }
+
+  function easeInOut(t) {
+    return t < 0.5 ? 2 * t * t : 1 - Math.pow(-2 * t + 2, 2) / 2;
+  }
+
+  class WebGLGraph {
+    /**
+     * @param {HTMLElement} container Element the canvases fill; should be positioned.
+     * @param {Object} options Overrides of DEFAULTS.
+     */
+    constructor(container, options) {
+      this.options = Object.assign({}, DEFAULTS, options || {});
+      this.container = container;
+      this.canvas = document.createElement("canvas");
+      this.labelCanvas = document.createElement("canvas");
+      [this.canvas, this.labelCanvas].forEach(canvas => {
+        Object.assign(canvas.style, { position: "absolute", left: "0", top: "0", width: "100%", height: "100%" });
+        container.appendChild(canvas);
+      });
+      this.labelCanvas.style.pointerEvents = "none";
+
+      const attributes = { antialias: true, alpha: false };
+      const gl = this.canvas.getContext("webgl", attributes) || this.canvas.getContext("experimental-webgl", attributes);
+      if (!gl) throw new Error("webgl-graph: WebGL is not available");
+      this.gl = gl;
+      this.ctx = this.labelCanvas.getContext("2d");
+      this.maxPointSize = gl.getParameter(gl.ALIASED_POINT_SIZE_RANGE)[1];
+      const uniforms = ["u_center", "u_scale", "u_viewport"];
+      this.nodeProgram = createProgram(gl, NODE_VERTEX, NODE_FRAGMENT, ["a_position", "a_size", "a_color"],
+                                       uniforms.concat(["u_pixelRatio", "u_minRadius", "u_maxPointSize"]));
+      this.edgeProgram = createProgram(gl, EDGE_VERTEX, EDGE_FRAGMENT, ["a_position", "a_color"], uniforms);
+      this.buffers = {};
+      ["nodePosition", "nodeSize", "nodeColor", "edgePosition", "edgeColor",
+       "haloPosition", "haloSize", "haloColor"].forEach(name => { this.buffers[name] = gl.createBuffer(); });
+      gl.enable(gl.BLEND);
+      gl.blendFunc(gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA);
+
+      this.background = parseColor(this.options.background);
+      this.camera = { x: 0, y: 0, scale: 1 };
+      this.width = 0;
+      this.height = 0;
+      this.pixelRatio = 1;
+      this.listeners = {};
+      this.selected = [];
+      this.count = 0;
+      this.graphCount = 0;
+      this.edgeCount = 0;
+      this.frameRequested = false;
+      this.animation = null;
+      this.labelOrder = null;
+      this._bindEvents();
+      this.redraw();
+    }
+
+    /**
+     * Replace the graph.
+     *
+     * @param {Object} data
+     *   x, y, size: Float32Array per node (world units; size is the radius, as in vis "dot" nodes)
+     *   colors: Uint8Array of RGBA per node
+     *   labels: Array of string
+     *   hidden: Uint8Array per node, optional
+     *   edges: Int32Array [src0, dst0, src1, dst1, ...] of node indices
+     *   extraNodes: [{id (string), label, color, size, x, y, hidden}], e.g. cluster super-nodes
+     *   extraEdges: [{from, to, color}] between extra nodes
+     */
+    setData(data) {
+      const n = data.x.length;
+      const extra = data.extraNodes || [];
+      const count = n + extra.length;
+      this.graphCount = n;
+      this.count = count;
+      this.x = new Float32Array(count);
+      this.y = new Float32Array(count);
+      this.size = new Float32Array(count);
+      this.hidden = new Uint8Array(count);
+      this.colors = new Uint8Array(count * 4);
+      this.x.set(data.x);
+      this.y.set(data.y);
+      this.size.set(data.size);
+      if (data.hidden) this.hidden.set(data.hidden);
+      this.colors.set(data.colors);
+      this.labels = Array.from(data.labels).concat(extra.map(node => node.label || ""));
+      this.extraIds = extra.map(node => node.id);
+      this.extraIndex = new Map(extra.map((node, k) => [node.id, n + k]));
+      extra.forEach((node, k) => {
+        const i = n + k;
+        this.x[i] = node.x;
+        this.y[i] = node.y;
+        this.size[i] = node.size;
+        this.hidden[i] = node.hidden ? 1 : 0;
+        this.colors.set(parseColor(node.color).concat([255]), i * 4);
+      });
+
+      // Extra edges are appended to the graph's, with endpoints resolved to indices
+      const extraEdges = (data.extraEdges || []).filter(e => this.extraIndex.has(e.from) && this.extraIndex.has(e.to));
+      const graphEdgeCount = data.edges.length / 2;
+      const m = graphEdgeCount + extraEdges.length;
+      this.edgeCount = m;
+      this.edgeEnds = new Int32Array(2 * m);
+      this.edgeEnds.set(data.edges);
+      this.edgeRGBA = new Uint8Array(4 * m);
+      const edgeColor = parseColor(this.options.edgeColor).concat([Math.round(255 * this.options.edgeOpacity)]);
+      for (let e = 0; e < graphEdgeCount; e++) this.edgeRGBA.set(edgeColor, 4 * e);
+      extraEdges.forEach((edge, k) => {
+        const e = graphEdgeCount + k;
+        this.edgeEnds[2 * e] = this.extraIndex.get(edge.from);
+        this.edgeEnds[2 * e + 1] = this.extraIndex.get(edge.to);
+        const color = parseColor(edge.color || this.options.edgeColor);
+        this.edgeRGBA.set(color.concat([Math.round(255 * this.options.extraEdgeOpacity)]), 4 * e);
+      });
+      this._buildIncidence();
+      this._buildGrid();
+
+      const gl = this.gl;
+      const positions = new Float32Array(2 * count);
+      for (let i = 0; i < count; i++) {
+        positions[2 * i] = this.x[i];
+        positions[2 * i + 1] = this.y[i];
+      }
+      gl.bindBuffer(gl.ARRAY_BUFFER, this.buffers.nodePosition);
+      gl.bufferData(gl.ARRAY_BUFFER, positions, gl.STATIC_DRAW);
+      gl.bindBuffer(gl.ARRAY_BUFFER, this.buffers.nodeColor);
+      gl.bufferData(gl.ARRAY_BUFFER, this.colors, gl.STATIC_DRAW);
+      this.drawSize = new Float32Array(count);
+      gl.bindBuffer(gl.ARRAY_BUFFER, this.buffers.nodeSize);
+      gl.bufferData(gl.ARRAY_BUFFER, this.drawSize, gl.DYNAMIC_DRAW);
+      this._uploadSizes();
+
+      const edgePositions = new Float32Array(4 * m);
+      for (let k = 0; k < 2 * m; k++) {
+        edgePositions[2 * k] = this.x[this.edgeEnds[k]];
+        edgePositions[2 * k + 1] = this.y[this.edgeEnds[k]];
+      }
+      gl.bindBuffer(gl.ARRAY_BUFFER, this.buffers.edgePosition);
+      gl.bufferData(gl.ARRAY_BUFFER, edgePositions, gl.STATIC_DRAW);
+      // Both vertices of an edge carry its color; the alpha is zeroed while an endpoint is hidden
+      this.edgeColors = new Uint8Array(8 * m);
+      gl.bindBuffer(gl.ARRAY_BUFFER, this.buffers.edgeColor);
+      gl.bufferData(gl.ARRAY_BUFFER, this.edgeColors, gl.DYNAMIC_DRAW);
+      for (let e = 0; e < m; e++) this._setEdgeColor(e);
+      this._uploadEdgeColors();
+
+      this.selected = [];
+      this.fit();
+    }
+
+    _buildIncidence() {
+      // CSR of the edges incident to each node, so a visibility change only touches its edges
+      const count = this.count, ends = this.edgeEnds;
+      const indptr = new Int32Array(count + 1);
+      for (let k = 0; k < ends.length; k++) indptr[ends[k] + 1]++;
+      for (let i = 0; i < count; i++) indptr[i + 1] += indptr[i];
+      const fill = indptr.slice(0, count);
+      const incident = new Int32Array(ends.length);
+      for (let k = 0; k < ends.length; k++) incident[fill[ends[k]]++] = k >> 1;
+      this.incidentPtr = indptr;
+      this.incident = incident;
+    }
+
+    _buildGrid() {
+      // Uniform grid over node positions, about one node per cell, for picking
+      const count = this.count;
+      let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+      for (let i = 0; i < count; i++) {
+        minX = Math.min(minX, this.x[i]); maxX = Math.max(maxX, this.x[i]);
+        minY = Math.min(minY, this.y[i]); maxY = Math.max(maxY, this.y[i]);
+      }
+      if (!count) { minX = minY = 0; maxX = maxY = 1; }
+      const side = Math.max(1, Math.ceil(Math.sqrt(count)));
+      const cell = Math.max((maxX - minX) / side, (maxY - minY) / side, 1e-6);
+      const cols = Math.floor((maxX - minX) / cell) + 1;
+      const rows = Math.floor((maxY - minY) / cell) + 1;
+      const cellOf = new Int32Array(count);
+      const start = new Int32Array(cols * rows + 1);
+      for (let i = 0; i < count; i++) {
+        const c = Math.floor((this.x[i] - minX) / cell) + cols * Math.floor((this.y[i] - minY) / cell);
+        cellOf[i] = c;
+        start[c + 1]++;
+      }
+      for (let c = 0; c < cols * rows; c++) start[c + 1] += start[c];
+      const fill = start.slice(0, cols * rows);
+      const items = new Int32Array(count);
+      for (let i = 0; i < count; i++) items[fill[cellOf[i]]++] = i;
+      this.grid = { minX, minY, cell, cols, rows, start, items };
+    }
+
+    _uploadSizes() {
+      let maxSize = 0;
+      for (let i = 0; i < this.count; i++) {
+        this.drawSize[i] = this.hidden[i] ? 0 : this.size[i];
+        if (this.size[i] > maxSize) maxSize = this.size[i];
+      }
+      this.maxSize = maxSize;
+      this.labelOrder = null;
+      const gl = this.gl;
+      gl.bindBuffer(gl.ARRAY_BUFFER, this.buffers.nodeSize);
+      gl.bufferSubData(gl.ARRAY_BUFFER, 0, this.drawSize);
+    }
+
+    _setEdgeColor(e) {
+      const a = this.edgeEnds[2 * e], b = this.edgeEnds[2 * e + 1];
+      const visible = !this.hidden[a] && !this.hidden[b];
+      for (let v = 0; v < 2; v++) {
+        const o = 8 * e + 4 * v;
+        this.edgeColors[o] = this.edgeRGBA[4 * e];
+        this.edgeColors[o + 1] = this.edgeRGBA[4 * e + 1];
+        this.edgeColors[o + 2] = this.edgeRGBA[4 * e + 2];
+        this.edgeColors[o + 3] = visible ? this.edgeRGBA[4 * e + 3] : 0;
+      }
+    }
+
+    _uploadEdgeColors() {
+      const gl = this.gl;
+      gl.bindBuffer(gl.ARRAY_BUFFER, this.buffers.edgeColor);
+      gl.bufferSubData(gl.ARRAY_BUFFER, 0, this.edgeColors);
+    }
+
+    indexOf(id) {
+      if (typeof id === "number") return id >= 0 && id < this.graphCount ? id : undefined;
+      return this.extraIndex ? this.extraIndex.get(id) : undefined;
+    }
+
+    idOf(index) {
+      return index < this.graphCount ? index : this.extraIds[index - this.graphCount];
+    }
+
+    /** Apply [{id, hidden, size}] updates, as vis DataSet.update would for these two fields. */
+    updateNodes(updates) {
+      if (!this.count) return;
+      const changed = [];
+      updates.forEach(update => {
+        const i = this.indexOf(update.id);
+        if (i === undefined) return;
+        if (update.hidden !== undefined) {
+          const hidden = update.hidden ? 1 : 0;
+          if (hidden !== this.hidden[i]) {
+            this.hidden[i] = hidden;
+            changed.push(i);
+          }
+        }
+        if (update.size !== undefined) this.size[i] = update.size;
+      });
+      this._uploadSizes();
+      if (changed.length) {
+        changed.forEach(i => {
+          for (let k = this.incidentPtr[i]; k < this.incidentPtr[i + 1]; k++) this._setEdgeColor(this.incident[k]);
+        });
+        this._uploadEdgeColors();
+      }
+      this.redraw();
+    }
+
+    // --- vis-network compatible API ---
+
+    on(event, callback) {
+      (this.listeners[event] = this.listeners[event] || []).push(callback);
+    }
+
+    off(event, callback) {
+      this.listeners[event] = (this.listeners[event] || []).filter(fn => fn !== callback);
+    }
+
+    _emit(event, params) {
+      (this.listeners[event] || []).forEach(fn => fn.call(this, params));
+    }
+
+    selectNodes(ids) {
+      this.selected = ids.map(id => this.indexOf(id)).filter(i => i !== undefined);
+      this.redraw();
+    }
+
+    getSelectedNodes() {
+      return this.selected.map(i => this.idOf(i));
+    }
+
+    focus(id, options) {
+      const i = this.indexOf(id);
+      if (i === undefined) return;
+      options = options || {};
+      this.moveTo({ position: { x: this.x[i], y: this.y[i] }, scale: options.scale, animation: options.animation });
+    }
+
+    moveTo(options) {
+      const target = {
+        x: options.position ? options.position.x : this.camera.x,
+        y: options.position ? options.position.y : this.camera.y,
+        scale: this._clampScale(options.scale === undefined ? this.camera.scale : options.scale)
+      };
+      if (options.animation) {
+        const duration = typeof options.animation === "object" && options.animation.duration
+          ? options.animation.duration : this.options.animationMs;
+        this.animation = { from: Object.assign({}, this.camera), to: target, start: null, duration: duration };
+      } else {
+        this.animation = null;
+        this.camera = target;
+      }
+      this.redraw();
+    }
+
+    fit() {
+      this._resize();
+      let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+      for (let i = 0; i < this.count; i++) {
+        if (this.hidden[i]) continue;
+        const r = this.size[i];
+        minX = Math.min(minX, this.x[i] - r); maxX = Math.max(maxX, this.x[i] + r);
+        minY = Math.min(minY, this.y[i] - r); maxY = Math.max(maxY, this.y[i] + r);
+      }
+      if (minX > maxX) return;
+      const scale = 0.95 * Math.min(this.width / Math.max(maxX - minX, 1e-6), this.height / Math.max(maxY - minY, 1e-6));
+      this.animation = null;
+      this.camera = { x: (minX + maxX) / 2, y: (minY + maxY) / 2, scale: this._clampScale(scale) };
+      this.redraw();
+    }
+
+    redraw() {
+      if (this.frameRequested) return;
+      this.frameRequested = true;
+      requestAnimationFrame(time => this._render(time));
+    }
+
+    // --- view ---
+
+    _clampScale(scale) {
+      return Math.min(this.options.maxScale, Math.max(this.options.minScale, scale));
+    }
+
+    _resize() {
+      const ratio = global.devicePixelRatio || 1;
+      const width = this.container.clientWidth || 1, height = this.container.clientHeight || 1;
+      if (width === this.width && height === this.height && ratio === this.pixelRatio) return;
+      this.width = width;
+      this.height = height;
+      this.pixelRatio = ratio;
+      [this.canvas, this.labelCanvas].forEach(canvas => {
+        canvas.width = Math.round(width * ratio);
+        canvas.height = Math.round(height * ratio);
+      });
+    }
+
+    toWorld(sx, sy) {
+      return {
+        x: (sx - this.width / 2) / this.camera.scale + this.camera.x,
+        y: (sy - this.height / 2) / this.camera.scale + this.camera.y
+      };
+    }
+
+    toScreen(i) {
+      return {
+        x: (this.x[i] - this.camera.x) * this.camera.scale + this.width / 2,
+        y: (this.y[i] - this.camera.y) * this.camera.scale + this.height / 2
+      };
+    }
+
+    /** Index of the visible node under screen point (sx, sy), or -1. */
+    pick(sx, sy) {
+      if (!this.count) return -1;
+      const p = this.toWorld(sx, sy);
+      const tolerance = Math.max(this.options.minRadius, this.options.pickRadius) / this.camera.scale;
+      const reach = Math.max(this.maxSize, tolerance);
+      let best = -1, bestDistance = Infinity;
+      const test = i => {
+        if (this.hidden[i]) return;
+        const dx = this.x[i] - p.x, dy = this.y[i] - p.y;
+        const d = dx * dx + dy * dy;
+        const r = Math.max(this.size[i], tolerance);
+        if (d <= r * r && d < bestDistance) { best = i; bestDistance = d; }
+      };
+      const g = this.grid;
+      const span = Math.ceil(reach / g.cell);
+      if ((2 * span + 1) * (2 * span + 1) > this.count) {
+        for (let i = 0; i < this.count; i++) test(i);
+        return best;
+      }
+      const cx = Math.floor((p.x - g.minX) / g.cell), cy = Math.floor((p.y - g.minY) / g.cell);
+      for (let row = Math.max(0, cy - span); row <= Math.min(g.rows - 1, cy + span); row++) {
+        for (let col = Math.max(0, cx - span); col <= Math.min(g.cols - 1, cx + span); col++) {
+          const c = col + g.cols * row;
+          for (let k = g.start[c]; k < g.start[c + 1]; k++) test(g.items[k]);
+        }
+      }
+      return best;
+    }
+
+    _zoomAt(sx, sy, factor) {
+      const before = this.toWorld(sx, sy);
+      this.camera.scale = this._clampScale(this.camera.scale * factor);
+      const after = this.toWorld(sx, sy);
+      this.camera.x += before.x - after.x;
+      this.camera.y += before.y - after.y;
+      this.animation = null;
+      this.redraw();
+    }
+
+    _bindEvents() {
+      const canvas = this.canvas;
+      const pointers = new Map();
+      let down = null;        // {x, y, moved} of the primary pointer
+      let pinch = null;       // distance between two pointers
+
+      const local = event => {
+        const rect = canvas.getBoundingClientRect();
+        return { x: event.clientX - rect.left, y: event.clientY - rect.top };
+      };
+      const params = (point, index, event) => ({
+        nodes: index >= 0 ? [this.idOf(index)] : [],
+        edges: [],
+        event: event,
+        pointer: { DOM: point, canvas: this.toWorld(point.x, point.y) }
+      });
+
+      canvas.addEventListener("pointerdown", event => {
+        const point = local(event);
+        pointers.set(event.pointerId, point);
+        if (canvas.setPointerCapture) canvas.setPointerCapture(event.pointerId);
+        if (pointers.size === 1) down = { x: point.x, y: point.y, moved: false };
+        if (pointers.size === 2) {
+          const [a, b] = [...pointers.values()];
+          pinch = Math.hypot(a.x - b.x, a.y - b.y);
+          if (down) down.moved = true;
+        }
+      });
+
+      canvas.addEventListener("pointermove", event => {
+        const point = local(event);
+        const previous = pointers.get(event.pointerId);
+        if (!previous) {
+          canvas.style.cursor = this.pick(point.x, point.y) >= 0 ? "pointer" : "default";
+          return;
+        }
+        pointers.set(event.pointerId, point);
+        if (pointers.size === 2) {
+          const [a, b] = [...pointers.values()];
+          const distance = Math.hypot(a.x - b.x, a.y - b.y);
+          if (pinch) this._zoomAt((a.x + b.x) / 2, (a.y + b.y) / 2, distance / pinch);
+          pinch = distance;
+          return;
+        }
+        if (down && Math.hypot(point.x - down.x, point.y - down.y) > 4) down.moved = true;
+        this.camera.x -= (point.x - previous.x) / this.camera.scale;
+        this.camera.y -= (point.y - previous.y) / this.camera.scale;
+        this.animation = null;
+        this.redraw();
+      });
+
+      const release = event => {
+        if (!pointers.delete(event.pointerId)) return;
+        if (pointers.size < 2) pinch = null;
+        if (pointers.size || !down) return;
+        const clicked = !down.moved && event.type === "pointerup";
+        down = null;
+        if (!clicked) return;
+        const point = local(event);
+        const index = this.pick(point.x, point.y);
+        // Like vis, a click selects the node under the pointer, or clears the selection
+        this.selected = index >= 0 ? [index] : [];
+        this.redraw();
+        this._emit("click", params(point, index, event));
+      };
+      canvas.addEventListener("pointerup", release);
+      canvas.addEventListener("pointercancel", release);
+
+      canvas.addEventListener("dblclick", event => {
+        const point = local(event);
+        this._emit("doubleClick", params(point, this.pick(point.x, point.y), event));
+      });
+
+      canvas.addEventListener("wheel", event => {
+        event.preventDefault();
+        const point = local(event);
+        const delta = event.deltaMode === 1 ? event.deltaY * 16 : event.deltaY;
+        this._zoomAt(point.x, point.y, Math.exp(-delta * 0.0015));
+      }, { passive: false });
+
+      if (typeof ResizeObserver !== "undefined") {
+        new ResizeObserver(() => this.redraw()).observe(this.container);
+      } else {
+        global.addEventListener("resize", () => this.redraw());
+      }
+    }
+
+    // --- drawing ---
+
+    _render(time) {
+      this.frameRequested = false;
+      if (this.animation) {
+        const animation = this.animation;
+        if (animation.start === null) animation.start = time;
+        const t = Math.min(1, (time - animation.start) / animation.duration);
+        const k = easeInOut(t);
+        // Zoom is interpolated geometrically, so it feels uniform over large scale changes
+        this.camera = {
+          x: animation.from.x + (animation.to.x - animation.from.x) * k,
+          y: animation.from.y + (animation.to.y - animation.from.y) * k,
+          scale: animation.from.scale * Math.pow(animation.to.scale / animation.from.scale, k)
+        };
+        if (t < 1) this.redraw(); else this.animation = null;
+      }
+      this._resize();
+      const gl = this.gl;
+      gl.viewport(0, 0, this.canvas.width, this.canvas.height);
+      gl.clearColor(this.background[0] / 255, this.background[1] / 255, this.background[2] / 255, 1);
+      gl.clear(gl.COLOR_BUFFER_BIT);
+      if (this.count) {
+        if (this.edgeCount) this._drawEdges();
+        this._drawHalos();
+        this._drawNodes(this.buffers.nodePosition, this.buffers.nodeSize, this.buffers.nodeColor, this.count);
+      }
+      this._drawLabels();
+    }
+
+    _setView(program) {
+      const gl = this.gl;
+      gl.useProgram(program.program);
+      gl.uniform2f(program.uniforms.u_center, this.camera.x, this.camera.y);
+      gl.uniform1f(program.uniforms.u_scale, this.camera.scale);
+      gl.uniform2f(program.uniforms.u_viewport, this.width, this.height);
+    }
+
+    _attribute(location, buffer, size, type, normalized) {
+      const gl = this.gl;
+      gl.bindBuffer(gl.ARRAY_BUFFER, buffer);
+      gl.enableVertexAttribArray(location);
+      gl.vertexAttribPointer(location, size, type, normalized, 0, 0);
+    }
+
+    _drawEdges() {
+      const gl = this.gl, program = this.edgeProgram;
+      this._setView(program);
+      this._attribute(program.attributes.a_position, this.buffers.edgePosition, 2, gl.FLOAT, false);
+      this._attribute(program.attributes.a_color, this.buffers.edgeColor, 4, gl.UNSIGNED_BYTE, true);
+      gl.drawArrays(gl.LINES, 0, 2 * this.edgeCount);
+      gl.disableVertexAttribArray(program.attributes.a_position);
+      gl.disableVertexAttribArray(program.attributes.a_color);
+    }
+
+    _drawNodes(positionBuffer, sizeBuffer, colorBuffer, count) {
+      const gl = this.gl, program = this.nodeProgram;
+      this._setView(program);
+      gl.uniform1f(program.uniforms.u_pixelRatio, this.pixelRatio);
+      gl.uniform1f(program.uniforms.u_minRadius, this.options.minRadius);
+      gl.uniform1f(program.uniforms.u_maxPointSize, this.maxPointSize);
+      this._attribute(program.attributes.a_position, positionBuffer, 2, gl.FLOAT, false);
+      this._attribute(program.attributes.a_size, sizeBuffer, 1, gl.FLOAT, false);
+      this._attribute(program.attributes.a_color, colorBuffer, 4, gl.UNSIGNED_BYTE, true);
+      gl.drawArrays(gl.POINTS, 0, count);
+      ["a_position", "a_size", "a_color"].forEach(name => gl.disableVertexAttribArray(program.attributes[name]));
+    }
+
+    _drawHalos() {
+      // Selected nodes get a disc 3px wider underneath, drawn before the nodes
+      const selected = this.selected.filter(i => !this.hidden[i]);
+      if (!selected.length) return;
+      const gl = this.gl;
+      const color = parseColor(this.options.selectionColor).concat([255]);
+      const positions = new Float32Array(2 * selected.length);
+      const sizes = new Float32Array(selected.length);
+      const colors = new Uint8Array(4 * selected.length);
+      selected.forEach((i, k) => {
+        positions[2 * k] = this.x[i];
+        positions[2 * k + 1] = this.y[i];
+        sizes[k] = Math.max(this.size[i], this.options.minRadius / this.camera.scale) + 3 / this.camera.scale;
+        colors.set(color, 4 * k);
+      });
+      [[this.buffers.haloPosition, positions], [this.buffers.haloSize, sizes], [this.buffers.haloColor, colors]]
+        .forEach(([buffer, array]) => {
+          gl.bindBuffer(gl.ARRAY_BUFFER, buffer);
+          gl.bufferData(gl.ARRAY_BUFFER, array, gl.STREAM_DRAW);
+        });
+      this._drawNodes(this.buffers.haloPosition, this.buffers.haloSize, this.buffers.haloColor, selected.length);
+    }
+
+    _labelOrderBySize() {
+      if (!this.labelOrder) {
+        const order = new Int32Array(this.count);
+        for (let i = 0; i < this.count; i++) order[i] = i;
+        const size = this.size;
+        this.labelOrder = order.sort((a, b) => size[b] - size[a] || a - b);
+      }
+      return this.labelOrder;
+    }
+
+    _drawLabels() {
+      const ctx = this.ctx;
+      ctx.setTransform(this.pixelRatio, 0, 0, this.pixelRatio, 0, 0);
+      ctx.clearRect(0, 0, this.width, this.height);
+      if (!this.count) return;
+      ctx.font = this.options.font;
+      ctx.textAlign = "center";
+      ctx.textBaseline = "top";
+      ctx.lineWidth = 3;
+      ctx.strokeStyle = this.options.background;
+      ctx.fillStyle = this.options.labelColor;
+      const scale = this.camera.scale;
+      const draw = i => {
+        const p = this.toScreen(i);
+        const r = Math.max(this.size[i] * scale, this.options.minRadius);
+        if (p.x < -200 || p.x > this.width + 200 || p.y + r < -20 || p.y - r > this.height) return false;
+        ctx.strokeText(this.labels[i], p.x, p.y + r + 2);
+        ctx.fillText(this.labels[i], p.x, p.y + r + 2);
+        return true;
+      };
+      this.selected.forEach(i => { if (!this.hidden[i]) draw(i); });
+      // Largest first: the loop ends at the first node too small to label
+      const order = this._labelOrderBySize();
+      let drawn = 0;
+      for (let k = 0; k < order.length && drawn < this.options.maxLabels; k++) {
+        const i = order[k];
+        if (this.size[i] * scale < this.options.labelMinRadius) break;
+        if (!this.hidden[i] && this.selected.indexOf(i) < 0 && draw(i)) drawn++;
+      }
+    }
+  }
+
+  WebGLGraph.parseColor = parseColor;
+  global.WebGLGraph = WebGLGraph;
+})(typeof window !== "undefined" ? window : this);
@@ -1,9 +1,14 @@
 import os
+import sys
 import yaml
 import json
 import time
 import requests
 import re
+from functools import lru_cache
+
+import metrics
+from codec import iter_jsonl, JsonlWriter, mention_record_type
 
 
 def load_yaml_config(path):
@@ -30,13 +35,18 @@ def save_checkpoint(path, checkpoint_data):
 def rate_limited_request(session, url, params=None, max_retries=3):
     for _ in range(max_retries):
         try:
-            response = session.get(url, params=params)
+            with metrics.timer("http_request"):
+                response = session.get(url, params=params)
+            metrics.incr("http_requests")
             if response.status_code == 429:
+                metrics.incr("http_429")
                 time.sleep(1)
                 continue
             return response
         except requests.RequestException:
+            metrics.incr("http_errors")
             time.sleep(1)
+    metrics.incr("http_gave_up")
     return None
 
 
@@ -88,33 +98,42 @@ def safe_attr(val):
     return val
 
 
-def scale_size(degree, min_size=10, max_size=40):
-    return min(max(degree * 3, min_size), max_size)
-
-
 def truncate_string(s, l):
     s = str(s)
     return s if len(s) <= l else s[:l] + "..."
 
 
-def sanitize_title(text):
-    if not text:
-        return ""
-    return json.dumps(text)[1:-1]
+@lru_cache(maxsize=None)
+def _disease_category_patterns(path='../data/reference/diseases.json'):
+    # Read and compiled once per process instead of on every lookup
+    with open(path, 'r') as f:
+        disease_categories = json.load(f)
+    return [(category, re.compile(pattern, re.IGNORECASE))
+            for category, diseases in disease_categories.items()
+            for pattern in diseases.values()]
 
 
+@lru_cache(maxsize=65536)
 def find_disease_category(disease_name):
-    with open('../data/reference/diseases.json', 'r') as f:
-        disease_categories = json.load(f)
-
     disease_name_lower = disease_name.lower()
-    for category, diseases in disease_categories.items():
-        for disease, pattern in diseases.items():
-            if re.search(pattern, disease_name_lower, re.IGNORECASE):
-                return category
+    for category, pattern in _disease_category_patterns():
+        if pattern.search(disease_name_lower):
+            return category
     return "Other"
 
 
+def decode_attr_values(value):
+    """Inverse of safe_attr for multi-valued attributes: a list of the non-empty values."""
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return [value]
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v]
+    return [value] if value else []
+
+
 def group_diseases_by_category(disease_list):
     grouped = {}
     for disease in disease_list:
@@ -123,22 +142,151 @@ def group_diseases_by_category(disease_list):
     return grouped
 
 
-def load_extracted_mentions(file_path, extra_fields=None):
-    if extra_fields is None:
-        extra_fields = []
+class ProductTable:
+    """
+    Product (NDC record) attributes, stored once per product in columns of interned strings,
+    plus the products of each brand. Built while loading the mentions, so panels and the search
+    index read a brand's attributes directly instead of recovering them from the graph edges.
+    """
+    __slots__ = ("fields", "columns", "brand_products", "_linked")
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.columns = {field: [] for field in self.fields}   # field -> value per product ID
+        self.brand_products = {}                              # brand -> [product ID, ...]
+        self._linked = {}                                     # brand -> set of its product IDs
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]]) if self.fields else 0
+
+    def __contains__(self, brand):
+        return brand in self.brand_products
+
+    def add(self, entry):
+        """Append a product from a mentions record and return its ID."""
+        product_id = len(self)
+        for field in self.fields:
+            value = safe_attr(entry.get(field))
+            self.columns[field].append(sys.intern(value) if isinstance(value, str) else value)
+        return product_id
+
+    def link(self, brand, product_id):
+        """Add a product to the brand's products, once however often it is linked."""
+        linked = self._linked.get(brand)
+        if linked is None:
+            linked = self._linked[brand] = set(self.brand_products.setdefault(brand, []))
+        if product_id not in linked:
+            linked.add(product_id)
+            self.brand_products[brand].append(product_id)
+
+    def value(self, product_id, field):
+        return self.columns[field][product_id]
+
+    def brand_values(self, brand, field):
+        """Distinct values of `field` over the brand's products."""
+        column = self.columns[field]
+        return {column[i] for i in self.brand_products.get(brand, ())}
+
+    def brand_attributes(self, brand):
+        """{field: set of values} for a brand, in field order."""
+        return {field: self.brand_values(brand, field) for field in self.fields}
+
+    def save(self, path):
+        """Write the table as JSONL: a {"fields"} header, then one line per product and per brand."""
+        with JsonlWriter(path, mode="wb") as writer:
+            writer.write({"fields": self.fields})
+            for row in zip(*(self.columns[field] for field in self.fields)):
+                writer.write({"product": list(row)})
+            for brand, product_ids in self.brand_products.items():
+                writer.write({"brand": brand, "products": product_ids})
+
+    @classmethod
+    def load(cls, path):
+        table = None
+        for record in iter_jsonl(path):
+            if table is None:
+                table = cls(record["fields"])
+            elif "product" in record:
+                for field, value in zip(table.fields, record["product"]):
+                    table.columns[field].append(sys.intern(value) if isinstance(value, str) else value)
+            else:
+                # Tables saved before link deduplicated fully may list a product twice
+                table.brand_products[record["brand"]] = list(dict.fromkeys(record["products"]))
+        return table
+
+    @classmethod
+    def from_edges(cls, graph, fields):
+        """
+        Rebuild a table from per-edge attributes, for graphs without one (e.g. read back from
+        GraphML): one product per distinct combination of field values of a brand.
+        """
+        table = cls(fields)
+        seen = {}
+        for source, target, attrs in graph.edges(data=True):
+            if graph.nodes[source].get("type") == "Medication":
+                brand = source
+            elif graph.nodes[target].get("type") == "Medication":
+                brand = target
+            else:
+                continue
+            key = (brand,) + tuple(safe_attr(attrs.get(field)) for field in fields)
+            if key not in seen:
+                seen[key] = table.add(attrs)
+            table.link(brand, seen[key])
+        return table
+
 
-    pairs = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            entry = json.loads(line)
-            drug = entry.get('brand_name')
-            diseases = [m["disease"] for m in entry.get('disease_mentions', [])]
+def product_table(graph, fields):
+    """The graph's product table (build_graph_from_extracted), or one rebuilt from its edges."""
+    table = graph.graph.get("products")
+    return table if table is not None else ProductTable.from_edges(graph, fields)
 
-            if not drug or not diseases:
-                continue
 
-            extra_info = {field: entry.get(field) for field in extra_fields}
-            for disease in diseases:
-                pairs.append((drug, disease, extra_info))
+def group_extracted_mentions(file_path, extra_fields=None, start=0, workers=None):
+    """
+    Group the extracted mentions by (brand, disease) in one pass, instead of one pair per NDC.
+
+    Products (NDC records) are interned: each gets an integer ID, and its `extra_fields` are
+    stored once in a ProductTable rather than on every edge it supports. Records before `start`
+    are skipped; chunked files are read `workers` chunks at a time (see codec.iter_jsonl).
+    Records are decoded as codec.mention_record_type, which skips the keys not read here when
+    msgspec is installed.
+
+    Returns:
+        tuple: (products, edges) where products is a ProductTable, and edges is {(brand, disease):
+        {"evidence": int, "confidence": {method: max confidence}, "ndc_ids": [product ID, ...]}}
+        in first-seen order.
+    """
+    products = ProductTable(extra_fields or [])
+    product_ids = {}
+    edges = {}
+    record_type = mention_record_type(tuple(products.fields))
+    for line_number, entry in enumerate(iter_jsonl(file_path, start, workers, record_type), start):
+        drug = entry.get('brand_name')
+        mentions = entry.get('disease_mentions', [])
+        if not drug or not mentions:
+            continue
+
+        key = entry.get('product_ndc') or entry.get('spl_id') or f"record-{line_number}"
+        product_id = product_ids.get(key)
+        repeated = product_id is not None
+        if not repeated:
+            product_id = product_ids[key] = products.add(entry)
+        products.link(drug, product_id)
+
+        for mention in mentions:
+            edge = edges.get((drug, mention["disease"]))
+            if edge is None:
+                edge = edges[(drug, mention["disease"])] = {"evidence": 0, "confidence": {}, "ndc_ids": []}
+            # A product counts once per disease, however many methods or records mention it
+            ndc_ids = edge["ndc_ids"]
+            if not ndc_ids or (ndc_ids[-1] != product_id and not (repeated and product_id in ndc_ids)):
+                ndc_ids.append(product_id)
+                edge["evidence"] += 1
+            method = str(mention.get("method", "unknown")).lower()
+            confidence = mention.get("confidence") or 0.0
+            if confidence > edge["confidence"].get(method, -1.0):
+                edge["confidence"][method] = confidence
+
+    return products, edges
 
-    return pairs
\ No newline at end of file